@@ -1,21 +1,29 @@
 import os
-import subprocess
-import csv
-import re
+import time
 import logging
-import tempfile
-import threading
-from io import StringIO
+import json
 from datetime import datetime
-from urllib.parse import urlparse
 from dotenv import load_dotenv
 
-# Load environment variables from .env file
+# Load environment variables from .env file before the project modules read
+# their SCANNER_* settings at import time
 load_dotenv()
-from flask import Flask, render_template, request, jsonify, make_response, redirect, url_for, flash, send_file
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+from prober import HttpProber
+from liveness import DEFAULT_CONNECT_TIMEOUT
+from fingerprint import DEFAULT_BODY_LIMIT
+import metrics
+from jobs import ScanJobManager
+from scanner import SubdomainScanner
+from pagination import InvalidQuery, history_page, results_page, HISTORY_SORTS, RESULT_SORTS
+from export import ScanExport, FORMATS as EXPORT_FORMATS, gzip_chunks
+from recheck import Rechecker, ScanResultUpdater, inactive_subdomain_chunks, DEFAULT_RECHECK_MAX_HOSTS
+from scheduler import Scheduler, first_run_at, DEFAULT_SCHEDULER_ENABLED, MIN_INTERVAL_MINUTES
+from sqlalchemy import select
+from flask import Flask, render_template, request, jsonify, make_response, redirect, url_for, flash, send_file, session, stream_with_context
+
+# Configure logging; per-host debug lines are costly on large scans, so DEBUG is opt-in
+logging.basicConfig(level=os.environ.get("SCANNER_LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
 # Create Flask app
@@ -31,257 +39,75 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
 # Import database module and models
-from database import db
+from database import db, upgrade_schema
 import models
 
 # Initialize database with app
 db.init_app(app)
 
-# Create all tables
+# Create all tables and add columns introduced since they were created
 with app.app_context():
     db.create_all()
+    upgrade_schema()
 
 # Add current year to all templates
 @app.context_processor
 def inject_year():
     return {'current_year': datetime.now().year}
 
-class SubdomainScanner:
-    def __init__(self):
-        self.active_domains = []
-        self.inactive_domains = []
-        self.scan_results = []
-        self.domain = None
-        self.scan_completed = False
-        self.scan_in_progress = False
-        self.error_message = None
-    
-    def validate_domain(self, domain):
-        """Validate if the input is a proper domain name"""
-        # Simple domain validation regex
-        pattern = r'^([a-zA-Z0-9]([a-zA-Z0-9\-]{0,61}[a-zA-Z0-9])?\.)+[a-zA-Z]{2,}$'
-        return bool(re.match(pattern, domain))
-    
-    def scan_subdomains(self, domain):
-        """Scan subdomains using subfinder and dnsx tools or simulates it if not available"""
-        self.domain = domain
-        self.active_domains = []
-        self.inactive_domains = []
-        self.scan_results = []
-        self.error_message = None
-        self.scan_completed = False
-        self.scan_in_progress = True
-        
-        try:
-            # Check if subfinder is installed
-            has_subfinder = subprocess.run(["which", "subfinder"], stdout=subprocess.PIPE, stderr=subprocess.PIPE).returncode == 0
-            
-            if has_subfinder:
-                # Run subfinder command
-                logger.debug(f"Starting subdomain scan for {domain}")
-                process = subprocess.Popen(
-                    f"subfinder -silent -d {domain}",
-                    shell=True,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True
-                )
-                stdout, stderr = process.communicate()
-                
-                if process.returncode != 0 and not stdout:
-                    logger.error(f"Error executing the command: {stderr}")
-                    self.error_message = f"Error executing the subdomain enumeration: {stderr}"
-                    self.scan_in_progress = False
-                    return False
-                
-                # Process the output - split by lines and remove empty lines
-                subdomains = [line.strip() for line in stdout.split('\n') if line.strip()]
-            else:
-                # If tool is not available, use common subdomain prefixes
-                logger.warning("subfinder not installed. Using built-in subdomain list")
-                common_subdomains = ["www", "api", "mail", "blog", "shop", "store", "admin", "dev", "test", "app", "m"]
-                subdomains = [f"{prefix}.{domain}" for prefix in common_subdomains]
-                
-            logger.debug(f"Found {len(subdomains)} subdomains")
-            
-            # Check liveness of each subdomain
-            for subdomain in subdomains:
-                self._check_domain_liveness(subdomain)
-            
-            self.scan_completed = True
-            logger.info(f"Scan completed. Found {len(self.active_domains)} active and {len(self.inactive_domains)} inactive domains")
-            
-            # Save results to database
-            self._save_to_database()
-            
-            return True
-            
-        except Exception as e:
-            logger.exception("Error during subdomain scanning")
-            self.error_message = f"Error during scan: {str(e)}"
-            return False
-        finally:
-            self.scan_in_progress = False
-    
-    def _check_domain_liveness(self, domain):
-        """Check if a domain is active by making a curl request"""
-        try:
-            # Ensure domain has http/https prefix
-            if not domain.startswith(('http://', 'https://')):
-                domain_with_protocol = f"https://{domain}"
-            else:
-                domain_with_protocol = domain
-            
-            # Execute curl command with timeout and verbose output
-            # -I returns headers only
-            # -v provides verbose output that includes protocol details
-            # --max-time 3 limits request time to 3 seconds
-            # -k ignores SSL certificate errors
-            logger.debug(f"Checking liveness for {domain_with_protocol}")
-            process = subprocess.Popen(
-                f"curl -I -v --max-time 3 -k {domain_with_protocol}",
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            stdout, stderr = process.communicate()
-            
-            # Check if domain is active based on response
-            is_active = process.returncode == 0
-            
-            # Get the first line of the response instead of just the status code
-            # Look in both stdout and stderr because curl -v puts protocol info in stderr
-            response_info = "No response"
-            combined_output = stdout + stderr
-            
-            if is_active or "HTTP/" in combined_output:  # Domain might be active even if curl reports an error
-                # Check for HTTP status line with various patterns
-                # First try the standard HTTP response format
-                status_line_match = re.search(r'(HTTP/\d(?:\.\d)? \d{3}.*?)[\r\n]', combined_output)
-                if status_line_match:
-                    response_info = status_line_match.group(1).strip()
-                    is_active = True  # If we found a response line, consider it active
-                else:
-                    # Try alternate format sometimes seen in curl verbose output with < prefix
-                    status_line_match = re.search(r'< (HTTP/\d(?:\.\d)? \d{3}.*?)[\r\n]', combined_output)
-                    if status_line_match:
-                        response_info = status_line_match.group(1).strip()
-                        is_active = True  # If we found a response line, consider it active
-                    else:
-                        # Try a more flexible regex just looking for HTTP and status code
-                        status_line_match = re.search(r'HTTP/\d(?:\.\d)? (\d{3})', combined_output)
-                        if status_line_match:
-                            status_code = status_line_match.group(1)
-                            response_info = f"HTTP/2 {status_code}"
-                            is_active = True  # If we found a response line, consider it active
-                        else:
-                            # As a fallback, check if we have a 200 OK anywhere in the response
-                            if "200 OK" in combined_output:
-                                response_info = "HTTP/2 200 OK"
-                                is_active = True  # If we found a response line, consider it active
-            
-            # For debugging
-            if is_active and response_info == "No response":
-                logger.debug(f"Domain {domain} is marked active but no HTTP response was found")
-                logger.debug(f"Curl output: {combined_output[:200]}...")  # Log the first 200 chars
-            
-            # Store the result
-            result = {
-                'domain': domain,
-                'is_active': is_active,
-                'response_info': response_info,
-                'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                'response_headers': stdout if is_active else None
-            }
-            
-            self.scan_results.append(result)
-            
-            if is_active:
-                self.active_domains.append(result)
-            else:
-                self.inactive_domains.append(result)
-                
-            logger.debug(f"Domain {domain} is {'active' if is_active else 'inactive'}")
-            
-        except Exception as e:
-            logger.exception(f"Error checking liveness for {domain}")
-            # Consider the domain inactive if there's an error
-            result = {
-                'domain': domain,
-                'is_active': False,
-                'response_info': f"Error: {str(e)[:50]}...",
-                'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                'error': str(e)
-            }
-            self.scan_results.append(result)
-            self.inactive_domains.append(result)
-    
-    def _save_to_database(self):
-        """Save scan results to database"""
-        from models import ScanHistory, ScanResult
-        
-        try:
-            # Create scan history record
-            scan_history = ScanHistory(
-                domain=self.domain,
-                active_count=len(self.active_domains),
-                inactive_count=len(self.inactive_domains),
-                total_count=len(self.scan_results)
-            )
-            db.session.add(scan_history)
-            db.session.flush()  # Flush to get the ID
-            
-            # Create scan result records
-            for result in self.scan_results:
-                scan_result = ScanResult(
-                    scan_id=scan_history.id,
-                    subdomain=result['domain'],
-                    is_active=result['is_active'],
-                    response_info=result['response_info'],
-                    timestamp=datetime.strptime(result['timestamp'], "%Y-%m-%d %H:%M:%S")
-                )
-                db.session.add(scan_result)
-            
-            # Commit the transaction
-            db.session.commit()
-            logger.info(f"Saved scan results to database. Scan ID: {scan_history.id}")
-            
-        except Exception as e:
-            logger.exception("Error saving scan results to database")
-            db.session.rollback()
-    
-    def get_csv_data(self):
-        """Generate CSV data from scan results"""
-        if not self.scan_results:
-            return None
-        
-        output = StringIO()
-        csv_writer = csv.writer(output)
-        
-        # Write header
-        csv_writer.writerow(['Domain', 'Status', 'Response Info', 'Timestamp'])
-        
-        # Write data
-        for result in self.scan_results:
-            csv_writer.writerow([
-                result['domain'],
-                'Active' if result['is_active'] else 'Inactive',
-                result['response_info'] if result.get('response_info') else 'N/A',
-                result['timestamp']
-            ])
-        
-        return output.getvalue()
+def _new_scanner():
+    """Scanner for a scan job, saving to the application's database"""
+    return SubdomainScanner(session_factory=lambda: db.session)
+
+# Scans run as background jobs, each with its own scanner instance
+job_manager = ScanJobManager(app, _new_scanner)
+metrics.JOBS.set_function(job_manager.state_counts)
+
+# Recurring scans from the scan_schedules table, submitted to the same job manager
+scheduler = Scheduler(app, job_manager, lambda: db.session)
+
+def start_scheduler():
+    """Start running scheduled scans in this process, unless turned off with SCANNER_SCHEDULER=0
 
-# Create a scanner instance
-scanner = SubdomainScanner()
+    Called by the process that serves requests (see main.py) rather than on
+    import, so scripts importing the application and the debug reloader's
+    watching process don't start scans whose jobs no page can show.
+    """
+    if DEFAULT_SCHEDULER_ENABLED:
+        scheduler.start()
+
+# Shared prober for manual rechecks, with a longer timeout than scans
+recheck_prober = HttpProber(timeout=5, connect_timeout=DEFAULT_CONNECT_TIMEOUT, body_limit=DEFAULT_BODY_LIMIT)
+rechecker = Rechecker(recheck_prober)
+
+# Seconds between keepalive comments on an idle progress stream
+SSE_KEEPALIVE = 15
+# Seconds before a progress stream is ended and the browser reconnects, within
+# gunicorn's default 30 second worker timeout
+SSE_MAX_DURATION = 25
+# Milliseconds the browser waits before reconnecting
+SSE_RETRY = 500
+
+# Placeholder shown on the index page when there is no scan job yet
+idle_scanner = SubdomainScanner()
+
+def _get_job(job_id=None):
+    """Look up a scan job by ID, defaulting to the last job started from this session"""
+    return job_manager.get(job_id or request.args.get('job') or session.get('job_id'))
 
 @app.route('/')
 def index():
+    job = _get_job()
+    scanner = job.scanner if job else idle_scanner
+    # Rows rendered now; the live progress stream continues after them
+    results = list(scanner.scan_results)
     return render_template('index.html', 
+                           job=job,
                            scanner=scanner, 
-                           active_domains=scanner.active_domains,
-                           inactive_domains=scanner.inactive_domains)
+                           results=results,
+                           active_domains=[r for r in results if r['is_active']],
+                           inactive_domains=[r for r in results if not r['is_active']],
+                           fingerprint_bytes=DEFAULT_BODY_LIMIT)
 
 @app.route('/scan', methods=['POST'])
 def scan():
@@ -291,28 +117,35 @@ def scan():
         flash('Please enter a domain', 'danger')
         return redirect(url_for('index'))
     
-    if not scanner.validate_domain(domain):
+    if not SubdomainScanner.validate_domain(domain):
         flash('Please enter a valid domain name', 'danger')
         return redirect(url_for('index'))
     
-    # Start scanning in a new thread
-    success = scanner.scan_subdomains(domain)
+    # Queue the scan on the job pool and return immediately
+    force_refresh = request.form.get('force_refresh') == 'on'
+    mode = 'diff' if request.form.get('mode') == 'diff' else 'full'
+    job = job_manager.submit(domain, force_refresh=force_refresh, mode=mode)
+    session['job_id'] = job.id
     
-    if not success and scanner.error_message:
-        flash(scanner.error_message, 'danger')
-    
-    return redirect(url_for('index'))
+    return redirect(url_for('index', job=job.id))
 
 @app.route('/export')
-def export():
-    if not scanner.scan_completed or not scanner.scan_results:
+@app.route('/export/<job_id>')
+def export(job_id=None):
+    job = _get_job(job_id)
+    scanner = job.scanner if job else None
+    if not scanner or not scanner.scan_completed or not scanner.scan_results:
         flash('No scan results available to export', 'warning')
         return redirect(url_for('index'))
     
+    # Full scans saved to the database are streamed from there
+    if scanner.scan_mode == 'full' and scanner.results_saved:
+        return redirect(url_for('history_export', scan_id=scanner.scan_id, format='csv'))
+    
     csv_data = scanner.get_csv_data()
     if not csv_data:
         flash('Error generating CSV data', 'danger')
-        return redirect(url_for('index'))
+        return redirect(url_for('index', job=job.id))
     
     # Create a response with CSV data
     response = make_response(csv_data)
@@ -323,107 +156,136 @@ def export():
     return response
 
 @app.route('/status')
-def scan_status():
-    """API endpoint to get the current scan status"""
-    return jsonify({
-        'scan_in_progress': scanner.scan_in_progress,
-        'scan_completed': scanner.scan_completed,
-        'active_count': len(scanner.active_domains),
-        'inactive_count': len(scanner.inactive_domains),
-        'total_count': len(scanner.scan_results),
-        'error_message': scanner.error_message
-    })
+@app.route('/status/<job_id>')
+def scan_status(job_id=None):
+    """API endpoint to get the status of a scan job"""
+    job = _get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Unknown scan job'}), 404
+    return jsonify(job.to_dict())
+    
+@app.route('/metrics')
+def metrics_endpoint():
+    """Scanner metrics in the Prometheus text format"""
+    if not metrics.ENABLED:
+        return "Metrics are disabled\n", 404, {'Content-Type': 'text/plain'}
+    return metrics.REGISTRY.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+def _sse(event, data, event_id=None):
+    """Format one server-sent event"""
+    message = f"event: {event}\n"
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    return message + f"data: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+def _stream_result(result):
+    """Fields of a result dict sent to the page by the progress stream"""
+    return {
+        'domain': result['domain'],
+        'is_active': result['is_active'],
+        'response_info': result.get('response_info'),
+        'timestamp': result.get('timestamp'),
+        'cached': result.get('cached', False),
+    }
+
+@app.route('/events/<job_id>')
+def scan_events(job_id):
+    """Server-sent event stream of a scan job's results and progress
+
+    Every result is sent as a 'result' event whose ID is its position in the
+    scan, so a reconnecting browser resumes after the last result it got
+    (Last-Event-ID) and a page can skip the rows it rendered (?after=N).
+    'status' events carry the job counters and 'done' ends the stream.
+    A stream is closed after SSE_MAX_DURATION seconds with a 'reconnect'
+    event, so no request holds a server thread for the whole scan; the
+    browser's EventSource then reconnects and resumes.
+    """
+    job = _get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Unknown scan job'}), 404
+    try:
+        seen = int(request.headers.get('Last-Event-ID') or request.args.get('after') or 0)
+    except ValueError:
+        seen = 0
+    
+    def generate():
+        position = seen
+        closing_at = time.monotonic() + SSE_MAX_DURATION
+        yield f"retry: {SSE_RETRY}\n\n"
+        yield _sse('status', job.to_dict())
+        while True:
+            remaining = closing_at - time.monotonic()
+            if remaining <= 0:
+                yield _sse('reconnect', {'after': position})
+                return
+            # Read before waiting, so results recorded just before the end aren't missed
+            finished = job.finished
+            results = job.wait_for_results(position, min(SSE_KEEPALIVE, remaining))
+            if results:
+                for result in results:
+                    position += 1
+                    yield _sse('result', _stream_result(result), event_id=position)
+                yield _sse('status', job.to_dict())
+            elif finished:
+                yield _sse('done', job.to_dict())
+                return
+            elif not job.finished:
+                # Comment line, keeps proxies from closing an idle connection
+                yield ": keepalive\n\n"
     
+    response = app.response_class(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def _recheck_hosts(job, scan_id, chunks):
+    """Probe the hosts of chunks, lists of hosts, again concurrently and yield their fresh result dicts
+
+    The chunks are probed one after the other. Each result updates the job's
+    in-memory results through its domain index, the stored results of
+    scan_id if given, and the liveness cache.
+    """
+    scanner = job.scanner if job else idle_scanner
+    updater = ScanResultUpdater(db.session, scan_id) if scan_id else None
+    try:
+        for host, probe in (pair for hosts in chunks for pair in rechecker.probe_many(hosts)):
+            fresh = scanner.result_from_probe(host, probe)
+            known = scanner.apply_recheck(fresh) if job else None
+            fresh['ip_addresses'] = known.get('ip_addresses') if known else None
+            # Rechecks always probe, and refresh the cached result for the host
+            scanner.cache.put(host, fresh)
+            if updater is not None:
+                updater.add(fresh)
+            logger.debug(f"Recheck result for {host}: response_info={fresh['response_info']}, is_active={fresh['is_active']}")
+            yield fresh
+    finally:
+        scanner.refresh_status_lists()
+        if updater is not None:
+            updater.finish()
+
+def _recheck_response(result):
+    return {
+        'success': True,
+        'domain': result['domain'],
+        'is_active': result['is_active'],
+        'response_info': result['response_info'],
+    }
+
+def _saved_scan_id(job):
+    """ID of the stored full scan of a job, whose results rechecks also update"""
+    if job and job.scanner.scan_mode == 'full' and job.scanner.results_saved:
+        return job.scanner.scan_id
+    return None
+
 @app.route('/recheck/<path:domain>', methods=['POST'])
 def recheck_domain(domain):
     """API endpoint to recheck a specific domain for its response"""
     try:
-        # Ensure domain has http/https prefix
-        if not domain.startswith(('http://', 'https://')):
-            domain_with_protocol = f"https://{domain}"
-        else:
-            domain_with_protocol = domain
-        
-        # Execute curl command with timeout and verbose output
-        logger.debug(f"Re-checking domain: {domain_with_protocol}")
-        process = subprocess.Popen(
-            f"curl -I -v --max-time 5 -k {domain_with_protocol}",  # Increased timeout for recheck
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        stdout, stderr = process.communicate()
-        
-        # Get the response info
-        response_info = "No response"
-        combined_output = stdout + stderr
-        
-        # Check if we got a response (even if curl returned an error code)
-        is_active = process.returncode == 0 or "HTTP/" in combined_output
-        
-        # Check for HTTP status line with various patterns
-        # First try the standard HTTP response format
-        status_line_match = re.search(r'(HTTP/\d(?:\.\d)? \d{3}.*?)[\r\n]', combined_output)
-        if status_line_match:
-            response_info = status_line_match.group(1).strip()
-        else:
-            # Try alternate format sometimes seen in curl verbose output with < prefix
-            status_line_match = re.search(r'< (HTTP/\d(?:\.\d)? \d{3}.*?)[\r\n]', combined_output)
-            if status_line_match:
-                response_info = status_line_match.group(1).strip()
-            else:
-                # Try a more flexible regex just looking for HTTP and status code
-                status_line_match = re.search(r'HTTP/\d(?:\.\d)? (\d{3})', combined_output)
-                if status_line_match:
-                    status_code = status_line_match.group(1)
-                    response_info = f"HTTP/2 {status_code}"
-                else:
-                    # As a fallback, check if we have a 200 OK anywhere in the response
-                    if "200 OK" in combined_output:
-                        response_info = "HTTP/2 200 OK"
-        
-        # For debugging
-        logger.debug(f"Recheck result for {domain}: response_info={response_info}, is_active={is_active}")
-        if is_active and response_info == "No response":
-            logger.debug(f"Domain {domain} is marked active but no HTTP response was found")
-            logger.debug(f"Curl output: {combined_output[:500]}...")  # Log the first 500 chars
-        
-        # Update the domain in scan results if it exists
-        domain_updated = False
-        for result in scanner.scan_results:
-            if result['domain'] == domain:
-                result['response_info'] = response_info
-                # Update the is_active status if we received a response
-                if response_info != "No response":
-                    result['is_active'] = True
-                domain_updated = True
-                
-                # Also update in active/inactive domains lists
-                if result['is_active']:
-                    for active_result in scanner.active_domains:
-                        if active_result['domain'] == domain:
-                            active_result['response_info'] = response_info
-                            break
-                else:
-                    for inactive_result in scanner.inactive_domains:
-                        if inactive_result['domain'] == domain:
-                            inactive_result['response_info'] = response_info
-                            # If domain is now active, move it from inactive to active list
-                            if response_info != "No response":
-                                inactive_result['is_active'] = True
-                                scanner.active_domains.append(inactive_result)
-                                scanner.inactive_domains.remove(inactive_result)
-                            break
-                break
-        
-        # Always return success with the response, even if we couldn't update the domain in results
-        # This lets the user still see the fresh curl result
-        return jsonify({
-            'success': True, 
-            'domain': domain, 
-            'response_info': response_info
-        })
+        job = _get_job()
+        result, = _recheck_hosts(job, _saved_scan_id(job), [[domain]])
+        # Always return success with the response, even if the domain isn't part of the scan
+        # This lets the user still see the fresh probe result
+        return jsonify(_recheck_response(result))
             
     except Exception as e:
         logger.exception(f"Error rechecking domain {domain}")
@@ -432,36 +294,300 @@ def recheck_domain(domain):
             'error': str(e)
         }), 500
 
-@app.route('/history')
-def history():
-    """Show scan history from the database"""
+@app.route('/recheck', methods=['POST'])
+def recheck_batch():
+    """API endpoint to recheck many domains concurrently in one request
+
+    Takes a JSON body with either "domains", a list of at most
+    SCANNER_RECHECK_MAX_HOSTS hosts, or "all_inactive": true to recheck
+    every inactive host of a scan, in chunks of that many hosts. The scan
+    is the stored scan "scan_id" or, without one, the scan job "job" (or the
+    session's current job). Results are returned as a single JSON document,
+    or with ?stream=1 as NDJSON lines as the probes complete, which suits
+    large rechecks.
+    """
     from models import ScanHistory
     
-    # Get all scan history records, ordered by newest first
-    scan_histories = ScanHistory.query.order_by(ScanHistory.timestamp.desc()).all()
+    payload = request.get_json(silent=True) or {}
+    scan_id = payload.get('scan_id')
+    if scan_id is not None:
+        scan_history = (db.session.get(ScanHistory, scan_id)
+                        if isinstance(scan_id, int) and not isinstance(scan_id, bool) else None)
+        if scan_history is None:
+            return jsonify({'success': False, 'error': 'Unknown scan'}), 404
+        if scan_history.is_diff:
+            return jsonify({'success': False, 'error': 'Differential scans only store changes and cannot be rechecked'}), 400
+        job = next((j for j in job_manager.jobs() if j.scanner.scan_id == scan_id), None)
+    else:
+        job = _get_job(payload.get('job'))
+        scan_id = _saved_scan_id(job)
+    
+    if payload.get('all_inactive'):
+        if job is not None:
+            hosts = [r['domain'] for r in job.scanner.inactive_domains]
+            chunks = [hosts[start:start + DEFAULT_RECHECK_MAX_HOSTS]
+                      for start in range(0, len(hosts), DEFAULT_RECHECK_MAX_HOSTS)]
+        elif scan_id is not None:
+            chunks = inactive_subdomain_chunks(db.session, scan_id)
+        else:
+            return jsonify({'success': False, 'error': 'No scan to recheck'}), 400
+    else:
+        hosts = payload.get('domains')
+        if not isinstance(hosts, list) or not all(isinstance(host, str) for host in hosts):
+            return jsonify({'success': False, 'error': 'Expected a list of domains'}), 400
+        hosts = list(dict.fromkeys(host.strip().lower() for host in hosts if host.strip()))
+        if len(hosts) > DEFAULT_RECHECK_MAX_HOSTS:
+            return jsonify({'success': False, 'error': f'At most {DEFAULT_RECHECK_MAX_HOSTS} domains can be rechecked at once'}), 400
+        chunks = [hosts]
+    
+    results = _recheck_hosts(job, scan_id, chunks)
+    if request.args.get('stream') in ('1', 'true', 'yes'):
+        lines = (json.dumps(_recheck_response(result)) + '\n' for result in results)
+        response = app.response_class(stream_with_context(lines), mimetype='application/x-ndjson')
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+    
+    results = [_recheck_response(result) for result in results]
+    return jsonify({
+        'success': True,
+        'scan_id': scan_id,
+        'count': len(results),
+        'active_count': sum(1 for result in results if result['is_active']),
+        'results': results,
+    })
+
+def _page_urls(page, endpoint, **values):
+    """Previous and next page URLs for a Page, keeping the current filters"""
+    args = {key: value for key, value in request.args.items() if key not in ('after', 'before')}
+    prev_url = url_for(endpoint, **values, **args, before=page.prev_cursor) if page.prev_cursor else None
+    next_url = url_for(endpoint, **values, **args, after=page.next_cursor) if page.next_cursor else None
+    return prev_url, next_url
+
+def _schedule_from(data):
+    """Validate schedule fields from a form or JSON body, returning (fields, error)"""
+    domain = str(data.get('domain') or '').strip().lower()
+    if not SubdomainScanner.validate_domain(domain):
+        return None, 'Please enter a valid domain name'
+    try:
+        interval_minutes = round(float(data.get('interval_hours') or 0) * 60)
+        jitter = data.get('jitter_minutes')
+        # Default jitter: a tenth of the interval
+        jitter_minutes = int(jitter) if jitter not in (None, '') else interval_minutes // 10
+    except (TypeError, ValueError):
+        return None, 'Interval and jitter must be numbers'
+    if interval_minutes < MIN_INTERVAL_MINUTES:
+        return None, f'The interval must be at least {MIN_INTERVAL_MINUTES} minutes'
+    if not 0 <= jitter_minutes <= interval_minutes // 2:
+        return None, 'The jitter must be between 0 and half the interval'
+    return {
+        'domain': domain,
+        'interval_minutes': interval_minutes,
+        'jitter_minutes': jitter_minutes,
+        'scan_mode': 'diff' if data.get('mode') == 'diff' else 'full',
+    }, None
+
+def _create_schedule(fields):
+    """Add a schedule, returning it or None if the domain already has one"""
+    from models import ScanSchedule
+    
+    if db.session.scalar(select(ScanSchedule).filter_by(domain=fields['domain']).limit(1)) is not None:
+        return None
+    schedule = ScanSchedule(next_run_at=first_run_at(fields['interval_minutes']), **fields)
+    db.session.add(schedule)
+    db.session.commit()
+    scheduler.wake()
+    return schedule
+
+@app.route('/schedules')
+def schedules():
+    """Recurring scans and their latest runs"""
+    from models import ScanSchedule
+    
+    schedule_list = db.session.scalars(select(ScanSchedule).order_by(ScanSchedule.domain)).all()
+    return render_template('schedules.html', schedules=schedule_list,
+                           scheduler_enabled=DEFAULT_SCHEDULER_ENABLED, max_jobs=scheduler.max_jobs)
+
+@app.route('/schedules', methods=['POST'])
+def add_schedule():
+    fields, error = _schedule_from(request.form)
+    if error:
+        flash(error, 'danger')
+    elif _create_schedule(fields) is None:
+        flash(f"{fields['domain']} is already scheduled", 'warning')
+    else:
+        flash(f"Scheduled a scan of {fields['domain']} every {fields['interval_minutes'] / 60:g} hours", 'success')
+    return redirect(url_for('schedules'))
+
+@app.route('/schedules/<int:schedule_id>/toggle', methods=['POST'])
+def toggle_schedule(schedule_id):
+    from models import ScanSchedule
+    
+    schedule = db.get_or_404(ScanSchedule, schedule_id)
+    schedule.enabled = not schedule.enabled
+    db.session.commit()
+    flash(f"{'Resumed' if schedule.enabled else 'Paused'} scheduled scans of {schedule.domain}", 'success')
+    return redirect(url_for('schedules'))
+
+@app.route('/schedules/<int:schedule_id>/run', methods=['POST'])
+def run_schedule(schedule_id):
+    """Make a schedule due now; it starts as soon as a scheduler slot is free"""
+    from models import ScanSchedule
+    
+    schedule = db.get_or_404(ScanSchedule, schedule_id)
+    schedule.next_run_at = datetime.now()
+    db.session.commit()
+    scheduler.wake()
+    flash(f"Scan of {schedule.domain} will start shortly", 'success')
+    return redirect(url_for('schedules'))
+
+@app.route('/schedules/<int:schedule_id>/delete', methods=['POST'])
+def delete_schedule(schedule_id):
+    from models import ScanSchedule
+    
+    schedule = db.get_or_404(ScanSchedule, schedule_id)
+    db.session.delete(schedule)
+    db.session.commit()
+    flash(f"Removed the schedule for {schedule.domain}; its scans stay in the history", 'success')
+    return redirect(url_for('schedules'))
+
+@app.route('/api/schedules')
+def api_schedules():
+    from models import ScanSchedule
     
-    return render_template('history.html', scan_histories=scan_histories)
+    schedule_list = db.session.scalars(select(ScanSchedule).order_by(ScanSchedule.domain)).all()
+    return jsonify({'schedules': [schedule.to_dict() for schedule in schedule_list]})
+
+@app.route('/api/schedules', methods=['POST'])
+def api_add_schedule():
+    """Add a schedule from JSON: {"domain": ..., "interval_hours": 6, "jitter_minutes": 30, "mode": "full"}"""
+    fields, error = _schedule_from(request.get_json(silent=True) or {})
+    if error:
+        return jsonify({'error': error}), 400
+    schedule = _create_schedule(fields)
+    if schedule is None:
+        return jsonify({'error': f"{fields['domain']} is already scheduled"}), 409
+    return jsonify(schedule.to_dict()), 201
+
+@app.route('/history')
+def history():
+    """Show a page of the scan history from the database"""
+    try:
+        page = history_page(db.session, request.args)
+    except InvalidQuery as e:
+        flash(str(e), 'warning')
+        return redirect(url_for('history'))
+    prev_url, next_url = _page_urls(page, 'history')
+    return render_template('history.html', scan_histories=page.items, prev_url=prev_url, next_url=next_url,
+                           filters=request.args, history_sorts=HISTORY_SORTS)
+
+@app.route('/api/history')
+def api_history():
+    """JSON page of the scan history, with the same filters as /history"""
+    try:
+        page = history_page(db.session, request.args)
+    except InvalidQuery as e:
+        return jsonify({'error': str(e)}), 400
+    prev_url, next_url = _page_urls(page, 'api_history')
+    return jsonify({
+        'scans': [scan_history.to_dict() for scan_history in page],
+        'prev_cursor': page.prev_cursor,
+        'next_cursor': page.next_cursor,
+        'prev': prev_url,
+        'next': next_url,
+    })
 
 @app.route('/history/<int:scan_id>')
 def history_detail(scan_id):
-    """Show detailed results for a specific scan"""
-    from models import ScanHistory, ScanResult
+    """Show a page of the results of a specific scan"""
+    from models import ScanHistory, ScanChange
     
     # Get the scan history record
-    scan_history = ScanHistory.query.get_or_404(scan_id)
+    scan_history = db.get_or_404(ScanHistory, scan_id)
     
-    # Get all results for this scan
-    results = ScanResult.query.filter_by(scan_id=scan_id).all()
+    # Differential scans only store what changed against their baseline scan
+    if scan_history.is_diff:
+        changes = db.session.scalars(
+            select(ScanChange).filter_by(scan_id=scan_id).order_by(ScanChange.change_type, ScanChange.subdomain)
+        ).all()
+        return render_template('history_changes.html', scan_history=scan_history, changes=changes)
     
-    # Separate active and inactive domains
-    active_domains = [r for r in results if r.is_active]
-    inactive_domains = [r for r in results if not r.is_active]
+    try:
+        page = results_page(db.session, scan_id, request.args)
+    except InvalidQuery as e:
+        flash(str(e), 'warning')
+        return redirect(url_for('history_detail', scan_id=scan_id))
+    prev_url, next_url = _page_urls(page, 'history_detail', scan_id=scan_id)
     
     return render_template('history_detail.html', 
                           scan_history=scan_history, 
-                          results=results,
-                          active_domains=active_domains,
-                          inactive_domains=inactive_domains)
+                          results=page.items,
+                          prev_url=prev_url,
+                          next_url=next_url,
+                          filters=request.args,
+                          result_sorts=RESULT_SORTS)
+
+@app.route('/api/history/<int:scan_id>/profile')
+def api_history_profile(scan_id):
+    """Stage timings, probe counts and error classes recorded for a scan"""
+    from models import ScanHistory
+    
+    scan_history = db.session.get(ScanHistory, scan_id)
+    if scan_history is None:
+        return jsonify({'error': 'Unknown scan'}), 404
+    return jsonify({'scan': scan_history.to_dict(), 'profile': scan_history.profile_data})
+
+@app.route('/api/history/<int:scan_id>/results')
+def api_history_results(scan_id):
+    """JSON page of a scan's results, with the same filters as /history/<scan_id>"""
+    from models import ScanHistory
+    
+    scan_history = db.session.get(ScanHistory, scan_id)
+    if scan_history is None:
+        return jsonify({'error': 'Unknown scan'}), 404
+    try:
+        page = results_page(db.session, scan_id, request.args)
+    except InvalidQuery as e:
+        return jsonify({'error': str(e)}), 400
+    prev_url, next_url = _page_urls(page, 'api_history_results', scan_id=scan_id)
+    return jsonify({
+        'scan': scan_history.to_dict(),
+        'results': [result.to_dict() for result in page],
+        'prev_cursor': page.prev_cursor,
+        'next_cursor': page.next_cursor,
+        'prev': prev_url,
+        'next': next_url,
+    })
+
+@app.route('/history/<int:scan_id>/export')
+def history_export(scan_id):
+    """Download a stored scan as CSV or NDJSON, optionally gzip compressed
+
+    The file is streamed from the database while it is being read, so the
+    download starts right away and memory use doesn't depend on the scan size.
+    Differential scans export their changes.
+    """
+    from models import ScanHistory
+    
+    scan_history = db.get_or_404(ScanHistory, scan_id)
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unknown export format: {fmt}'}), 400
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    compress = request.args.get('gzip') in ('1', 'true', 'yes')
+    
+    chunks = ScanExport(db.session, scan_history).chunks(fmt)
+    filename = f"subdomain_scan_{scan_history.domain}_{scan_history.id}.{extension}"
+    if compress:
+        chunks = gzip_chunks(chunks)
+        mimetype = 'application/gzip'
+        filename += '.gz'
+    else:
+        chunks = (chunk.encode() for chunk in chunks)
+    
+    response = app.response_class(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @app.route('/history/delete/<int:scan_id>', methods=['POST'])
 def delete_history(scan_id):
@@ -469,7 +595,7 @@ def delete_history(scan_id):
     from models import ScanHistory
     
     # Get the scan history record
-    scan_history = ScanHistory.query.get_or_404(scan_id)
+    scan_history = db.get_or_404(ScanHistory, scan_id)
     
     try:
         # The 'cascade' option in the relationship will automatically delete related results
@@ -489,4 +615,7 @@ def setup():
     return render_template('setup.html')
 
 if __name__ == '__main__':
+    # The debug reloader runs this file in a watching process and a serving child
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_scheduler()
     app.run(host='0.0.0.0', port=5003, debug=True)
@@ -0,0 +1,80 @@
+"""Benchmark brute-force candidate generation from a large wordlist
+
+Usage: python benchmarks/bench_bruteforce.py [--words 1000000] [--found 200]
+
+Writes a wordlist of --words random labels to a temporary file, then
+streams candidates for it plus the permutations of --found discovered hosts,
+once deduplicating with the Bloom filter and once with a plain set. Prints
+candidates per second and the peak memory traced while generating.
+"""
+import os
+import sys
+import time
+import random
+import string
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bruteforce  # noqa: E402
+from bruteforce import BruteForcer  # noqa: E402
+from resolver import DnsResolver, StaticResolver  # noqa: E402
+
+
+class SetFilter:
+    """The naive alternative: remember every candidate in a set"""
+
+    def __init__(self, capacity, error_rate=None):
+        self.items = set()
+
+    def add(self, item):
+        if item in self.items:
+            return False
+        self.items.add(item)
+        return True
+
+
+def write_wordlist(path, words):
+    rng = random.Random(1)
+    with open(path, 'w') as handle:
+        for _ in range(words):
+            handle.write(''.join(rng.choices(string.ascii_lowercase + string.digits, k=rng.randint(3, 12))) + '\n')
+
+
+def run(wordlist, found, dedupe):
+    bruteforce.BloomFilter = dedupe
+    forcer = BruteForcer(DnsResolver(resolve_func=StaticResolver({})), wordlist=wordlist)
+    forcer.start("example.com")
+    for i in range(found):
+        forcer.found(f"host{i}.example.com")
+    tracemalloc.start()
+    started = time.perf_counter()
+    count = sum(1 for _ in forcer.candidates())
+    count += len(forcer.permutation_round())
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--words", type=int, default=1000000)
+    parser.add_argument("--found", type=int, default=200)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "wordlist.txt")
+    write_wordlist(path, args.words)
+    print(f"{'dedupe':>8} {'candidates':>11} {'seconds':>9} {'cand/s':>10} {'peak MB':>9}")
+    try:
+        for name, dedupe in (("bloom", bruteforce.BloomFilter), ("set", SetFilter)):
+            count, elapsed, peak = run(path, args.found, dedupe)
+            print(f"{name:>8} {count:>11} {elapsed:>9.2f} {count / elapsed:>10.0f} {peak / 1e6:>9.1f}")
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Benchmark saving scan results to SQLite: per-row ORM path vs batched ResultWriter
+
+Usage: python benchmarks/bench_db_save.py [--rows 20000] [--batch-sizes 100,500,2000]
+
+The legacy path is the original _save_to_database: one ScanResult object per
+row, timestamps round-tripped through strftime/strptime and a single commit at
+the end. The batched path is ResultWriter with incremental commits.
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DB_PATH = os.path.join(tempfile.mkdtemp(), "bench_db_save.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+
+from app import app  # noqa: E402
+from database import db  # noqa: E402
+from models import ScanHistory, ScanResult, ResponseInfo  # noqa: E402
+from persistence import ResultWriter  # noqa: E402
+
+logging.getLogger().setLevel(logging.WARNING)
+
+
+def make_results(count):
+    now = datetime.now()
+    return [{
+        'domain': f"host-{i}.example.com",
+        'is_active': i % 3 == 0,
+        'response_info': "HTTP/1.1 200 OK" if i % 3 == 0 else "No response",
+        'timestamp': now.strftime("%Y-%m-%d %H:%M:%S"),
+        'checked_at': now,
+    } for i in range(count)]
+
+
+def save_legacy(domain, results):
+    active = [r for r in results if r['is_active']]
+    scan_history = ScanHistory(domain=domain, active_count=len(active),
+                               inactive_count=len(results) - len(active), total_count=len(results))
+    db.session.add(scan_history)
+    db.session.flush()
+    # The old schema stored the response text inline; look the IDs up once instead
+    response_ids = ResponseInfo.ids_for(db.session, {r['response_info'] for r in results})
+    for result in results:
+        db.session.add(ScanResult(
+            scan_id=scan_history.id,
+            subdomain=result['domain'],
+            is_active=result['is_active'],
+            response_info_id=response_ids[result['response_info']],
+            timestamp=datetime.strptime(result['timestamp'], "%Y-%m-%d %H:%M:%S"),
+        ))
+    db.session.commit()
+
+
+def save_batched(domain, results, batch_size):
+    writer = ResultWriter(db.session, domain, batch_size=batch_size)
+    for result in results:
+        writer.add(result)
+    writer.finish()
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    func(*args)
+    db.session.remove()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--batch-sizes", default="100,500,2000")
+    args = parser.parse_args()
+
+    results = make_results(args.rows)
+    print(f"{'path':>16} {'seconds':>9} {'rows/s':>10}")
+    with app.app_context():
+        elapsed = timed(save_legacy, "legacy.example.com", results)
+        print(f"{'legacy':>16} {elapsed:>9.2f} {args.rows / elapsed:>10.0f}")
+        for batch_size in [int(x) for x in args.batch_sizes.split(",")]:
+            elapsed = timed(save_batched, "batched.example.com", results, batch_size)
+            print(f"{'batch=' + str(batch_size):>16} {elapsed:>9.2f} {args.rows / elapsed:>10.0f}")
+    os.remove(DB_PATH)
+
+
+if __name__ == "__main__":
+    main()
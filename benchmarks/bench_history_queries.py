@@ -0,0 +1,129 @@
+"""Benchmark history page queries on a seeded SQLite database, with and without the indexes
+
+Usage: python benchmarks/bench_history_queries.py [--scans 200] [--hosts 2000] [--repeat 20]
+
+Seeds --scans scans of --hosts results each, spread over a handful of
+domains, then times the queries behind the history list, the scan detail
+page, the differential scan baseline and the history of a single subdomain.
+The detail page is timed both the old way (load every result and split by
+status in Python) and the new way (one filtered query per status). Every
+query is run once with the model's indexes and once after dropping them.
+"""
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DB_PATH = os.path.join(tempfile.mkdtemp(), "bench_history_queries.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+
+from sqlalchemy import insert, select  # noqa: E402
+
+from app import app  # noqa: E402
+from database import db  # noqa: E402
+from models import ScanHistory, ScanResult, ResponseInfo  # noqa: E402
+from persistence import load_baseline  # noqa: E402
+
+logging.getLogger().setLevel(logging.WARNING)
+
+DOMAINS = [f"domain{i}.example.com" for i in range(10)]
+RESPONSES = ["HTTP/1.1 200 OK", "HTTP/1.1 301 Moved Permanently", "HTTP/1.1 403 Forbidden",
+             "HTTP/2 404", "No response", "No DNS record (NXDOMAIN)"]
+
+
+def seed(scans, hosts):
+    response_ids = ResponseInfo.ids_for(db.session, RESPONSES)
+    started = datetime.now() - timedelta(days=scans)
+    for n in range(scans):
+        domain = DOMAINS[n % len(DOMAINS)]
+        timestamp = started + timedelta(days=n)
+        scan_history = ScanHistory(domain=domain, timestamp=timestamp, scan_mode='full',
+                                   total_count=hosts, active_count=0, inactive_count=hosts)
+        db.session.add(scan_history)
+        db.session.flush()
+        db.session.execute(insert(ScanResult), [{
+            'scan_id': scan_history.id,
+            'subdomain': f"host-{i}.{domain}",
+            'is_active': i % 4 == 0,
+            'response_info_id': response_ids[RESPONSES[i % len(RESPONSES)]],
+            'timestamp': timestamp,
+        } for i in range(hosts)])
+        db.session.commit()
+
+
+def history_list():
+    db.session.scalars(select(ScanHistory).order_by(ScanHistory.timestamp.desc()).limit(50)).all()
+
+
+def detail_legacy(scan_id):
+    results = db.session.scalars(select(ScanResult).filter_by(scan_id=scan_id)).all()
+    [r for r in results if r.is_active]
+    [r for r in results if not r.is_active]
+
+
+def detail_filtered(scan_id):
+    db.session.scalars(select(ScanResult).filter_by(scan_id=scan_id, is_active=True).order_by(ScanResult.subdomain)).all()
+    db.session.scalars(select(ScanResult).filter_by(scan_id=scan_id, is_active=False).order_by(ScanResult.subdomain)).all()
+
+
+def baseline(domain):
+    load_baseline(db.session, domain)
+
+
+def subdomain_history(subdomain):
+    db.session.scalars(select(ScanResult).filter_by(subdomain=subdomain).order_by(ScanResult.timestamp.desc())).all()
+
+
+def timed(repeat, func, *args):
+    func(*args)
+    db.session.remove()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func(*args)
+        db.session.remove()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def run_queries(repeat, scans):
+    # Same scan and domain for both runs
+    rng = random.Random(0)
+    scan_id = rng.randint(1, scans)
+    domain = rng.choice(DOMAINS)
+    return [
+        ("history list", timed(repeat, history_list)),
+        ("detail (load all)", timed(repeat, detail_legacy, scan_id)),
+        ("detail (filtered)", timed(repeat, detail_filtered, scan_id)),
+        ("diff baseline", timed(repeat, baseline, domain)),
+        ("subdomain history", timed(repeat, subdomain_history, f"host-7.{domain}")),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scans", type=int, default=200)
+    parser.add_argument("--hosts", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with app.app_context():
+        seed(args.scans, args.hosts)
+        indexed = run_queries(args.repeat, args.scans)
+        for table in (ScanHistory.__table__, ScanResult.__table__):
+            for index in table.indexes:
+                index.drop(db.engine)
+        unindexed = run_queries(args.repeat, args.scans)
+
+    print(f"{args.scans * args.hosts} results in {args.scans} scans")
+    print(f"{'query':>20} {'no index ms':>12} {'indexed ms':>11}")
+    for (name, with_index), (_, without_index) in zip(indexed, unindexed):
+        print(f"{name:>20} {without_index:>12.2f} {with_index:>11.2f}")
+    os.remove(DB_PATH)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark the liveness engine against a local stub HTTP server
+
+Usage: python benchmarks/bench_liveness.py [--hosts 200] [--delay 0.05] [--levels 1,8,32,64]
+
+Every "host" is a distinct URL on a local ThreadingHTTPServer that sleeps for
+--delay seconds before answering, which stands in for network latency. The
+benchmark prints hosts-per-second for each concurrency level.
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scanner import SubdomainScanner  # noqa: E402
+
+logging.getLogger().setLevel(logging.WARNING)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    delay = 0.0
+
+    def do_HEAD(self):
+        time.sleep(self.delay)
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    do_GET = do_HEAD
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default listen backlog of 5 drops connections at high concurrency
+    request_queue_size = 256
+
+
+def start_stub_server(delay):
+    StubHandler.delay = delay
+    server = StubServer(("127.0.0.1", 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def run_level(port, hosts, concurrency):
+    scanner = SubdomainScanner(concurrency=concurrency, timeout=5)
+    urls = [f"http://127.0.0.1:{port}/host-{i}" for i in range(hosts)]
+    started = time.perf_counter()
+    for result in scanner.liveness.run(urls, scanner._check_domain_liveness):
+        scanner._record_result(result)
+    elapsed = time.perf_counter() - started
+    return elapsed, len(scanner.active_domains)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hosts", type=int, default=200)
+    parser.add_argument("--delay", type=float, default=0.05)
+    parser.add_argument("--levels", default="1,8,32,64")
+    args = parser.parse_args()
+
+    server = start_stub_server(args.delay)
+    port = server.server_address[1]
+    print(f"{'concurrency':>12} {'seconds':>9} {'hosts/s':>9} {'active':>7}")
+    try:
+        for level in [int(x) for x in args.levels.split(",")]:
+            elapsed, active = run_level(port, args.hosts, level)
+            print(f"{level:>12} {elapsed:>9.2f} {args.hosts / elapsed:>9.1f} {active:>7}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+import os
+import re
+import gzip
+import math
+import hashlib
+import logging
+import secrets
+
+from resolver import RESOLVED
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORDLIST = os.environ.get("SCANNER_WORDLIST")
+DEFAULT_PERMUTATION_LIMIT = int(os.environ.get("SCANNER_PERMUTATION_LIMIT", 100000))
+
+# Used when subfinder is not installed and no wordlist is configured
+COMMON_PREFIXES = (
+    "www", "api", "mail", "blog", "shop", "store", "admin", "dev", "test", "app", "m",
+    "staging", "beta", "portal", "vpn", "remote", "webmail", "smtp", "ns1", "ns2",
+    "cdn", "static", "docs", "status", "git", "jenkins", "auth", "login", "dashboard", "internal",
+)
+
+# Words combined with discovered labels, e.g. api -> dev-api, api-dev, dev.api
+ALTERATION_WORDS = ("dev", "test", "staging", "stage", "qa", "uat", "prod", "internal", "old", "new", "beta", "v2")
+
+# Random names resolved per zone to detect wildcard DNS records
+WILDCARD_PROBES = 2
+
+_LABEL = r'[a-z0-9]([a-z0-9\-]{0,61}[a-z0-9])?'
+_WORD_PATTERN = re.compile(rf'^{_LABEL}(\.{_LABEL})*$')
+_NUMBERED_LABEL = re.compile(r'^(.*?)(\d+)$')
+
+
+class BloomFilter:
+    """Set membership in a fixed-size bit array, with a small false-positive rate
+
+    Sized for capacity items at error_rate; a million items at 0.1% take
+    under 2MB, where a set of the same host names takes well over 100MB.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = int.from_bytes(hashlib.blake2b(item.encode(), digest_size=16).digest(), 'little')
+        first, second = digest >> 64, (digest & 0xFFFFFFFFFFFFFFFF) | 1
+        size = self.size
+        return [(first + i * second) % size for i in range(self.hash_count)]
+
+    def add(self, item):
+        """Add item, returning False if it was (probably) already present"""
+        bits = self.bits
+        added = False
+        for position in self._positions(item):
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+def read_wordlist(path):
+    """Yield the words of a wordlist file one line at a time, skipping blanks, comments and invalid labels
+
+    Files ending in .gz are decompressed on the fly.
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', errors='ignore') as handle:
+        for line in handle:
+            word = line.strip().lower().strip('.')
+            if word and not word.startswith('#') and _WORD_PATTERN.match(word):
+                yield word
+
+
+def estimate_words(path):
+    """Rough number of words in a wordlist from its size, for sizing the Bloom filter"""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return 0
+    # Compressed wordlists expand roughly fourfold; the average word is about 8 bytes
+    return size * (4 if path.endswith('.gz') else 1) // 8
+
+
+def permutations(host, domain, words=ALTERATION_WORDS):
+    """Yield alterations of a discovered host
+
+    api.example.com gives api1, api2 and api3 plus dev-api, api-dev and
+    dev.api for every alteration word; numbered labels such as api2 are
+    stepped to api1 and api3 instead.
+    """
+    if host == domain or not host.endswith('.' + domain):
+        return
+    label, _, parent = host.partition('.')
+    match = _NUMBERED_LABEL.match(label)
+    if match and match.group(1):
+        stem, digits = match.groups()
+        for number in (int(digits) - 1, int(digits) + 1):
+            if number >= 0:
+                yield f"{stem}{number:0{len(digits)}d}.{parent}"
+    else:
+        for number in (1, 2, 3):
+            yield f"{label}{number}.{parent}"
+    for word in words:
+        if word == label or len(label) + len(word) >= 63:
+            continue
+        yield f"{word}-{label}.{parent}"
+        yield f"{label}-{word}.{parent}"
+        yield f"{word}.{host}"
+
+
+class WildcardDetector:
+    """Detects wildcard DNS records by resolving random names in a zone
+
+    Results are cached per zone. An answer matches the wildcard when it
+    shares the wildcard's CNAME target or all of its addresses are ones the
+    random names resolved to.
+    """
+
+    def __init__(self, resolver, probes=WILDCARD_PROBES):
+        self.resolver = resolver
+        self.probes = probes
+        self._zones = {}
+
+    def wildcard_for(self, zone):
+        """The (addresses, cnames) a wildcard in zone answers with, or None without a wildcard"""
+        if zone not in self._zones:
+            addresses, cnames = set(), set()
+            for _ in range(self.probes):
+                answer = self.resolver.resolve(f"{secrets.token_hex(8)}.{zone}")
+                if answer.status == RESOLVED:
+                    addresses.update(answer.addresses)
+                    if answer.cname:
+                        cnames.add(answer.cname)
+            self._zones[zone] = (addresses, cnames) if addresses else None
+            if addresses:
+                logger.info(f"Wildcard DNS detected for *.{zone}: {sorted(addresses)}")
+        return self._zones[zone]
+
+    def matches(self, answer):
+        zone = answer.host.partition('.')[2]
+        wildcard = self.wildcard_for(zone) if zone else None
+        if wildcard is None:
+            return False
+        addresses, cnames = wildcard
+        if answer.cname and answer.cname in cnames:
+            return True
+        return bool(answer.addresses) and set(answer.addresses) <= addresses
+
+
+class BruteForcer:
+    """Generates candidate subdomains from a wordlist and from permutations of hosts already found
+
+    Call start() for every scan. candidates() streams the wordlist; once
+    every candidate has been resolved and passed to keep() or found(),
+    permutation_round() gives the alterations of the hosts found, and is
+    called again for the hosts those rounds find, so brute-forced hits are
+    permuted as well. Candidates are deduplicated with a Bloom filter, so
+    memory stays flat for million-entry wordlists. keep() decides which
+    brute-forced answers are real: only resolving names that don't just
+    hit a wildcard record.
+    """
+
+    def __init__(self, resolver, wordlist=None, permutation_limit=None, words=ALTERATION_WORDS):
+        self.resolver = resolver
+        self.wordlist = wordlist if wordlist is not None else DEFAULT_WORDLIST
+        self.permutation_limit = DEFAULT_PERMUTATION_LIMIT if permutation_limit is None else permutation_limit
+        self.words = words
+        self.start(None)
+
+    def start(self, domain):
+        """Reset the per-scan state for a scan of domain"""
+        self.domain = domain
+        self.wildcards = WildcardDetector(self.resolver)
+        self.discovered = []
+        self.kept_count = 0
+        self.dropped_count = 0
+        # Set by candidates(); permutations are only generated when brute-forcing
+        self._seen = None
+        self._known = ()
+        self._permuted = 0
+        self._generated = 0
+
+    def words_for_scan(self):
+        if self.wordlist:
+            return read_wordlist(self.wordlist)
+        return iter(COMMON_PREFIXES)
+
+    def found(self, host):
+        """Record a host that exists, so its permutations are tried"""
+        self.discovered.append(host)
+
+    def candidates(self, known=()):
+        """Yield the wordlist candidate hosts that aren't in known"""
+        domain = self.domain
+        capacity = (estimate_words(self.wordlist) if self.wordlist else len(COMMON_PREFIXES)) + self.permutation_limit
+        seen = self._seen = BloomFilter(capacity)
+        self._known = known
+        count = 0
+        for word in self.words_for_scan():
+            host = f"{word}.{domain}"
+            if host not in known and seen.add(host):
+                count += 1
+                yield host
+        logger.debug(f"Generated {count} wordlist candidates for {domain}")
+
+    def permutation_round(self):
+        """Candidate permutations of the hosts found since the previous round, empty when there are none
+
+        Call it only after the answers for all earlier candidates went
+        through keep() or found(), or hits still being resolved are missed.
+        At most permutation_limit permutations are generated per scan.
+        """
+        if self._seen is None:
+            return []
+        hosts = []
+        end = len(self.discovered)
+        for index in range(self._permuted, end):
+            if self._generated >= self.permutation_limit:
+                break
+            for host in permutations(self.discovered[index], self.domain, self.words):
+                if host not in self._known and self._seen.add(host):
+                    hosts.append(host)
+                    self._generated += 1
+                    if self._generated >= self.permutation_limit:
+                        break
+        self._permuted = end
+        if hosts:
+            logger.debug(f"Generated {len(hosts)} permutation candidates for {self.domain}")
+        return hosts
+
+    def keep(self, answer):
+        """Whether a brute-forced candidate's DnsAnswer is a real subdomain"""
+        if answer.status != RESOLVED or self.wildcards.matches(answer):
+            self.dropped_count += 1
+            return False
+        self.kept_count += 1
+        self.found(answer.host)
+        return True
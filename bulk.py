@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from liveness import DEFAULT_CONCURRENCY
+from scanner import SubdomainScanner
+from fingerprint import FIELDS as FINGERPRINT_FIELDS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PARALLEL_DOMAINS = int(os.environ.get("SCANNER_PARALLEL_DOMAINS", 4))
+DEFAULT_PROBE_BUDGET = int(os.environ.get("SCANNER_PROBE_BUDGET", 128))
+
+
+class DomainScan:
+    """Summary of one domain's scan in a bulk run"""
+
+    def __init__(self, domain):
+        self.domain = domain
+        self.success = False
+        self.scan_id = None
+        self.total_count = 0
+        self.active_count = 0
+        self.error_message = None
+        self.seconds = 0.0
+
+    @property
+    def hosts_per_second(self):
+        return self.total_count / self.seconds if self.seconds else 0.0
+
+    def to_dict(self):
+        return {
+            'domain': self.domain,
+            'success': self.success,
+            'scan_id': self.scan_id,
+            'total_count': self.total_count,
+            'active_count': self.active_count,
+            'inactive_count': self.total_count - self.active_count,
+            'error_message': self.error_message,
+            'seconds': round(self.seconds, 3),
+        }
+
+
+def read_domains(lines):
+    """Unique, valid apex domains from lines of a domain list, skipping blanks and # comments"""
+    seen = set()
+    for line in lines:
+        domain = line.split('#', 1)[0].strip().lower()
+        if not domain or domain in seen:
+            continue
+        if not SubdomainScanner.validate_domain(domain):
+            logger.warning(f"Skipping invalid domain: {domain}")
+            continue
+        seen.add(domain)
+        yield domain
+
+
+def result_record(apex, result):
+    """JSON-serialisable form of a scan result dict"""
+    return {
+        'apex': apex,
+        'domain': result['domain'],
+        'is_active': result['is_active'],
+        'response_info': result.get('response_info'),
+        'ip_addresses': result.get('ip_addresses') or [],
+        'cached': result.get('cached', False),
+        'timestamp': result.get('timestamp'),
+        **{field: result.get(field) for field in FINGERPRINT_FIELDS},
+    }
+
+
+class NdjsonOutput:
+    """Writes results as NDJSON, to one shared stream or to one file per apex domain"""
+
+    def __init__(self, stream=None, directory=None):
+        self.stream = stream
+        self.directory = directory
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def open(self, apex):
+        """Return the result callback for the scan of apex and a function closing its output"""
+        if self.directory:
+            handle = open(os.path.join(self.directory, f"{apex}.ndjson"), 'w')
+
+            def write(result):
+                handle.write(json.dumps(result_record(apex, result)) + '\n')
+            return write, handle.close
+
+        def write_shared(result):
+            line = json.dumps(result_record(apex, result)) + '\n'
+            with self._lock:
+                self.stream.write(line)
+        return write_shared, self.stream.flush
+
+
+def scan_domains(domains, parallel=None, probe_budget=None, session_factory=None, output=None,
+                 mode='full', force_refresh=False, **scanner_options):
+    """Scan many apex domains in parallel and yield a DomainScan for each as it finishes
+
+    At most parallel domains are scanned at once, and all of them together
+    keep at most probe_budget HTTP probes in flight. Results are written to
+    the database when session_factory is given (a scoped_session, see
+    storage.create_session_factory) and to output, an NdjsonOutput, when
+    given. Extra keyword arguments are passed to SubdomainScanner.
+    """
+    parallel = parallel or DEFAULT_PARALLEL_DOMAINS
+    probe_budget = probe_budget or DEFAULT_PROBE_BUDGET
+    budget = threading.BoundedSemaphore(probe_budget)
+    # No single domain needs more workers than the shared budget allows
+    if not scanner_options.get('concurrency'):
+        scanner_options['concurrency'] = min(DEFAULT_CONCURRENCY, probe_budget)
+
+    def scan_one(domain):
+        summary = DomainScan(domain)
+        scanner = SubdomainScanner(session_factory=session_factory, probe_budget=budget, **scanner_options)
+        close = None
+        if output is not None:
+            scanner.on_result, close = output.open(domain)
+        started = time.perf_counter()
+        try:
+            summary.success = scanner.scan_subdomains(domain, force_refresh=force_refresh, mode=mode)
+            summary.error_message = scanner.error_message
+        finally:
+            summary.seconds = time.perf_counter() - started
+            summary.scan_id = scanner.scan_id
+            summary.total_count = len(scanner.scan_results)
+            summary.active_count = len(scanner.active_domains)
+            if close is not None:
+                close()
+            if session_factory is not None:
+                session_factory.remove()
+        return summary
+
+    with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix='bulk-scan') as executor:
+        futures = [executor.submit(scan_one, domain) for domain in domains]
+        for future in as_completed(futures):
+            yield future.result()
@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+from fingerprint import FIELDS as FINGERPRINT_FIELDS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ACTIVE_TTL = float(os.environ.get("SCANNER_CACHE_ACTIVE_TTL", 6 * 3600))
+DEFAULT_INACTIVE_TTL = float(os.environ.get("SCANNER_CACHE_INACTIVE_TTL", 3600))
+DEFAULT_MAX_ENTRIES = int(os.environ.get("SCANNER_CACHE_SIZE", 100000))
+DEFAULT_CACHE_PATH = os.environ.get("SCANNER_CACHE_PATH", "")
+
+# Result fields worth keeping; timestamps are rebuilt from the cache entry
+_CACHED_FIELDS = ('is_active', 'response_info', 'response_headers', 'ip_addresses') + FINGERPRINT_FIELDS
+
+
+class LivenessCache:
+    """TTL cache of liveness results keyed by hostname
+
+    Entries live in an LRU-bounded in-memory map. If a path is given they are
+    also written through to a small SQLite file, so the cache survives
+    restarts and daily rescans can skip hosts checked recently. Active and
+    inactive results have separate TTLs; a TTL of 0 disables caching for that
+    kind of result. Safe to share between threads.
+    """
+
+    def __init__(self, path=None, active_ttl=None, inactive_ttl=None, max_entries=None):
+        self.active_ttl = DEFAULT_ACTIVE_TTL if active_ttl is None else active_ttl
+        self.inactive_ttl = DEFAULT_INACTIVE_TTL if inactive_ttl is None else inactive_ttl
+        self.max_entries = max_entries or DEFAULT_MAX_ENTRIES
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._store = None
+        if path:
+            self._open_store(path)
+
+    def get(self, host):
+        """Return the cached entry for host as (fields, checked_at epoch), or None if missing or expired"""
+        key = host.lower()
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._store is not None:
+                row = self._store.execute(
+                    "SELECT expires_at, checked_at, data FROM liveness_cache WHERE host = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    entry = (row[0], row[1], json.loads(row[2]))
+                    self._remember(key, entry)
+            if entry is None:
+                return None
+            expires_at, checked_at, fields = entry
+            if expires_at <= now:
+                self._forget(key)
+                return None
+            self._entries.move_to_end(key)
+            return dict(fields), checked_at
+
+    def put(self, host, result):
+        """Cache the fields of a liveness result dict"""
+        ttl = self.active_ttl if result['is_active'] else self.inactive_ttl
+        if ttl <= 0:
+            return
+        key = host.lower()
+        checked_at = time.time()
+        fields = {field: result.get(field) for field in _CACHED_FIELDS}
+        entry = (checked_at + ttl, checked_at, fields)
+        with self._lock:
+            self._remember(key, entry)
+            if self._store is not None:
+                self._store.execute(
+                    "INSERT OR REPLACE INTO liveness_cache (host, expires_at, checked_at, data) VALUES (?, ?, ?, ?)",
+                    (key, entry[0], checked_at, json.dumps(fields))
+                )
+                self._store.commit()
+
+    def invalidate(self, host):
+        """Drop any cached result for host"""
+        with self._lock:
+            self._forget(host.lower())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _forget(self, key):
+        self._entries.pop(key, None)
+        if self._store is not None:
+            self._store.execute("DELETE FROM liveness_cache WHERE host = ?", (key,))
+            self._store.commit()
+
+    def _open_store(self, path):
+        try:
+            store = sqlite3.connect(path, check_same_thread=False)
+            store.execute("PRAGMA journal_mode=WAL")
+            store.execute("PRAGMA synchronous=NORMAL")
+            store.execute(
+                "CREATE TABLE IF NOT EXISTS liveness_cache ("
+                "host TEXT PRIMARY KEY, expires_at REAL NOT NULL, checked_at REAL NOT NULL, data TEXT NOT NULL)"
+            )
+            store.execute("DELETE FROM liveness_cache WHERE expires_at <= ?", (time.time(),))
+            store.commit()
+            self._store = store
+        except sqlite3.Error:
+            logger.exception(f"Could not open liveness cache at {path}, using memory only")
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    """Process-wide cache configured from the environment, shared by all scans"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = LivenessCache(path=DEFAULT_CACHE_PATH or None)
+        return _default_cache
@@ -0,0 +1,125 @@
+"""Scan many apex domains from the command line, without the web app
+
+Usage: python cli.py DOMAINS_FILE [--parallel 4] [--budget 128] [--output-dir DIR] [--db [URL]] [--distributed] [--benchmark]
+
+DOMAINS_FILE has one apex domain per line ('-' reads stdin); blank lines and
+'#' comments are skipped. Results are written as NDJSON to stdout, or to one
+<domain>.ndjson file per domain with --output-dir, and saved to the database
+with --db (DATABASE_URL unless a URL is given). With --distributed the hosts
+are probed by the workers of worker.py as well, through a work queue in that
+database. --benchmark prints per-domain and total wall-clock throughput to
+stderr.
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+
+from bulk import DEFAULT_PARALLEL_DOMAINS, DEFAULT_PROBE_BUDGET, NdjsonOutput, read_domains, scan_domains
+
+logger = logging.getLogger(__name__)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("domains_file", help="file with one apex domain per line, or - for stdin")
+    parser.add_argument("--parallel", type=int, default=DEFAULT_PARALLEL_DOMAINS,
+                        help="apex domains scanned at the same time")
+    parser.add_argument("--budget", type=int, default=DEFAULT_PROBE_BUDGET,
+                        help="HTTP probes in flight across all domains")
+    parser.add_argument("--concurrency", type=int, help="probe workers per domain")
+    parser.add_argument("--timeout", type=float, help="per-probe timeout in seconds")
+    parser.add_argument("--deadline", type=float, help="per-domain liveness deadline in seconds")
+    parser.add_argument("--wordlist", help="subdomain labels to brute-force in addition to subfinder")
+    parser.add_argument("--mode", choices=("full", "diff"), default="full",
+                        help="diff compares against the last saved scan (needs --db)")
+    parser.add_argument("--force-refresh", action="store_true", help="ignore cached liveness results")
+    parser.add_argument("--output-dir", help="write <domain>.ndjson files here instead of stdout")
+    parser.add_argument("--no-output", action="store_true", help="do not write NDJSON results")
+    parser.add_argument("--db", nargs="?", const="", metavar="URL",
+                        help="save scans to this database (default: DATABASE_URL)")
+    parser.add_argument("--distributed", action="store_true",
+                        help="share the probing with worker.py processes through the --db database")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="report wall-clock throughput on stderr; implies --no-output unless --output-dir is set")
+    parser.add_argument("-v", "--verbose", action="count", default=0)
+    return parser
+
+
+def _session_factory(url):
+    url = url or os.environ.get("DATABASE_URL")
+    if not url:
+        raise SystemExit("--db needs a URL or DATABASE_URL")
+    # Only load SQLAlchemy when the run actually saves to a database
+    from storage import create_session_factory
+    return create_session_factory(url)
+
+
+def _output(args):
+    if args.output_dir:
+        return NdjsonOutput(directory=args.output_dir)
+    if args.no_output or args.benchmark:
+        return None
+    return NdjsonOutput(stream=sys.stdout)
+
+
+def _print_benchmark(summaries, wall_seconds, stream):
+    stream.write(f"{'domain':<40} {'hosts':>7} {'active':>7} {'seconds':>9} {'hosts/s':>9}\n")
+    for summary in summaries:
+        stream.write(f"{summary.domain:<40} {summary.total_count:>7} {summary.active_count:>7} "
+                     f"{summary.seconds:>9.2f} {summary.hosts_per_second:>9.1f}\n")
+    hosts = sum(summary.total_count for summary in summaries)
+    serial_seconds = sum(summary.seconds for summary in summaries)
+    stream.write(f"{len(summaries)} domains, {hosts} hosts in {wall_seconds:.2f}s wall clock "
+                 f"({hosts / wall_seconds if wall_seconds else 0:.1f} hosts/s, "
+                 f"{serial_seconds / wall_seconds if wall_seconds else 0:.1f}x over scanning one at a time)\n")
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=(logging.WARNING, logging.INFO, logging.DEBUG)[min(args.verbose, 2)],
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s", stream=sys.stderr)
+
+    if args.domains_file == '-':
+        domains = list(read_domains(sys.stdin))
+    else:
+        with open(args.domains_file) as handle:
+            domains = list(read_domains(handle))
+    if not domains:
+        logger.error("No valid domains to scan")
+        return 2
+
+    session_factory = _session_factory(args.db) if args.db is not None else None
+    if args.mode == 'diff' and session_factory is None:
+        logger.warning("Differential mode needs --db; running full scans")
+    work_queue = None
+    if args.distributed:
+        if session_factory is None:
+            logger.error("--distributed needs --db")
+            return 2
+        from workqueue import WorkQueue
+        work_queue = WorkQueue(session_factory)
+
+    started = time.perf_counter()
+    summaries = []
+    for summary in scan_domains(domains, parallel=args.parallel, probe_budget=args.budget,
+                                session_factory=session_factory, output=_output(args),
+                                mode=args.mode, force_refresh=args.force_refresh,
+                                concurrency=args.concurrency, timeout=args.timeout, deadline=args.deadline,
+                                wordlist=args.wordlist, work_queue=work_queue):
+        summaries.append(summary)
+        if not summary.success:
+            logger.error(f"Scan of {summary.domain} failed: {summary.error_message}")
+        else:
+            logger.info(f"Scanned {summary.domain}: {summary.active_count}/{summary.total_count} active "
+                        f"in {summary.seconds:.2f}s")
+    wall_seconds = time.perf_counter() - started
+
+    if args.benchmark:
+        _print_benchmark(summaries, wall_seconds, sys.stderr)
+    return 0 if all(summary.success for summary in summaries) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,11 @@
-import os
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import DeclarativeBase
 
-# Define database model base class
-class Base(DeclarativeBase):
-    pass
+from storage import Base, upgrade_schema as _upgrade_schema
 
-# Initialize database
-db = SQLAlchemy(model_class=Base)
\ No newline at end of file
+# Initialize database; the models derive from the Flask-independent Base and
+# are queried with db.session and select() rather than Model.query
+db = SQLAlchemy(model_class=Base)
+
+def upgrade_schema():
+    """Add columns and indexes missing from the tables of the application's database"""
+    _upgrade_schema(db.engine)
@@ -0,0 +1,156 @@
+import os
+import csv
+import json
+import zlib
+from io import StringIO
+
+from sqlalchemy import select
+
+from models import ScanResult, ScanChange, ResponseInfo
+
+DEFAULT_EXPORT_BATCH_SIZE = int(os.environ.get("SCANNER_EXPORT_BATCH_SIZE", 1000))
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+RESULT_COLUMNS = ('subdomain', 'is_active', 'response_info', 'status_code', 'ip_addresses', 'timestamp',
+                  'server', 'title', 'redirect_url', 'content_length', 'tls_common_name', 'tls_sans', 'tls_expires_at')
+RESULT_HEADER = ('Domain', 'Status', 'Response Info', 'Status Code', 'IP Addresses', 'Timestamp',
+                 'Server', 'Title', 'Redirect', 'Content Length', 'TLS Common Name', 'TLS Names', 'TLS Expires')
+
+CHANGE_COLUMNS = ('subdomain', 'change_type', 'is_active', 'response_info',
+                  'previous_is_active', 'previous_response_info', 'timestamp')
+CHANGE_HEADER = ('Domain', 'Change', 'Status', 'Response Info', 'Previous Status', 'Previous Response Info', 'Timestamp')
+
+
+def _status(is_active):
+    if is_active is None:
+        return ''
+    return 'Active' if is_active else 'Inactive'
+
+
+class ScanExport:
+    """Streams the stored rows of one scan as CSV or NDJSON
+
+    Rows are read with a server-side cursor in batches of batch_size as plain
+    column tuples, so neither the ORM identity map nor the output grow with
+    the size of the scan. Full scans export their results, differential
+    scans the changes they recorded.
+    """
+
+    def __init__(self, session, scan_history, batch_size=None):
+        self.session = session
+        self.scan_history = scan_history
+        self.batch_size = batch_size or DEFAULT_EXPORT_BATCH_SIZE
+        if scan_history.is_diff:
+            self.columns, self.header = CHANGE_COLUMNS, CHANGE_HEADER
+        else:
+            self.columns, self.header = RESULT_COLUMNS, RESULT_HEADER
+
+    def rows(self):
+        """Yield the scan's rows as named tuples with self.columns"""
+        scan_id = self.scan_history.id
+        if self.scan_history.is_diff:
+            statement = (
+                select(*(getattr(ScanChange, column) for column in CHANGE_COLUMNS))
+                .where(ScanChange.scan_id == scan_id)
+                .order_by(ScanChange.id)
+            )
+        else:
+            statement = (
+                select(ScanResult.subdomain, ScanResult.is_active,
+                       ResponseInfo.text.label('response_info'), ResponseInfo.status_code,
+                       ScanResult.ip_addresses, ScanResult.timestamp,
+                       ScanResult.server, ScanResult.title, ScanResult.redirect_url, ScanResult.content_length,
+                       ScanResult.tls_common_name, ScanResult.tls_sans, ScanResult.tls_expires_at)
+                .outerjoin(ResponseInfo, ScanResult.response_info_id == ResponseInfo.id)
+                .where(ScanResult.scan_id == scan_id)
+                .order_by(ScanResult.id)
+            )
+        result = self.session.execute(statement.execution_options(yield_per=self.batch_size))
+        try:
+            for partition in result.partitions():
+                yield from partition
+        finally:
+            result.close()
+
+    def csv_chunks(self):
+        """Yield the CSV export, one chunk per batch of rows after the header"""
+        output = StringIO()
+        writer = csv.writer(output)
+        writer.writerow(self.header)
+        yield self._drain(output)
+        count = 0
+        for row in self.rows():
+            writer.writerow(self._csv_values(row))
+            count += 1
+            if count % self.batch_size == 0:
+                yield self._drain(output)
+        yield self._drain(output)
+
+    def ndjson_chunks(self):
+        """Yield the export as one JSON object per line, one chunk per batch of rows"""
+        lines = []
+        for row in self.rows():
+            lines.append(json.dumps(self._json_values(row), separators=(',', ':')))
+            if len(lines) >= self.batch_size:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+        if lines:
+            yield '\n'.join(lines) + '\n'
+
+    def chunks(self, fmt):
+        if fmt == 'csv':
+            return self.csv_chunks()
+        if fmt == 'ndjson':
+            return self.ndjson_chunks()
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    def _csv_values(self, row):
+        values = []
+        for column, value in zip(self.columns, row):
+            if column in ('is_active', 'previous_is_active'):
+                value = _status(value)
+            elif column in ('timestamp', 'tls_expires_at') and value is not None:
+                value = value.strftime("%Y-%m-%d %H:%M:%S")
+            elif value is None:
+                value = 'N/A' if column.endswith('response_info') else ''
+            values.append(value)
+        return values
+
+    def _json_values(self, row):
+        values = dict(zip(self.columns, row))
+        for column in ('timestamp', 'tls_expires_at'):
+            if values.get(column) is not None:
+                values[column] = values[column].strftime("%Y-%m-%d %H:%M:%S")
+        for column in ('ip_addresses', 'tls_sans'):
+            if column in values:
+                values[column] = values[column].split(',') if values[column] else []
+        return values
+
+    @staticmethod
+    def _drain(output):
+        data = output.getvalue()
+        output.seek(0)
+        output.truncate()
+        return data
+
+
+def gzip_chunks(chunks, level=6):
+    """Gzip a stream of text chunks on the fly
+
+    The first chunk is flushed straight away, so the download starts before
+    the rest of the export has been read.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    first = True
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if first:
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            first = False
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,226 @@
+import os
+import re
+import html
+import logging
+from datetime import datetime
+from urllib.parse import urljoin
+
+logger = logging.getLogger(__name__)
+
+# Bytes of the response body read for the page title; 0 keeps probes as HEAD requests
+DEFAULT_BODY_LIMIT = int(os.environ.get("SCANNER_FINGERPRINT_BYTES", 16384))
+
+# Result dict fields filled from a Fingerprint
+FIELDS = ('server', 'redirect_url', 'title', 'content_length', 'tls_common_name', 'tls_sans', 'tls_expires_at')
+
+# Column sizes; longer values are cut off
+MAX_TEXT_LENGTH = 255
+MAX_URL_LENGTH = 512
+MAX_CONTENT_LENGTH = 2 ** 63 - 1
+# Certificate names stored per result, all of them are used as candidates
+MAX_STORED_SANS = 20
+
+_TITLE = re.compile(rb'<title[^>]*>(.*?)</title', re.IGNORECASE | re.DOTALL)
+_CHARSET = re.compile(r'charset=["\']?([\w-]+)', re.IGNORECASE)
+
+# DER encoded OIDs of the subject common name and the subjectAltName extension
+_COMMON_NAME_OID = bytes.fromhex('550403')
+_SUBJECT_ALT_NAME_OID = bytes.fromhex('551d11')
+# DER tags
+_UTC_TIME = 0x17
+_VERSION = 0xa0
+_EXTENSIONS = 0xa3
+_DNS_NAME = 0x82
+
+
+class Certificate:
+    """The parts of a server certificate kept for a fingerprint"""
+
+    def __init__(self, common_name=None, sans=None, not_after=None):
+        self.common_name = common_name
+        self.sans = sans or []
+        self.not_after = not_after
+
+    def __repr__(self):
+        return f"<Certificate {self.common_name} ({len(self.sans)} names)>"
+
+
+def _read(data, offset=0):
+    """Read the DER element at offset and return (tag, value, offset after it)"""
+    tag = data[offset]
+    length = data[offset + 1]
+    offset += 2
+    if length & 0x80:
+        size = length & 0x7f
+        length = int.from_bytes(data[offset:offset + size], 'big')
+        offset += size
+    end = offset + length
+    if end > len(data):
+        raise ValueError("Truncated DER element")
+    return tag, data[offset:end], end
+
+
+def _children(data):
+    """Yield (tag, value) for the DER elements of a constructed value"""
+    offset = 0
+    while offset < len(data):
+        tag, value, offset = _read(data, offset)
+        yield tag, value
+
+
+def _parse_time(tag, value):
+    text = value.decode('ascii')
+    if tag == _UTC_TIME:
+        return datetime.strptime(text, '%y%m%d%H%M%SZ')
+    return datetime.strptime(text, '%Y%m%d%H%M%SZ')
+
+
+def _common_name(name):
+    for _tag, attributes in _children(name):
+        for _tag, attribute in _children(attributes):
+            (_tag, oid), (_tag, value) = list(_children(attribute))[:2]
+            if oid == _COMMON_NAME_OID:
+                return value.decode('utf-8', 'replace')
+    return None
+
+
+def _subject_alt_names(extensions):
+    _tag, extensions, _end = _read(extensions)
+    for _tag, extension in _children(extensions):
+        parts = list(_children(extension))
+        if parts[0][1] == _SUBJECT_ALT_NAME_OID:
+            # The extension value is an OCTET STRING holding the GeneralNames sequence
+            _tag, names, _end = _read(parts[-1][1])
+            return [value.decode('ascii', 'replace').lower() for tag, value in _children(names) if tag == _DNS_NAME]
+    return []
+
+
+def parse_certificate(der):
+    """Read the subject CN, DNS subjectAltNames and expiry of a DER certificate
+
+    The ssl module only decodes certificates it verified, and scans don't
+    verify them, so the few fields needed are read from the DER directly.
+    Returns None for a certificate that can't be read.
+    """
+    try:
+        _tag, certificate, _end = _read(der)
+        _tag, tbs, _end = _read(certificate)
+        fields = list(_children(tbs))
+        if fields[0][0] == _VERSION:
+            fields = fields[1:]
+        # serialNumber, signature, issuer, validity, subject, subjectPublicKeyInfo, then optional fields
+        validity, subject = fields[3][1], fields[4][1]
+        not_after = _parse_time(*list(_children(validity))[1])
+        sans = []
+        for tag, value in fields[6:]:
+            if tag == _EXTENSIONS:
+                sans = _subject_alt_names(value)
+        return Certificate(_common_name(subject), sans, not_after)
+    except (IndexError, ValueError) as e:
+        logger.debug(f"Could not parse certificate: {e}")
+        return None
+
+
+def extract_title(body, content_type=None):
+    """The text of the first <title> element in a (possibly partial) HTML body, or None"""
+    match = _TITLE.search(body)
+    if not match:
+        return None
+    charset = _CHARSET.search(content_type or '')
+    try:
+        text = match.group(1).decode(charset.group(1) if charset else 'utf-8', 'replace')
+    except LookupError:
+        text = match.group(1).decode('utf-8', 'replace')
+    title = ' '.join(html.unescape(text).split())
+    return title[:MAX_TEXT_LENGTH] or None
+
+
+def fingerprint_columns(result):
+    """ScanResult column values for the fingerprint fields of a result dict"""
+    expires_at = result.get('tls_expires_at')
+    return {
+        'server': result.get('server'),
+        'redirect_url': result.get('redirect_url'),
+        'title': result.get('title'),
+        'content_length': result.get('content_length'),
+        'tls_common_name': result.get('tls_common_name'),
+        'tls_sans': ','.join((result.get('tls_sans') or [])[:MAX_STORED_SANS]) or None,
+        'tls_expires_at': datetime.strptime(expires_at, "%Y-%m-%d %H:%M:%S") if expires_at else None,
+    }
+
+
+def certificate_hosts(names, domain):
+    """Host names from certificate names that belong to domain, wildcards reduced to their base"""
+    hosts = []
+    for name in names:
+        name = name.rstrip('.').lower()
+        if name.startswith('*.'):
+            name = name[2:]
+        if (name == domain or name.endswith('.' + domain)) and '*' not in name:
+            hosts.append(name)
+    return hosts
+
+
+class Fingerprint:
+    """What a probe learned about a host besides its status
+
+    Filled from the response headers, the first bytes of the body and the
+    server certificate, all from the probe's own request.
+    """
+
+    def __init__(self, server=None, redirect_url=None, title=None, content_length=None, certificate=None):
+        self.server = server
+        self.redirect_url = redirect_url
+        self.title = title
+        self.content_length = content_length
+        self.certificate = certificate
+
+    @classmethod
+    def from_response(cls, url, response, body=None, complete=False, certificate=None):
+        """Fingerprint of an http.client response to a request for url
+
+        body holds the bytes read of the response body, complete tells
+        whether that was all of it. certificate is the server's DER
+        certificate for HTTPS.
+        """
+        server = response.getheader('Server')
+        location = response.getheader('Location')
+        redirect_url = urljoin(url, location)[:MAX_URL_LENGTH] if location and 300 <= response.status < 400 else None
+        content_length = response.getheader('Content-Length')
+        try:
+            content_length = int(content_length) if content_length is not None else None
+        except ValueError:
+            content_length = None
+        # Anything a BIGINT column can't hold is not a real body size
+        if content_length is not None and not 0 <= content_length <= MAX_CONTENT_LENGTH:
+            content_length = None
+        if content_length is None and complete and body is not None:
+            content_length = len(body)
+        content_type = response.getheader('Content-Type')
+        title = None
+        if body and (content_type is None or 'html' in content_type.lower()):
+            title = extract_title(body, content_type)
+        return cls(
+            server=server[:MAX_TEXT_LENGTH] if server else None,
+            redirect_url=redirect_url,
+            title=title,
+            content_length=content_length,
+            certificate=parse_certificate(certificate) if certificate else None,
+        )
+
+    def to_dict(self):
+        """Result dict fields, see FIELDS"""
+        certificate = self.certificate
+        return {
+            'server': self.server,
+            'redirect_url': self.redirect_url,
+            'title': self.title,
+            'content_length': self.content_length,
+            'tls_common_name': certificate.common_name[:MAX_TEXT_LENGTH] if certificate and certificate.common_name else None,
+            'tls_sans': certificate.sans if certificate else [],
+            'tls_expires_at': certificate.not_after.strftime("%Y-%m-%d %H:%M:%S")
+                              if certificate and certificate.not_after else None,
+        }
+
+    def __repr__(self):
+        return f"<Fingerprint {self.server} {self.title!r}>"
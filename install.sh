@@ -212,7 +212,7 @@ fi
 cat > run.sh << EOF
 #!/bin/bash
 source venv/bin/activate
-gunicorn --bind 0.0.0.0:5003 main:app
+gunicorn --bind 0.0.0.0:5003 --workers 1 --threads 16 main:app
 EOF
 chmod +x run.sh
 
@@ -0,0 +1,154 @@
+import os
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_JOBS = int(os.environ.get("SCANNER_MAX_JOBS", 4))
+DEFAULT_KEEP_FINISHED = int(os.environ.get("SCANNER_KEEP_FINISHED_JOBS", 50))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class ScanJob:
+    """A single subdomain scan submitted to the job manager"""
+
+    def __init__(self, domain, scanner, options=None):
+        self.id = uuid.uuid4().hex
+        self.domain = domain
+        self.scanner = scanner
+        # Keyword arguments for scanner.scan_subdomains()
+        self.options = options or {}
+        self.state = QUEUED
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        # Signalled for every recorded result and when the job finishes
+        self._changed = threading.Condition()
+        scanner.on_result = self._notify
+
+    @property
+    def finished(self):
+        return self.state in (DONE, FAILED)
+
+    def to_dict(self):
+        """Job state and scan counters for the status API"""
+        scanner = self.scanner
+        return {
+            'job_id': self.id,
+            'domain': self.domain,
+            'state': self.state,
+            'scan_id': scanner.scan_id,
+            'scan_mode': scanner.scan_mode,
+            'base_scan_id': scanner.baseline.scan_id if scanner.baseline is not None else None,
+            'scan_in_progress': not self.finished,
+            'scan_completed': scanner.scan_completed,
+            'active_count': len(scanner.active_domains),
+            'inactive_count': len(scanner.inactive_domains),
+            'total_count': len(scanner.scan_results),
+            'ip_group_count': len(scanner.ip_groups),
+            'cache_hits': scanner.cache_hits,
+            'cache_misses': scanner.cache_misses,
+            'cache_hit_rate': round(scanner.cache_hit_rate, 3),
+            'error_message': scanner.error_message,
+            'created_at': self.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+            'started_at': self.started_at.strftime("%Y-%m-%d %H:%M:%S") if self.started_at else None,
+            'finished_at': self.finished_at.strftime("%Y-%m-%d %H:%M:%S") if self.finished_at else None,
+        }
+
+    def wait_for_results(self, seen, timeout):
+        """Return the results recorded after the first seen ones
+
+        Blocks for up to timeout seconds while there are none and the job is
+        still queued or running.
+        """
+        with self._changed:
+            if len(self.scanner.scan_results) <= seen and not self.finished:
+                self._changed.wait(timeout)
+            return self.scanner.scan_results[seen:]
+
+    def _notify(self, result=None):
+        with self._changed:
+            self._changed.notify_all()
+
+    def __repr__(self):
+        return f"<ScanJob {self.id} {self.domain} {self.state}>"
+
+
+class ScanJobManager:
+    """Runs scans on a bounded worker pool and keeps per-job results
+
+    Every job gets its own scanner instance, so concurrent scans never share
+    result lists. Scans beyond max_workers wait in the queue. Only the most
+    recent keep_finished finished jobs are kept in memory; their results stay
+    available in the database through the scan history.
+    """
+
+    def __init__(self, app, scanner_factory, max_workers=None, keep_finished=None):
+        self.app = app
+        self.scanner_factory = scanner_factory
+        self.keep_finished = keep_finished or DEFAULT_KEEP_FINISHED
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or DEFAULT_MAX_JOBS,
+                                            thread_name_prefix='scan-job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, domain, **options):
+        """Queue a scan for domain and return its ScanJob
+
+        Extra options are passed on to the scanner's scan_subdomains().
+        """
+        job = ScanJob(domain, self.scanner_factory(), options)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job)
+        logger.info(f"Queued scan job {job.id} for {domain}")
+        return job
+
+    def get(self, job_id):
+        """Return the job with the given ID or None"""
+        if not job_id:
+            return None
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        """All known jobs, oldest first"""
+        with self._lock:
+            return list(self._jobs.values())
+
+    def state_counts(self):
+        """Number of known jobs in each state"""
+        counts = dict.fromkeys((QUEUED, RUNNING, DONE, FAILED), 0)
+        for job in self.jobs():
+            counts[job.state] += 1
+        return counts
+
+    def _run(self, job):
+        job.state = RUNNING
+        job.started_at = datetime.now()
+        try:
+            # Scans save to the database, which needs an application context
+            with self.app.app_context():
+                success = job.scanner.scan_subdomains(job.domain, **job.options)
+            job.state = DONE if success else FAILED
+        except Exception:
+            logger.exception(f"Scan job {job.id} crashed")
+            job.state = FAILED
+        finally:
+            job.finished_at = datetime.now()
+            job._notify()
+            logger.info(f"Scan job {job.id} for {job.domain} finished: {job.state}")
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job_id]
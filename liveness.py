@@ -0,0 +1,310 @@
+import os
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Defaults can be overridden through the environment
+DEFAULT_CONCURRENCY = int(os.environ.get("SCANNER_CONCURRENCY", 32))
+DEFAULT_TIMEOUT = float(os.environ.get("SCANNER_TIMEOUT", 3))
+DEFAULT_DEADLINE = float(os.environ.get("SCANNER_DEADLINE", 0)) or None
+DEFAULT_PER_IP_CONCURRENCY = int(os.environ.get("SCANNER_PER_IP_CONCURRENCY", 4))
+DEFAULT_CONNECT_TIMEOUT = float(os.environ.get("SCANNER_CONNECT_TIMEOUT", 0)) or None
+DEFAULT_ADAPTIVE_TIMEOUT = os.environ.get("SCANNER_ADAPTIVE_TIMEOUT", "1").lower() not in ("0", "false", "no")
+DEFAULT_TIMEOUT_PERCENTILE = float(os.environ.get("SCANNER_TIMEOUT_PERCENTILE", 95))
+DEFAULT_TIMEOUT_MULTIPLIER = float(os.environ.get("SCANNER_TIMEOUT_MULTIPLIER", 3))
+DEFAULT_MIN_TIMEOUT = float(os.environ.get("SCANNER_MIN_TIMEOUT", 0.5))
+DEFAULT_RETRIES = int(os.environ.get("SCANNER_RETRIES", 2))
+DEFAULT_RETRY_BACKOFF = float(os.environ.get("SCANNER_RETRY_BACKOFF", 1))
+
+# Event kinds passed from the feeder thread and worker callbacks to bounded_imap
+_RESULT = 'result'
+_SKIPPED = 'skipped'
+_ERROR = 'error'
+_END = 'end'
+
+# Returned by next() on an exhausted iterator in KeyedLimiter.admit
+_EXHAUSTED = object()
+
+
+def bounded_imap(func, items, max_workers, deadline=None, on_skip=None):
+    """Apply func to every item on a worker pool and yield results as they complete
+
+    Items are pulled from the iterable by a feeder thread, so a slow source
+    (such as a running enumeration tool) never holds back results that are
+    already finished. Items are only submitted when a worker is free, which
+    keeps memory flat for very large inputs and means nothing sits queued past
+    the deadline. Results are yielded in
+    the calling thread in completion order. Once the optional ``deadline`` (a
+    ``time.monotonic()`` value) has passed no new work is submitted; remaining
+    items are handed to ``on_skip`` instead, whose return value is yielded in
+    their place. Skipped items are pulled no faster than the caller takes
+    them, so they don't pile up in memory either.
+    """
+    max_workers = max(1, max_workers)
+    slots = threading.BoundedSemaphore(max_workers)
+    # Skipped items waiting for the calling thread
+    skip_room = threading.BoundedSemaphore(max_workers)
+    events = queue.Queue()
+    stop = threading.Event()
+    counts = {'submitted': 0}
+
+    def _acquire_slot():
+        # Wait for a free slot, giving up when the scan stops or the deadline passes
+        while not stop.is_set():
+            wait_for = 0.5
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait_for = min(wait_for, remaining)
+            if slots.acquire(timeout=wait_for):
+                return True
+        return False
+
+    def _acquire_skip_room():
+        while not stop.is_set():
+            if skip_room.acquire(timeout=0.5):
+                return True
+        return False
+
+    def _on_done(future):
+        slots.release()
+        events.put((_RESULT, future))
+
+    def _feed(executor):
+        try:
+            for item in items:
+                if stop.is_set():
+                    break
+                if not _acquire_slot():
+                    if stop.is_set():
+                        break
+                    if on_skip is not None:
+                        if not _acquire_skip_room():
+                            break
+                        events.put((_SKIPPED, item))
+                    continue
+                counts['submitted'] += 1
+                executor.submit(func, item).add_done_callback(_on_done)
+        except BaseException as e:
+            events.put((_ERROR, e))
+        finally:
+            events.put((_END, None))
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    feeder = threading.Thread(target=_feed, args=(executor,), daemon=True)
+    feeder.start()
+    completed = 0
+    feeding = True
+    try:
+        while feeding or completed < counts['submitted']:
+            kind, value = events.get()
+            if kind is _RESULT:
+                completed += 1
+                yield value.result()
+            elif kind is _SKIPPED:
+                skip_room.release()
+                yield on_skip(value)
+            elif kind is _ERROR:
+                raise value
+            else:
+                feeding = False
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def percentile(values, percent):
+    """The percent-th percentile of a non-empty list of numbers, by nearest rank"""
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class AdaptiveTimeout:
+    """Connect and read timeouts that follow the latencies observed during a scan
+
+    Successful probes report how long connecting (TCP and TLS) and waiting
+    for the response took. Once min_samples probes have been observed, each
+    timeout is the given percentile of the recent times times multiplier,
+    kept between minimum and the configured ceiling. Before that, and when
+    adaptive timeouts are disabled, the ceilings apply. Dead hosts then cost
+    a few times the typical latency instead of the full timeout, and hosts
+    that time out are retried later with the ceilings.
+    """
+
+    def __init__(self, connect_ceiling, read_ceiling, enabled=None, percentile=None, multiplier=None,
+                 minimum=None, window=512, min_samples=20, refresh_every=16):
+        self.ceilings = (connect_ceiling, read_ceiling)
+        self.enabled = DEFAULT_ADAPTIVE_TIMEOUT if enabled is None else enabled
+        self.percentile = percentile or DEFAULT_TIMEOUT_PERCENTILE
+        self.multiplier = multiplier or DEFAULT_TIMEOUT_MULTIPLIER
+        self.minimum = DEFAULT_MIN_TIMEOUT if minimum is None else minimum
+        self.window = window
+        self.min_samples = min_samples
+        self.refresh_every = refresh_every
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget the observed latencies, e.g. at the start of a scan"""
+        with self._lock:
+            self._connect_times = deque(maxlen=self.window)
+            self._response_times = deque(maxlen=self.window)
+            self._pending = 0
+            self._current = self.ceilings
+
+    def observe(self, connect_time, response_time):
+        """Record the latencies of a probe that got a response; connect_time is None on a reused connection"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if connect_time is not None:
+                self._connect_times.append(connect_time)
+            if response_time is not None:
+                self._response_times.append(response_time)
+            self._pending += 1
+            # Sorting the window for every probe would be wasted work
+            if self._pending >= self.refresh_every:
+                self._pending = 0
+                self._current = (self._derive(self._connect_times, self.ceilings[0]),
+                                 self._derive(self._response_times, self.ceilings[1]))
+
+    def current(self):
+        """The (connect, read) timeouts to use for the next probe"""
+        return self._current
+
+    def _derive(self, samples, ceiling):
+        if len(samples) < self.min_samples:
+            return ceiling
+        return max(self.minimum, min(ceiling, percentile(samples, self.percentile) * self.multiplier))
+
+
+class LivenessEngine:
+    """Bounded-concurrency runner for per-host liveness checks"""
+
+    def __init__(self, concurrency=None, timeout=None, deadline=None, connect_timeout=None):
+        # concurrency - maximum number of hosts probed at the same time
+        # timeout - per-host read timeout ceiling in seconds
+        # connect_timeout - per-host connect timeout ceiling, defaults to timeout
+        # deadline - overall scan budget in seconds, None for no limit
+        self.concurrency = concurrency or DEFAULT_CONCURRENCY
+        self.timeout = timeout or DEFAULT_TIMEOUT
+        self.connect_timeout = connect_timeout or DEFAULT_CONNECT_TIMEOUT or self.timeout
+        self.deadline = deadline if deadline is not None else DEFAULT_DEADLINE
+        self.timeouts = AdaptiveTimeout(self.connect_timeout, self.timeout)
+
+    def run(self, hosts, check, on_skip=None, timeout=None, deadline=None):
+        """Run check(host, timeout) for every host and yield each result dict as it completes
+
+        timeout is a (connect, read) pair; by default each check gets the
+        adaptive timeouts current when it starts. deadline overrides the
+        engine's overall budget in seconds for this run. Hosts that could not
+        be started before the deadline are passed to on_skip(host) so the
+        caller still gets one result per host.
+        """
+        budget = deadline if deadline is not None else self.deadline
+        deadline = time.monotonic() + budget if budget else None
+
+        logger.debug(f"Starting liveness checks with concurrency={self.concurrency}, "
+                     f"timeout={timeout or self.timeouts.current()}, deadline={budget}")
+
+        def _check(host):
+            return check(host, timeout or self.timeouts.current())
+
+        yield from bounded_imap(_check, hosts, self.concurrency, deadline=deadline, on_skip=on_skip)
+
+
+class KeyedLimiter:
+    """Limits how many items of the same key are worked on at the same time
+
+    Used to cap concurrent probes per resolved IP, so hosts behind one CDN
+    edge or load balancer don't all hit it at once. Instead of blocking a
+    worker thread until a busy key has a free slot, admit() reorders the
+    work: items whose key is at its limit are held back and handed out as
+    soon as one of its slots is released, and items of other keys go ahead
+    meanwhile.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        # key -> slots taken
+        self._taken = {}
+        self._released = threading.Condition()
+        self._closed = False
+
+    def try_acquire(self, key):
+        """Take one of the key's slots if one is free, returning whether it was taken"""
+        with self._released:
+            if self._taken.get(key, 0) >= self.limit:
+                return False
+            self._taken[key] = self._taken.get(key, 0) + 1
+            return True
+
+    def release(self, key):
+        """Give back a slot taken by try_acquire() or admit()"""
+        with self._released:
+            self._taken[key] -= 1
+            if not self._taken[key]:
+                del self._taken[key]
+            self._released.notify_all()
+
+    def close(self):
+        """Make admit() stop, e.g. once its consumer gave up on the remaining items
+
+        Slots of items the consumer won't finish are never released, so
+        without this admit() would wait for them forever.
+        """
+        with self._released:
+            self._closed = True
+            self._released.notify_all()
+
+    def admit(self, items, key):
+        """Yield the items, each only once a slot of its key(item) was taken for it
+
+        The consumer gives the slot back with release(key(item)) when done
+        with the item. Held back items are handed out before new ones are
+        read from items. Items whose key is None pass straight through.
+        Stops early once close() is called.
+        """
+        held = {}
+        source = iter(items)
+        exhausted = False
+        while not self._closed:
+            item = self._take_held(held)
+            if item is not None:
+                yield item
+                continue
+            if not exhausted:
+                item = next(source, _EXHAUSTED)
+                if item is _EXHAUSTED:
+                    exhausted = True
+                    continue
+                item_key = key(item)
+                if item_key is None or self.try_acquire(item_key):
+                    yield item
+                else:
+                    held.setdefault(item_key, deque()).append(item)
+                continue
+            if not held:
+                return
+            with self._released:
+                while not self._closed and not any(self._taken.get(item_key, 0) < self.limit
+                                                   for item_key in held):
+                    self._released.wait()
+
+    def _take_held(self, held):
+        """A held back item whose key now has a free slot, with the slot taken, or None"""
+        for item_key in list(held):
+            if self.try_acquire(item_key):
+                waiting = held[item_key]
+                item = waiting.popleft()
+                if not waiting:
+                    del held[item_key]
+                return item
+        return None
@@ -1,4 +1,12 @@
-from app import app
+import os
+
+from app import app, start_scheduler
 
 if __name__ == "__main__":
+    # The debug reloader runs this file in a watching process and a serving child
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_scheduler()
     app.run(host="0.0.0.0", port=5003, debug=True)
+else:
+    # Served by gunicorn as main:app
+    start_scheduler()
@@ -0,0 +1,260 @@
+import os
+import json
+import time
+import bisect
+import threading
+
+# Metrics are on unless SCANNER_METRICS is 0; when off every update returns straight away
+ENABLED = os.environ.get("SCANNER_METRICS", "1").lower() not in ("0", "false", "no")
+
+# Histogram buckets in seconds, from a fast DNS answer to a long enumeration
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+# Scan stages with timings, in the order they happen
+STAGES = ('enumeration', 'dns', 'connect', 'tls', 'first_byte', 'db_save')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base class of the metric types, one time series per combination of label values"""
+
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def samples(self):
+        """Yield (suffix, label values, extra label, value) for the exposition format"""
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in sorted(items):
+            yield '', label_values, None, value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, label_values, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labels, label_values, extra)} {_format_value(value)}")
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *label_values, amount=1):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+
+class Gauge(Metric):
+    """A value that goes up and down, or is read from a function when scraped"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._function = None
+
+    def inc(self, *label_values, amount=1):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+    def set_function(self, function):
+        """Read the gauge from function() when scraped; it returns {label value or tuple: value}"""
+        self._function = function
+
+    def samples(self):
+        if self._function is None:
+            yield from super().samples()
+            return
+        for label_values, value in sorted(self._function().items()):
+            if not isinstance(label_values, tuple):
+                label_values = (label_values,)
+            yield '', label_values, None, value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=STAGE_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        if not ENABLED:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), then the sum
+                series = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(label_values, list(series)) for label_values, series in self._values.items()]
+        for label_values, series in sorted(items):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                yield '_bucket', label_values, f'le="{_format_value(bound)}"', cumulative
+            yield '_sum', label_values, None, series[-1]
+            yield '_count', label_values, None, cumulative
+
+
+class Registry:
+    """The metrics served on /metrics"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        return '\n'.join(metric.render() for metric in self.metrics) + '\n'
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'scanner_stage_seconds', 'Time spent in each scan stage, per host or per scan for enumeration', ('stage',)))
+PROBES = REGISTRY.register(Counter('scanner_probes_total', 'HTTP probes sent, by outcome', ('outcome',)))
+PROBE_ERRORS = REGISTRY.register(Counter(
+    'scanner_probe_errors_total', 'HTTP probes without a response, by error class', ('error',)))
+PROBES_IN_FLIGHT = REGISTRY.register(Gauge('scanner_probes_in_flight', 'HTTP probes currently running'))
+RETRY_QUEUE = REGISTRY.register(Gauge(
+    'scanner_retry_queue_depth', 'Hosts held back to be probed again at the end of a scan'))
+SCANS = REGISTRY.register(Counter('scanner_scans_total', 'Finished scans, by outcome', ('outcome',)))
+JOBS = REGISTRY.register(Gauge('scanner_jobs', 'Scan jobs known to the web application, by state', ('state',)))
+
+
+class ScanProfile:
+    """Where the time of one scan went: per-stage totals, probe counts and error classes
+
+    Every observation also feeds the process-wide metrics. The profile is
+    saved with the scan as JSON, see to_dict().
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.finished = None
+        # stage -> [count, total seconds, max seconds]
+        self.stages = {}
+        self.probes = 0
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        STAGE_SECONDS.observe(seconds, stage)
+        with self._lock:
+            totals = self.stages.get(stage)
+            if totals is None:
+                self.stages[stage] = [1, seconds, seconds]
+            else:
+                totals[0] += 1
+                totals[1] += seconds
+                if seconds > totals[2]:
+                    totals[2] = seconds
+
+    def timed(self, stage, iterable):
+        """Pass on the items of iterable, observing the time until it is exhausted or closed"""
+        started = time.monotonic()
+        try:
+            yield from iterable
+        finally:
+            self.observe(stage, time.monotonic() - started)
+
+    def probe(self, result):
+        """Record a ProbeResult: its outcome, error class and connect, TLS and first byte times"""
+        PROBES.inc('active' if result.is_active else 'inactive')
+        with self._lock:
+            self.probes += 1
+            if result.error_type:
+                self.errors[result.error_type] = self.errors.get(result.error_type, 0) + 1
+        if result.error_type:
+            PROBE_ERRORS.inc(result.error_type)
+        if result.connect_time is not None:
+            tls_time = result.tls_time or 0.0
+            self.observe('connect', result.connect_time - tls_time)
+            if result.tls_time is not None:
+                self.observe('tls', tls_time)
+        if result.response_time is not None:
+            self.observe('first_byte', result.response_time)
+
+    def finish(self, success):
+        self.finished = time.monotonic()
+        SCANS.inc('success' if success else 'failure')
+
+    def to_dict(self):
+        duration = (self.finished or time.monotonic()) - self.started
+        with self._lock:
+            stages = {
+                stage: {'count': count, 'total': round(total, 4), 'mean': round(total / count, 4), 'max': round(most, 4)}
+                for stage, (count, total, most) in self.stages.items()
+            }
+            errors = dict(self.errors)
+            probes = self.probes
+        return {
+            'duration': round(duration, 3),
+            'probes': probes,
+            'probes_per_second': round(probes / duration, 2) if duration else 0.0,
+            'stages': {stage: stages[stage] for stage in STAGES if stage in stages},
+            'errors': errors,
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), separators=(',', ':'))
+
+
+class _DisabledProfile(ScanProfile):
+    """Stand-in used when metrics are off, every method does nothing"""
+
+    def observe(self, stage, seconds):
+        pass
+
+    def timed(self, stage, iterable):
+        return iterable
+
+    def probe(self, result):
+        pass
+
+    def finish(self, success):
+        pass
+
+    def to_json(self):
+        return None
+
+
+def new_profile():
+    """A ScanProfile for a new scan, or a no-op one when metrics are disabled"""
+    return ScanProfile() if ENABLED else _DisabledProfile()
@@ -1,32 +1,309 @@
+import re
+import json
 from datetime import datetime
-from database import db
+import sqlalchemy as sa
+from sqlalchemy import insert, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import relationship
+from storage import Base
 
-class ScanHistory(db.Model):
+class ScanHistory(Base):
     __tablename__ = 'scan_history'
+    __table_args__ = (
+        # Finds the latest scan of a domain, the baseline for differential scans
+        sa.Index('ix_scan_history_domain_timestamp', 'domain', 'timestamp'),
+        # The history page lists scans newest first
+        sa.Index('ix_scan_history_timestamp', 'timestamp'),
+    )
     
-    id = db.Column(db.Integer, primary_key=True)
-    domain = db.Column(db.String(255), nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-    active_count = db.Column(db.Integer, default=0)
-    inactive_count = db.Column(db.Integer, default=0)
-    total_count = db.Column(db.Integer, default=0)
+    id = sa.Column(sa.Integer, primary_key=True)
+    domain = sa.Column(sa.String(255), nullable=False)
+    timestamp = sa.Column(sa.DateTime, default=datetime.utcnow)
+    active_count = sa.Column(sa.Integer, default=0)
+    inactive_count = sa.Column(sa.Integer, default=0)
+    total_count = sa.Column(sa.Integer, default=0)
+    # 'full' scans store every result, 'diff' scans only the changes against base_scan_id
+    scan_mode = sa.Column(sa.String(16), nullable=True, default='full')
+    base_scan_id = sa.Column(sa.Integer, sa.ForeignKey('scan_history.id', ondelete='SET NULL'), nullable=True)
+    new_count = sa.Column(sa.Integer, nullable=True)
+    disappeared_count = sa.Column(sa.Integer, nullable=True)
+    changed_count = sa.Column(sa.Integer, nullable=True)
+    # JSON timings of the scan's stages, see metrics.ScanProfile
+    profile = sa.Column(sa.Text, nullable=True)
     
     # One-to-many relationship with ScanResult
-    results = db.relationship('ScanResult', backref='scan', cascade='all, delete-orphan')
+    results = relationship('ScanResult', backref='scan', cascade='all, delete-orphan')
+    # Changes recorded by a differential scan
+    changes = relationship('ScanChange', backref='scan', cascade='all, delete-orphan')
+    
+    @property
+    def is_diff(self):
+        return self.scan_mode == 'diff'
+    
+    @property
+    def profile_data(self):
+        """The scan's stage timings as a dict, or None for scans saved without metrics"""
+        return json.loads(self.profile) if self.profile else None
+    
+    def to_dict(self):
+        """Scan summary for the JSON API"""
+        return {
+            'scan_id': self.id,
+            'domain': self.domain,
+            'timestamp': self.timestamp.strftime("%Y-%m-%d %H:%M:%S") if self.timestamp else None,
+            'scan_mode': self.scan_mode or 'full',
+            'base_scan_id': self.base_scan_id,
+            'active_count': self.active_count,
+            'inactive_count': self.inactive_count,
+            'total_count': self.total_count,
+            'new_count': self.new_count,
+            'disappeared_count': self.disappeared_count,
+            'changed_count': self.changed_count,
+        }
     
     def __repr__(self):
         return f"<ScanHistory {self.domain} ({self.timestamp})>"
 
 
-class ScanResult(db.Model):
+class ResponseInfo(Base):
+    """Lookup table for response status lines, which repeat across millions of results"""
+    __tablename__ = 'response_infos'
+    
+    id = sa.Column(sa.Integer, primary_key=True)
+    text = sa.Column(sa.Text, nullable=False, unique=True)
+    # Status code parsed from the text, for filtering; empty when there was no HTTP response
+    status_code = sa.Column(sa.Integer, nullable=True, index=True)
+    
+    @staticmethod
+    def parse_status_code(text):
+        """Extract the status code from a status line such as 'HTTP/1.1 200 OK'"""
+        match = re.match(r'HTTP/\d(?:\.\d)? (\d{3})', text or '')
+        return int(match.group(1)) if match else None
+    
+    @classmethod
+    def ids_for(cls, session, texts, attempts=5):
+        """Map response texts to their lookup IDs, adding the ones not stored yet
+
+        Concurrent scans and workers add the same new texts at the same
+        time. On PostgreSQL and SQLite their duplicates are skipped with ON
+        CONFLICT DO NOTHING; on other databases a conflicting insert is rolled
+        back and retried for the texts still missing. Raises RuntimeError if
+        some texts still have no ID after that.
+        """
+        texts = {text for text in texts if text is not None}
+        if not texts:
+            return {}
+        ids = cls._lookup(session, texts)
+        for _attempt in range(attempts):
+            missing = texts - ids.keys()
+            if not missing:
+                return ids
+            try:
+                session.execute(cls._insert_new(session), [{'text': text, 'status_code': cls.parse_status_code(text)}
+                                                           for text in missing])
+                session.commit()
+            except IntegrityError:
+                # Another scan added some of them at the same time
+                session.rollback()
+            ids.update(cls._lookup(session, missing))
+        missing = texts - ids.keys()
+        if missing:
+            raise RuntimeError(f"Could not store {len(missing)} response texts")
+        return ids
+    
+    @classmethod
+    def _lookup(cls, session, texts):
+        return dict(session.execute(select(cls.text, cls.id).where(cls.text.in_(texts))).all())
+    
+    @classmethod
+    def _insert_new(cls, session):
+        """INSERT statement for texts that skips the ones already stored where the database supports it"""
+        dialect = session.get_bind().dialect.name
+        if dialect == 'postgresql':
+            return postgresql_insert(cls).on_conflict_do_nothing(index_elements=['text'])
+        if dialect == 'sqlite':
+            return sqlite_insert(cls).on_conflict_do_nothing(index_elements=['text'])
+        return insert(cls)
+    
+    def __repr__(self):
+        return f"<ResponseInfo {self.text}>"
+
+
+class ScanResult(Base):
     __tablename__ = 'scan_results'
+    __table_args__ = (
+        # Result pages filter one scan's results by status
+        sa.Index('ix_scan_results_scan_id_is_active', 'scan_id', 'is_active'),
+        # Result pages list one scan's results by name
+        sa.Index('ix_scan_results_scan_id_subdomain', 'scan_id', 'subdomain'),
+        # History of a single subdomain across scans
+        sa.Index('ix_scan_results_subdomain_timestamp', 'subdomain', 'timestamp'),
+    )
+    
+    id = sa.Column(sa.Integer, primary_key=True)
+    scan_id = sa.Column(sa.Integer, sa.ForeignKey('scan_history.id'), nullable=False)
+    subdomain = sa.Column(sa.String(255), nullable=False)
+    is_active = sa.Column(sa.Boolean, default=False)
+    response_info_id = sa.Column(sa.Integer, sa.ForeignKey('response_infos.id'), nullable=True)
+    # Comma-separated addresses from the DNS pre-filter
+    ip_addresses = sa.Column(sa.Text, nullable=True)
+    timestamp = sa.Column(sa.DateTime, default=datetime.utcnow)
+    # Fingerprint from the probe's response, see fingerprint.Fingerprint
+    server = sa.Column(sa.String(255), nullable=True)
+    redirect_url = sa.Column(sa.String(512), nullable=True)
+    title = sa.Column(sa.String(255), nullable=True)
+    content_length = sa.Column(sa.BigInteger, nullable=True)
+    tls_common_name = sa.Column(sa.String(255), nullable=True)
+    # Comma-separated DNS names of the certificate, the first fingerprint.MAX_STORED_SANS of them
+    tls_sans = sa.Column(sa.Text, nullable=True)
+    tls_expires_at = sa.Column(sa.DateTime, nullable=True)
+    
+    response = relationship('ResponseInfo', lazy='joined')
+    
+    @property
+    def response_info(self):
+        return self.response.text if self.response else None
+    
+    def to_dict(self):
+        """Result row for the JSON API"""
+        return {
+            'subdomain': self.subdomain,
+            'is_active': self.is_active,
+            'response_info': self.response_info,
+            'status_code': self.response.status_code if self.response else None,
+            'ip_addresses': self.ip_addresses.split(',') if self.ip_addresses else [],
+            'timestamp': self.timestamp.strftime("%Y-%m-%d %H:%M:%S") if self.timestamp else None,
+            'server': self.server,
+            'redirect_url': self.redirect_url,
+            'title': self.title,
+            'content_length': self.content_length,
+            'tls_common_name': self.tls_common_name,
+            'tls_sans': self.tls_sans.split(',') if self.tls_sans else [],
+            'tls_expires_at': self.tls_expires_at.strftime("%Y-%m-%d %H:%M:%S") if self.tls_expires_at else None,
+        }
+    
+    def __repr__(self):
+        return f"<ScanResult {self.subdomain} {'active' if self.is_active else 'inactive'}>"
+
+
+class ScanChange(Base):
+    __tablename__ = 'scan_changes'
+    
+    NEW = 'new'
+    DISAPPEARED = 'disappeared'
+    STATUS_CHANGED = 'status_changed'
+    
+    id = sa.Column(sa.Integer, primary_key=True)
+    scan_id = sa.Column(sa.Integer, sa.ForeignKey('scan_history.id'), nullable=False, index=True)
+    subdomain = sa.Column(sa.String(255), nullable=False)
+    change_type = sa.Column(sa.String(16), nullable=False)
+    # Current state; empty for disappeared subdomains
+    is_active = sa.Column(sa.Boolean, nullable=True)
+    response_info = sa.Column(sa.Text, nullable=True)
+    # State before this scan; empty for new subdomains
+    previous_is_active = sa.Column(sa.Boolean, nullable=True)
+    previous_response_info = sa.Column(sa.Text, nullable=True)
+    timestamp = sa.Column(sa.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<ScanChange {self.subdomain} {self.change_type}>"
+
+
+class ScanSchedule(Base):
+    """A domain scanned again every interval_minutes by the scheduler"""
+    __tablename__ = 'scan_schedules'
+    __table_args__ = (
+        # The scheduler looks for enabled schedules that are due
+        sa.Index('ix_scan_schedules_enabled_next_run_at', 'enabled', 'next_run_at'),
+    )
+    
+    id = sa.Column(sa.Integer, primary_key=True)
+    domain = sa.Column(sa.String(255), nullable=False, unique=True)
+    interval_minutes = sa.Column(sa.Integer, nullable=False)
+    # Each run is moved by up to this many minutes either way
+    jitter_minutes = sa.Column(sa.Integer, nullable=False, default=0)
+    # 'full' or 'diff', as on the scan form
+    scan_mode = sa.Column(sa.String(16), nullable=False, default='full')
+    enabled = sa.Column(sa.Boolean, nullable=False, default=True)
+    next_run_at = sa.Column(sa.DateTime, nullable=False)
+    last_run_at = sa.Column(sa.DateTime, nullable=True)
+    created_at = sa.Column(sa.DateTime, default=datetime.utcnow)
+    
+    runs = relationship('ScheduledRun', backref='schedule', cascade='all, delete-orphan',
+                        order_by='ScheduledRun.id.desc()', lazy='dynamic')
+    
+    def to_dict(self):
+        """Schedule for the JSON API"""
+        return {
+            'schedule_id': self.id,
+            'domain': self.domain,
+            'interval_minutes': self.interval_minutes,
+            'jitter_minutes': self.jitter_minutes,
+            'scan_mode': self.scan_mode,
+            'enabled': self.enabled,
+            'next_run_at': self.next_run_at.strftime("%Y-%m-%d %H:%M:%S") if self.next_run_at else None,
+            'last_run_at': self.last_run_at.strftime("%Y-%m-%d %H:%M:%S") if self.last_run_at else None,
+        }
+    
+    def __repr__(self):
+        return f"<ScanSchedule {self.domain} every {self.interval_minutes}m>"
+
+
+class ScheduledRun(Base):
+    """One scan started by the scheduler, linked to its ScanHistory record once saved"""
+    __tablename__ = 'scheduled_runs'
+    
+    QUEUED = 'queued'
+    DONE = 'done'
+    FAILED = 'failed'
+    # The process running the scan stopped before it finished
+    LOST = 'lost'
+    
+    id = sa.Column(sa.Integer, primary_key=True)
+    schedule_id = sa.Column(sa.Integer, sa.ForeignKey('scan_schedules.id', ondelete='CASCADE'), nullable=False, index=True)
+    job_id = sa.Column(sa.String(32), nullable=True)
+    scan_id = sa.Column(sa.Integer, sa.ForeignKey('scan_history.id', ondelete='SET NULL'), nullable=True)
+    status = sa.Column(sa.String(16), nullable=False, default=QUEUED, index=True)
+    started_at = sa.Column(sa.DateTime, default=datetime.utcnow)
+    finished_at = sa.Column(sa.DateTime, nullable=True)
+    # Scheduler process running the scan, and its latest sign of life while the scan runs
+    owner = sa.Column(sa.String(128), nullable=True)
+    heartbeat_at = sa.Column(sa.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f"<ScheduledRun {self.schedule_id} {self.status}>"
+
+
+class ScanTask(Base):
+    """A batch of resolved hosts of one scan, waiting for a worker to probe them, see workqueue.WorkQueue"""
+    __tablename__ = 'scan_tasks'
+    __table_args__ = (
+        # Workers claim the oldest pending (or stale claimed) task
+        sa.Index('ix_scan_tasks_status_id', 'status', 'id'),
+    )
+    
+    PENDING = 'pending'
+    CLAIMED = 'claimed'
+    DONE = 'done'
+    # Claimed and abandoned more often than the queue allows
+    FAILED = 'failed'
     
-    id = db.Column(db.Integer, primary_key=True)
-    scan_id = db.Column(db.Integer, db.ForeignKey('scan_history.id'), nullable=False)
-    subdomain = db.Column(db.String(255), nullable=False)
-    is_active = db.Column(db.Boolean, default=False)
-    response_info = db.Column(db.Text, nullable=True)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    id = sa.Column(sa.Integer, primary_key=True)
+    scan_id = sa.Column(sa.Integer, sa.ForeignKey('scan_history.id', ondelete='CASCADE'), nullable=False, index=True)
+    # Apex domain of the scan
+    domain = sa.Column(sa.String(255), nullable=False)
+    # JSON list of [host, DNS status, addresses]
+    payload = sa.Column(sa.Text, nullable=False)
+    size = sa.Column(sa.Integer, nullable=False)
+    status = sa.Column(sa.String(16), nullable=False, default=PENDING)
+    worker_id = sa.Column(sa.String(128), nullable=True)
+    attempts = sa.Column(sa.Integer, nullable=False, default=0)
+    claimed_at = sa.Column(sa.DateTime, nullable=True)
+    # Refreshed by the worker while it works on the task; a stale one means the worker is gone
+    heartbeat_at = sa.Column(sa.DateTime, nullable=True)
+    finished_at = sa.Column(sa.DateTime, nullable=True)
     
     def __repr__(self):
-        return f"<ScanResult {self.subdomain} {'active' if self.is_active else 'inactive'}>"
\ No newline at end of file
+        return f"<ScanTask {self.id} of scan {self.scan_id} {self.status}>"
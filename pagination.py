@@ -0,0 +1,208 @@
+import os
+import json
+import base64
+import binascii
+from datetime import datetime
+
+from sqlalchemy import and_, func, or_, select
+
+from models import ScanHistory, ScanResult, ResponseInfo
+
+DEFAULT_PAGE_SIZE = int(os.environ.get("SCANNER_PAGE_SIZE", 50))
+MAX_PAGE_SIZE = 500
+
+
+class InvalidQuery(ValueError):
+    """A page request with a malformed cursor, filter or sort"""
+
+
+class SortKey:
+    """A column pages can be ordered by
+
+    Nullable columns get a null_value, so rows without a value still sort and
+    compare consistently in the keyset condition.
+    """
+
+    def __init__(self, column, descending=False, null_value=None):
+        self.column = column
+        self.descending = descending
+        self.null_value = null_value
+
+    @property
+    def expression(self):
+        if self.null_value is None:
+            return self.column
+        return func.coalesce(self.column, self.null_value)
+
+    def value_of(self, item):
+        value = getattr(item, self.column.key)
+        return self.null_value if value is None else value
+
+
+HISTORY_SORTS = {
+    'timestamp': SortKey(ScanHistory.timestamp, descending=True),
+    'domain': SortKey(ScanHistory.domain),
+    'total': SortKey(ScanHistory.total_count, descending=True, null_value=0),
+    'active': SortKey(ScanHistory.active_count, descending=True, null_value=0),
+}
+
+RESULT_SORTS = {
+    'subdomain': SortKey(ScanResult.subdomain),
+    'timestamp': SortKey(ScanResult.timestamp, descending=True),
+}
+
+
+class Page:
+    """One page of rows plus the cursors of its neighbours"""
+
+    def __init__(self, items, next_cursor, prev_cursor, limit):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.limit = limit
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(sort_name, value, row_id):
+    if isinstance(value, datetime):
+        value = {'dt': value.isoformat()}
+    raw = json.dumps([sort_name, value, row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort_name):
+    """Return the (sort value, row id) a cursor points at"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        name, value, row_id = json.loads(raw)
+        if isinstance(value, dict):
+            value = datetime.fromisoformat(value['dt'])
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise InvalidQuery("Invalid page cursor")
+    if name != sort_name or not isinstance(row_id, int):
+        raise InvalidQuery("Page cursor does not match the sort order")
+    return value, row_id
+
+
+def page_size(limit):
+    """Clamp a requested page size to 1..MAX_PAGE_SIZE"""
+    try:
+        limit = int(limit) if limit else DEFAULT_PAGE_SIZE
+    except ValueError:
+        raise InvalidQuery("Invalid page size")
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def paginate(session, query, id_column, sorts, sort_name=None, order=None, limit=None, after=None, before=None):
+    """Fetch one page of query, a select() of one model, with keyset pagination
+
+    Rows are ordered by the chosen sort key with the primary key as tie
+    breaker, and a page continues from the row its cursor points at instead
+    of skipping an OFFSET, so every page costs about the same to fetch.
+    after pages forward, before pages backward.
+    """
+    sort_name = sort_name or next(iter(sorts))
+    if sort_name not in sorts:
+        raise InvalidQuery(f"Unknown sort: {sort_name}")
+    sort = sorts[sort_name]
+    if order not in (None, '', 'asc', 'desc'):
+        raise InvalidQuery(f"Unknown order: {order}")
+    descending = sort.descending if not order else order == 'desc'
+    limit = page_size(limit)
+
+    backwards = bool(before)
+    cursor = before if backwards else after
+    # Going backwards reads the preceding rows in reverse order
+    reverse = descending != backwards
+    expression = sort.expression
+    if cursor:
+        value, row_id = decode_cursor(cursor, sort_name)
+        if reverse:
+            query = query.filter(or_(expression < value, and_(expression == value, id_column < row_id)))
+        else:
+            query = query.filter(or_(expression > value, and_(expression == value, id_column > row_id)))
+    if reverse:
+        query = query.order_by(expression.desc(), id_column.desc())
+    else:
+        query = query.order_by(expression.asc(), id_column.asc())
+
+    items = session.scalars(query.limit(limit + 1)).all()
+    has_more = len(items) > limit
+    items = items[:limit]
+    if backwards:
+        items.reverse()
+
+    def cursor_for(item):
+        return encode_cursor(sort_name, sort.value_of(item), getattr(item, id_column.key))
+
+    if not items:
+        return Page(items, None, None, limit)
+    if backwards:
+        return Page(items, cursor_for(items[-1]), cursor_for(items[0]) if has_more else None, limit)
+    return Page(items, cursor_for(items[-1]) if has_more else None, cursor_for(items[0]) if after else None, limit)
+
+
+def parse_status_code_filter(code):
+    """Turn '404' or '4xx' into an inclusive (low, high) status code range"""
+    code = (code or '').strip().lower()
+    if not code:
+        return None
+    if len(code) == 3 and code[0].isdigit() and code[1:] == 'xx':
+        low = int(code[0]) * 100
+        return low, low + 99
+    if code.isdigit() and len(code) == 3:
+        return int(code), int(code)
+    raise InvalidQuery(f"Invalid response code filter: {code}")
+
+
+def history_page(session, args):
+    """Page of ScanHistory records for the request arguments
+
+    Supported arguments: domain (exact match), mode (full or diff), sort,
+    order, limit, after and before.
+    """
+    query = select(ScanHistory)
+    domain = (args.get('domain') or '').strip()
+    if domain:
+        query = query.filter(ScanHistory.domain == domain)
+    mode = args.get('mode')
+    if mode == 'diff':
+        query = query.filter(ScanHistory.scan_mode == 'diff')
+    elif mode == 'full':
+        query = query.filter(func.coalesce(ScanHistory.scan_mode, 'full') == 'full')
+    elif mode:
+        raise InvalidQuery(f"Unknown scan mode: {mode}")
+    return paginate(session, query, ScanHistory.id, HISTORY_SORTS, args.get('sort'), args.get('order'),
+                    args.get('limit'), args.get('after'), args.get('before'))
+
+
+def results_page(session, scan_id, args):
+    """Page of one scan's ScanResult records for the request arguments
+
+    Supported arguments: status (active or inactive), code (e.g. 200 or 4xx),
+    q (subdomain substring), sort, order, limit, after and before.
+    """
+    query = select(ScanResult).filter(ScanResult.scan_id == scan_id)
+    status = args.get('status')
+    if status == 'active':
+        query = query.filter_by(is_active=True)
+    elif status == 'inactive':
+        query = query.filter_by(is_active=False)
+    elif status not in (None, '', 'all'):
+        raise InvalidQuery(f"Unknown status: {status}")
+    code_range = parse_status_code_filter(args.get('code'))
+    if code_range:
+        # The lookup table is tiny, matching its IDs avoids joining every result
+        query = query.filter(ScanResult.response_info_id.in_(
+            select(ResponseInfo.id).where(ResponseInfo.status_code.between(*code_range))
+        ))
+    search = (args.get('q') or '').strip().lower()
+    if search:
+        query = query.filter(ScanResult.subdomain.contains(search, autoescape=True))
+    return paginate(session, query, ScanResult.id, RESULT_SORTS, args.get('sort'), args.get('order'),
+                    args.get('limit'), args.get('after'), args.get('before'))
@@ -0,0 +1,303 @@
+import os
+import time
+import logging
+from datetime import datetime
+
+from sqlalchemy import func, insert, select, update
+
+from models import ScanHistory, ScanResult, ScanChange, ResponseInfo
+from fingerprint import fingerprint_columns
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = int(os.environ.get("SCANNER_DB_BATCH_SIZE", 500))
+
+
+def result_row(scan_id, result):
+    """scan_results row for a result dict, with the response text still inline"""
+    return {
+        'scan_id': scan_id,
+        'subdomain': result['domain'],
+        'is_active': result['is_active'],
+        # Swapped for response_info_id by with_response_ids()
+        'response_info': result['response_info'],
+        'ip_addresses': ','.join(result.get('ip_addresses') or []) or None,
+        'timestamp': result.get('checked_at') or datetime.now(),
+        **fingerprint_columns(result),
+    }
+
+
+def with_response_ids(session, rows):
+    """Replace the response texts of result rows with their lookup table IDs"""
+    ids = ResponseInfo.ids_for(session, {row['response_info'] for row in rows})
+    prepared = []
+    for row in rows:
+        row = dict(row)
+        row['response_info_id'] = ids.get(row.pop('response_info'))
+        prepared.append(row)
+    return prepared
+
+
+class ResultWriter:
+    """Persists scan results in batches while a scan is running
+
+    The ScanHistory record is created with the first result, results are bulk
+    inserted and committed every batch_size rows, and the history counters are
+    filled in by finish(). A crash mid-scan therefore only loses the current
+    batch. Database errors are logged and disable the writer instead of
+    failing the scan, the results stay available in memory. With a
+    metrics.ScanProfile, every flush is timed as the db_save stage and the
+    profile is stored on the ScanHistory record by finish().
+    """
+
+    # Table the rows from _row() are inserted into
+    table = ScanResult
+
+    def __init__(self, session, domain, batch_size=None, profile=None):
+        self.session = session
+        self.domain = domain
+        self.batch_size = batch_size or DEFAULT_BATCH_SIZE
+        self.profile = profile
+        self.scan_id = None
+        self.active_count = 0
+        self.inactive_count = 0
+        self.failed = False
+        self._rows = []
+
+    def start(self):
+        """Create the ScanHistory record for this scan and return its ID"""
+        try:
+            scan_history = ScanHistory(domain=self.domain, **self._history_fields())
+            self.session.add(scan_history)
+            self.session.commit()
+            self.scan_id = scan_history.id
+        except Exception:
+            self._fail("Error creating scan history record")
+        return self.scan_id
+
+    def add(self, result):
+        """Queue a result dict, flushing a batch to the database when full"""
+        if result['is_active']:
+            self.active_count += 1
+        else:
+            self.inactive_count += 1
+
+        if self.failed:
+            return
+        if self.scan_id is None and self.start() is None:
+            return
+        row = self._row(result)
+        if row is not None:
+            self._rows.append(row)
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Bulk insert and commit the queued rows"""
+        if self.failed or not self._rows:
+            return
+        started = time.monotonic()
+        try:
+            self.session.execute(insert(self.table), self._prepare_rows(self._rows))
+            self.session.commit()
+            self._rows = []
+            if self.profile is not None:
+                self.profile.observe('db_save', time.monotonic() - started)
+        except Exception:
+            self._fail("Error saving scan results to database")
+
+    def finish(self, complete=True):
+        """Flush the remaining rows and store the final counters on the ScanHistory record
+
+        complete is False when the scan stopped part way through.
+        """
+        # The history record is created with the first result, or here for an empty scan
+        if self.scan_id is None and not self.failed:
+            self.start()
+        self.flush()
+        if self.failed:
+            return
+        try:
+            self.session.execute(
+                update(ScanHistory)
+                .where(ScanHistory.id == self.scan_id)
+                .values(active_count=self.active_count,
+                        inactive_count=self.inactive_count,
+                        total_count=self.active_count + self.inactive_count,
+                        profile=self.profile.to_json() if self.profile is not None else None,
+                        **self._final_counters())
+            )
+            self.session.commit()
+            logger.info(f"Saved scan results to database. Scan ID: {self.scan_id}")
+        except Exception:
+            self._fail("Error updating scan history counters")
+
+    def _history_fields(self):
+        """Extra columns for the ScanHistory record"""
+        return {'scan_mode': 'full'}
+
+    def _final_counters(self):
+        """Extra ScanHistory columns set by finish()"""
+        return {}
+
+    def _row(self, result):
+        """Row to insert for a result dict, or None to skip it"""
+        return result_row(self.scan_id, result)
+
+    def _prepare_rows(self, rows):
+        """Replace the response texts of a batch with their lookup table IDs"""
+        return with_response_ids(self.session, rows)
+
+    def _fail(self, message):
+        logger.exception(message)
+        self.session.rollback()
+        self.failed = True
+        self._rows = []
+
+
+class Baseline:
+    """Subdomain states a differential scan is compared against
+
+    scan_id is the full scan the states start from; the changes of the
+    differential scans since then are already applied.
+    """
+
+    def __init__(self, scan_id, states, diff_scans=0):
+        self.scan_id = scan_id
+        # subdomain -> (is_active, response_info)
+        self.states = states
+        # Differential scans whose changes were applied on top of the full scan, counting those with changes
+        self.diff_scans = diff_scans
+
+    def __contains__(self, subdomain):
+        return subdomain in self.states
+
+    def __len__(self):
+        return len(self.states)
+
+    def apply(self, change):
+        """Update the states with a ScanChange recorded by a later differential scan"""
+        if change.change_type == ScanChange.DISAPPEARED:
+            self.states.pop(change.subdomain, None)
+        else:
+            self.states[change.subdomain] = (change.is_active, change.response_info)
+
+
+def load_baseline(session, domain):
+    """Load the previous state of domain as a Baseline, or None without a full scan
+
+    That is the latest full scan with the changes of every differential
+    scan based on it applied in order, so each differential scan only
+    reports what changed since the one before. The full scan is located
+    through the (domain, timestamp) index and its results are fetched in a
+    single query.
+    """
+    latest_full_scan = (
+        select(ScanHistory.id)
+        .where(ScanHistory.domain == domain,
+               func.coalesce(ScanHistory.scan_mode, 'full') == 'full')
+        .order_by(ScanHistory.timestamp.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    rows = session.execute(
+        select(ScanResult.scan_id, ScanResult.subdomain, ScanResult.is_active,
+               ResponseInfo.text.label('response_info'))
+        .outerjoin(ResponseInfo, ScanResult.response_info_id == ResponseInfo.id)
+        .where(ScanResult.scan_id == latest_full_scan)
+    ).all()
+    if not rows:
+        return None
+    baseline = Baseline(rows[0].scan_id, {row.subdomain: (row.is_active, row.response_info) for row in rows})
+    changes = session.execute(
+        select(ScanChange)
+        .join(ScanHistory, ScanChange.scan_id == ScanHistory.id)
+        .where(ScanHistory.base_scan_id == baseline.scan_id, ScanHistory.scan_mode == 'diff')
+        .order_by(ScanHistory.timestamp, ScanHistory.id, ScanChange.id)
+    ).scalars()
+    diff_scans = set()
+    for change in changes:
+        baseline.apply(change)
+        diff_scans.add(change.scan_id)
+    baseline.diff_scans = len(diff_scans)
+    return baseline
+
+
+class ChangeWriter(ResultWriter):
+    """ResultWriter for differential scans that only stores changes against a baseline
+
+    New subdomains, subdomains whose status or response changed and, at the
+    end of the scan, baseline subdomains that were not seen again are written
+    to scan_changes. Unchanged subdomains are only counted.
+    """
+
+    table = ScanChange
+
+    def __init__(self, session, domain, baseline, batch_size=None, profile=None):
+        super().__init__(session, domain, batch_size=batch_size, profile=profile)
+        self.baseline = baseline
+        self.new_count = 0
+        self.changed_count = 0
+        self.disappeared_count = 0
+        self._seen = set()
+
+    def finish(self, complete=True):
+        """Record the disappeared subdomains, then flush and update the counters
+
+        Subdomains can only be called disappeared once the whole scan ran.
+        """
+        if complete and not self.failed and (self.scan_id is not None or self.start() is not None):
+            now = datetime.now()
+            for subdomain, (was_active, previous_response) in self.baseline.states.items():
+                if subdomain in self._seen:
+                    continue
+                self.disappeared_count += 1
+                self._rows.append({
+                    'scan_id': self.scan_id,
+                    'subdomain': subdomain,
+                    'change_type': ScanChange.DISAPPEARED,
+                    'is_active': None,
+                    'response_info': None,
+                    'previous_is_active': was_active,
+                    'previous_response_info': previous_response,
+                    'timestamp': now,
+                })
+                if len(self._rows) >= self.batch_size:
+                    self.flush()
+        super().finish(complete)
+
+    def _history_fields(self):
+        return {'scan_mode': 'diff', 'base_scan_id': self.baseline.scan_id}
+
+    def _final_counters(self):
+        return {'new_count': self.new_count,
+                'changed_count': self.changed_count,
+                'disappeared_count': self.disappeared_count}
+
+    def _prepare_rows(self, rows):
+        # Changes are few, their response texts are stored inline
+        return rows
+
+    def _row(self, result):
+        subdomain = result['domain']
+        self._seen.add(subdomain)
+        row = {
+            'scan_id': self.scan_id,
+            'subdomain': subdomain,
+            'is_active': result['is_active'],
+            'response_info': result['response_info'],
+            'timestamp': result.get('checked_at') or datetime.now(),
+            'previous_is_active': None,
+            'previous_response_info': None,
+        }
+        previous = self.baseline.states.get(subdomain)
+        if previous is None:
+            self.new_count += 1
+            row['change_type'] = ScanChange.NEW
+            return row
+        if previous == (result['is_active'], result['response_info']):
+            return None
+        self.changed_count += 1
+        row['change_type'] = ScanChange.STATUS_CHANGED
+        row['previous_is_active'], row['previous_response_info'] = previous
+        return row
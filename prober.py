@@ -0,0 +1,328 @@
+import ssl
+import time
+import socket
+import logging
+import threading
+import http.client
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+from fingerprint import Fingerprint
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "Mozilla/5.0 (compatible; SubdomainScanner)"
+
+# Errors that mean we could not get an HTTP response from the host
+CONNECTION_ERRORS = (OSError, http.client.HTTPException, ssl.SSLError)
+
+# Errors that may well go away when the host is probed again later
+TRANSIENT_ERRORS = (socket.timeout, ConnectionResetError, ConnectionAbortedError)
+
+
+class ProbeResult:
+    """Structured outcome of a single HEAD or GET probe
+
+    connect_time and response_time are the seconds spent connecting (None on
+    a reused connection) and waiting for the response; tls_time is the part
+    of connect_time spent on the TLS handshake, when it could be told apart.
+    retryable is set when the probe failed in a way that may not happen
+    again, such as a timeout, and error_type names the exception class.
+    fingerprint holds the server, redirect, title and certificate details
+    of a response.
+    """
+
+    def __init__(self, url, status_code=None, reason=None, http_version=None, headers=None, error=None,
+                 connect_time=None, response_time=None, retryable=False, tls_time=None, error_type=None,
+                 fingerprint=None):
+        self.url = url
+        self.status_code = status_code
+        self.reason = reason
+        self.http_version = http_version
+        self.headers = headers or []
+        self.error = error
+        self.connect_time = connect_time
+        self.response_time = response_time
+        self.retryable = retryable
+        self.tls_time = tls_time
+        self.error_type = error_type
+        self.fingerprint = fingerprint
+
+    @property
+    def is_active(self):
+        """A host is active when it answered with any HTTP status"""
+        return self.status_code is not None
+
+    @property
+    def status_line(self):
+        """Status line in the same form curl prints it, e.g. 'HTTP/1.1 200 OK'"""
+        if not self.is_active:
+            return "No response"
+        return f"{self.http_version} {self.status_code} {self.reason}".strip()
+
+    def header_block(self):
+        """Raw response header dump (status line followed by the headers)"""
+        if not self.is_active:
+            return None
+        lines = [self.status_line] + [f"{name}: {value}" for name, value in self.headers]
+        return "\r\n".join(lines) + "\r\n"
+
+    def __repr__(self):
+        return f"<ProbeResult {self.url} {self.status_line}>"
+
+
+class _PinnedHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection to a fixed IP address, whatever host it is asked for"""
+
+    def __init__(self, host, port, address, timeout):
+        super().__init__(host, port, timeout=timeout)
+        self.address = address
+
+    def connect(self):
+        self.sock = socket.create_connection((self.address, self.port), self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+class _PinnedHTTPSConnection(http.client.HTTPSConnection):
+    """HTTPS connection to a fixed IP address with SNI set to the host name
+
+    TLS sessions are cached per address, so later handshakes with the same
+    backend can resume instead of doing a full handshake. Servers that won't
+    resume a session for a different name simply fall back to a full one.
+    """
+
+    def __init__(self, host, port, address, timeout, context, sessions):
+        super().__init__(host, port, timeout=timeout, context=context)
+        self.address = address
+        self.sessions = sessions
+        # Seconds the last handshake took
+        self.tls_time = None
+
+    def connect(self):
+        sock = socket.create_connection((self.address, self.port), self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        session = self.sessions.get((self.address, self.port))
+        started = time.monotonic()
+        try:
+            self.sock = self._context.wrap_socket(sock, server_hostname=self.host, session=session)
+        except BaseException:
+            sock.close()
+            raise
+        self.tls_time = time.monotonic() - started
+        if self.sock.session is not None:
+            self.sessions[(self.address, self.port)] = self.sock.session
+
+
+class HttpProber:
+    """In-process HTTP prober with a keep-alive connection pool per host
+
+    Replaces spawning `curl -I -v` for every host. Idle connections are kept
+    per (scheme, host, port) so rechecks and repeated probes of the same host
+    skip the TCP and TLS handshakes. The total number of idle sockets is capped,
+    least recently used hosts are evicted first. The prober is safe to share
+    between threads.
+
+    When the caller already resolved the host, the probe can be pinned to that
+    address. Plain HTTP connections to an address are then shared by every
+    host behind it (the Host header selects the site), and HTTPS connections
+    resume TLS sessions cached per address while sending each host's own SNI.
+
+    Probes are HEAD requests unless body_limit is set: they are then GET
+    requests reading at most body_limit bytes of the body, enough for the
+    page title. Connections whose body wasn't read to the end are closed
+    rather than pooled.
+    """
+
+    def __init__(self, timeout=3, max_idle_per_host=2, max_idle_total=64, verify_tls=False, connect_timeout=None,
+                 body_limit=0):
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout or timeout
+        self.body_limit = body_limit
+        self.max_idle_per_host = max_idle_per_host
+        self.max_idle_total = max_idle_total
+        self.ssl_context = ssl.create_default_context()
+        if not verify_tls:
+            # Same as curl -k: we only care whether the host answers
+            self.ssl_context.check_hostname = False
+            self.ssl_context.verify_mode = ssl.CERT_NONE
+        self._idle = OrderedDict()
+        self._idle_count = 0
+        self._tls_sessions = {}
+        self._lock = threading.Lock()
+
+    def probe(self, domain, timeout=None, address=None):
+        """Probe a domain or URL and return a ProbeResult
+
+        Bare domains are tried over https first and fall back to http when no
+        HTTP response could be obtained. If address is given the connection is
+        made to that IP instead of resolving the host again. timeout is either
+        a number used for both or a (connect, read) pair of timeouts.
+        """
+        if timeout is None:
+            timeout = (self.connect_timeout, self.timeout)
+        elif not isinstance(timeout, tuple):
+            timeout = (timeout, timeout)
+        if domain.startswith(('http://', 'https://')):
+            return self._probe_url(domain, timeout, address)
+
+        result = self._probe_url(f"https://{domain}", timeout, address)
+        if not result.is_active:
+            fallback = self._probe_url(f"http://{domain}", timeout, address)
+            if fallback.is_active:
+                return fallback
+            result.retryable = result.retryable or fallback.retryable
+        return result
+
+    def close(self):
+        """Close all idle pooled connections"""
+        with self._lock:
+            idle, self._idle = self._idle, OrderedDict()
+            self._idle_count = 0
+        for connections in idle.values():
+            for conn in connections:
+                conn.close()
+        self._tls_sessions.clear()
+
+    def _probe_url(self, url, timeout, address=None):
+        parsed = urlparse(url)
+        scheme = parsed.scheme
+        host = parsed.hostname
+        port = parsed.port or (443 if scheme == 'https' else 80)
+        path = parsed.path or '/'
+        if parsed.query:
+            path = f"{path}?{parsed.query}"
+        if address is None:
+            key = (scheme, host, port)
+        elif scheme == 'https':
+            # TLS connections are tied to the SNI name, only the session is shared
+            key = (scheme, host, port, address)
+        else:
+            # Plain HTTP connections to one address can serve every host behind it
+            key = (scheme, None, port, address)
+
+        connect_timeout, read_timeout = timeout
+        conn, reused = self._acquire(key, read_timeout, host)
+        connect_time = tls_time = None
+        try:
+            try:
+                if not reused:
+                    connect_time, tls_time = self._connect(conn, connect_timeout, read_timeout)
+                started = time.monotonic()
+                response = self._request(conn, host, parsed.port, path)
+            except CONNECTION_ERRORS:
+                if not reused:
+                    raise
+                # The pooled keep-alive connection went stale, retry on a fresh one
+                conn.close()
+                conn, reused = self._new_connection(key, read_timeout, host), False
+                connect_time, tls_time = self._connect(conn, connect_timeout, read_timeout)
+                started = time.monotonic()
+                response = self._request(conn, host, parsed.port, path)
+
+            result = ProbeResult(
+                url,
+                status_code=response.status,
+                reason=response.reason,
+                http_version='HTTP/1.0' if response.version == 10 else 'HTTP/1.1',
+                headers=response.getheaders(),
+                connect_time=connect_time,
+                tls_time=tls_time,
+                response_time=time.monotonic() - started,
+            )
+            body, complete = self._read_body(response)
+            result.fingerprint = Fingerprint.from_response(url, response, body, complete, conn.peer_certificate)
+            if response.will_close or not complete and self.body_limit:
+                conn.close()
+            else:
+                self._release(key, conn)
+            return result
+        except CONNECTION_ERRORS as e:
+            conn.close()
+            logger.debug(f"No HTTP response from {url}: {e}")
+            return ProbeResult(url, error=str(e) or e.__class__.__name__, error_type=e.__class__.__name__,
+                               retryable=isinstance(e, TRANSIENT_ERRORS))
+
+    @staticmethod
+    def _connect(conn, connect_timeout, read_timeout):
+        """Open a new connection within connect_timeout and switch it to read_timeout
+
+        Returns the seconds taken and the part of them spent on the TLS
+        handshake, or None when the connection doesn't report it. The
+        server's certificate is kept as conn.peer_certificate, as http.client
+        drops the socket of connections the server closes.
+        """
+        started = time.monotonic()
+        conn.timeout = connect_timeout
+        conn.connect()
+        conn.peer_certificate = conn.sock.getpeercert(binary_form=True) if isinstance(conn.sock, ssl.SSLSocket) else None
+        conn.sock.settimeout(read_timeout)
+        conn.timeout = read_timeout
+        return time.monotonic() - started, getattr(conn, 'tls_time', None)
+
+    def _read_body(self, response):
+        """Read up to body_limit bytes of the body, returning them and whether that was all of it"""
+        if not self.body_limit:
+            response.read()
+            return None, False
+        try:
+            body = response.read(self.body_limit)
+        except CONNECTION_ERRORS as e:
+            # The status is in, a body that stalls only costs the title
+            logger.debug(f"Error reading the response body: {e}")
+            response.close()
+            return None, False
+        # A closed response was read to the end
+        return body, response.isclosed()
+
+    def _request(self, conn, host, port, path):
+        # Send Host explicitly, pooled connections to an address are shared by several hosts
+        host_header = f"{host}:{port}" if port else host
+        conn.request('GET' if self.body_limit else 'HEAD', path, headers={'Host': host_header, 'User-Agent': USER_AGENT, 'Accept': '*/*'})
+        return conn.getresponse()
+
+    def _acquire(self, key, timeout, host):
+        conn = None
+        with self._lock:
+            connections = self._idle.get(key)
+            if connections:
+                conn = connections.pop()
+                self._idle_count -= 1
+                if not connections:
+                    del self._idle[key]
+        if conn is None:
+            return self._new_connection(key, timeout, host), False
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    def _release(self, key, conn):
+        evicted = []
+        with self._lock:
+            connections = self._idle.setdefault(key, [])
+            self._idle.move_to_end(key)
+            if len(connections) >= self.max_idle_per_host:
+                evicted.append(conn)
+            else:
+                connections.append(conn)
+                self._idle_count += 1
+                # Evict idle connections of the least recently used hosts
+                while self._idle_count > self.max_idle_total:
+                    oldest_key, oldest = next(iter(self._idle.items()))
+                    evicted.append(oldest.pop(0))
+                    self._idle_count -= 1
+                    if not oldest:
+                        del self._idle[oldest_key]
+        for stale in evicted:
+            stale.close()
+
+    def _new_connection(self, key, timeout, host):
+        scheme, port = key[0], key[2]
+        address = key[3] if len(key) > 3 else None
+        if address is not None:
+            if scheme == 'https':
+                return _PinnedHTTPSConnection(host, port, address, timeout, self.ssl_context, self._tls_sessions)
+            return _PinnedHTTPConnection(host, port, address, timeout)
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port, timeout=timeout, context=self.ssl_context)
+        return http.client.HTTPConnection(host, port, timeout=timeout)
@@ -0,0 +1,159 @@
+import os
+import time
+import logging
+from datetime import datetime
+
+from sqlalchemy import func, select, update
+
+from liveness import bounded_imap, DEFAULT_RETRIES, DEFAULT_RETRY_BACKOFF
+from prober import ProbeResult
+from models import ScanHistory, ScanResult, ResponseInfo
+from fingerprint import fingerprint_columns
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RECHECK_CONCURRENCY = int(os.environ.get("SCANNER_RECHECK_CONCURRENCY", 16))
+DEFAULT_RECHECK_MAX_HOSTS = int(os.environ.get("SCANNER_RECHECK_MAX_HOSTS", 5000))
+
+
+class Rechecker:
+    """Probes a batch of hosts again with bounded concurrency
+
+    Hosts whose probe timed out or was reset are probed again after the
+    rest, up to retries times with a pause that doubles every round. The
+    timeouts stay the prober's, as rechecks are waited on interactively.
+    """
+
+    def __init__(self, prober, concurrency=None, retries=None, retry_backoff=None):
+        self.prober = prober
+        self.concurrency = concurrency or DEFAULT_RECHECK_CONCURRENCY
+        self.retries = DEFAULT_RETRIES if retries is None else retries
+        self.retry_backoff = DEFAULT_RETRY_BACKOFF if retry_backoff is None else retry_backoff
+
+    def probe_many(self, hosts):
+        """Yield (host, ProbeResult) pairs as probes complete"""
+        failed = hosts
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+                logger.debug(f"Retrying {len(failed)} hosts (attempt {attempt}/{self.retries})")
+            retry = []
+            for host, probe in bounded_imap(self._probe, failed, self.concurrency):
+                if probe.retryable and attempt < self.retries:
+                    retry.append(host)
+                else:
+                    yield host, probe
+            if not retry:
+                break
+            failed = retry
+
+    def _probe(self, host):
+        logger.debug(f"Re-checking domain: {host}")
+        try:
+            return host, self.prober.probe(host)
+        except Exception as e:
+            logger.exception(f"Error rechecking domain {host}")
+            return host, ProbeResult(host, error=str(e))
+
+
+def inactive_subdomains(session, scan_id, limit=None, after=None):
+    """Subdomains of a stored scan that were inactive, through the (scan_id, is_active) index
+
+    With after, only the subdomains sorting after it are returned.
+    """
+    statement = (
+        select(ScanResult.subdomain)
+        .where(ScanResult.scan_id == scan_id, ScanResult.is_active.is_(False))
+        .order_by(ScanResult.subdomain)
+    )
+    if after is not None:
+        statement = statement.where(ScanResult.subdomain > after)
+    if limit:
+        statement = statement.limit(limit)
+    return list(session.execute(statement).scalars())
+
+
+def inactive_subdomain_chunks(session, scan_id, chunk_size=None):
+    """Yield the inactive subdomains of a stored scan in lists of up to chunk_size, reading one list at a time
+
+    Each list is read after the previous one was used, continuing after its
+    last subdomain, so hosts that became active in between are not skipped
+    over or repeated.
+    """
+    chunk_size = chunk_size or DEFAULT_RECHECK_MAX_HOSTS
+    after = None
+    while True:
+        chunk = inactive_subdomains(session, scan_id, limit=chunk_size, after=after)
+        if not chunk:
+            return
+        yield chunk
+        after = chunk[-1]
+
+
+class ScanResultUpdater:
+    """Writes recheck results back to the stored results of a scan in batches
+
+    Row IDs are looked up by subdomain once per batch and the rows are
+    updated with a single executemany. finish() recounts the scan's active
+    and inactive results.
+    """
+
+    def __init__(self, session, scan_id, batch_size=200):
+        self.session = session
+        self.scan_id = scan_id
+        self.batch_size = batch_size
+        self.updated = 0
+        self._pending = {}
+
+    def add(self, result):
+        """Queue a result dict from a recheck"""
+        self._pending[result['domain']] = result
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        try:
+            row_ids = dict(self.session.execute(
+                select(ScanResult.subdomain, ScanResult.id)
+                .where(ScanResult.scan_id == self.scan_id, ScanResult.subdomain.in_(pending.keys()))
+            ).all())
+            response_ids = ResponseInfo.ids_for(self.session, {r['response_info'] for r in pending.values()})
+            rows = [{
+                'id': row_ids[subdomain],
+                'is_active': result['is_active'],
+                'response_info_id': response_ids.get(result['response_info']),
+                'timestamp': result.get('checked_at') or datetime.now(),
+                **fingerprint_columns(result),
+            } for subdomain, result in pending.items() if subdomain in row_ids]
+            if rows:
+                self.session.execute(update(ScanResult), rows)
+                self.session.commit()
+            self.updated += len(rows)
+        except Exception:
+            logger.exception(f"Error saving recheck results of scan {self.scan_id}")
+            self.session.rollback()
+
+    def finish(self):
+        """Flush the remaining results and recount the scan history counters"""
+        self.flush()
+        if not self.updated:
+            return
+        try:
+            counts = dict(self.session.execute(
+                select(ScanResult.is_active, func.count())
+                .where(ScanResult.scan_id == self.scan_id)
+                .group_by(ScanResult.is_active)
+            ).all())
+            active, inactive = counts.get(True, 0), counts.get(False, 0)
+            self.session.execute(
+                update(ScanHistory)
+                .where(ScanHistory.id == self.scan_id)
+                .values(active_count=active, inactive_count=inactive, total_count=active + inactive)
+            )
+            self.session.commit()
+        except Exception:
+            logger.exception(f"Error updating counters of scan {self.scan_id}")
+            self.session.rollback()
@@ -0,0 +1,139 @@
+import os
+import time
+import socket
+import logging
+from urllib.parse import urlparse
+
+from liveness import bounded_imap
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DNS_CONCURRENCY = int(os.environ.get("SCANNER_DNS_CONCURRENCY", 64))
+
+RESOLVED = 'resolved'
+NXDOMAIN = 'nxdomain'
+NO_ADDRESS = 'no_address'
+ERROR = 'error'
+
+# getaddrinfo errors meaning the name does not exist or has no address records
+_NXDOMAIN_ERRORS = {socket.EAI_NONAME}
+_NO_ADDRESS_ERRORS = {getattr(socket, 'EAI_NODATA', None), getattr(socket, 'EAI_ADDRFAMILY', None)} - {None}
+
+
+class DnsAnswer:
+    """Outcome of resolving one host"""
+
+    def __init__(self, host, status, addresses=None, cname=None, error=None):
+        self.host = host
+        self.status = status
+        self.addresses = addresses or []
+        self.cname = cname
+        self.error = error
+        # Seconds the lookup took, set by DnsResolver
+        self.duration = None
+
+    @property
+    def probeable(self):
+        """Whether an HTTP probe can possibly reach the host
+
+        Only hosts that definitely don't resolve are filtered out; on lookup
+        errors (e.g. timeouts) the prober gets its own chance to resolve.
+        """
+        return self.status not in (NXDOMAIN, NO_ADDRESS)
+
+    def __repr__(self):
+        return f"<DnsAnswer {self.host} {self.status} {self.addresses}>"
+
+
+def _hostname(host):
+    """Strip scheme, port and path when given a URL instead of a bare host"""
+    if '://' in host:
+        return urlparse(host).hostname or host
+    return host
+
+
+def system_resolve(host):
+    """Resolve A, AAAA and CNAME data for host with the system resolver"""
+    name = _hostname(host)
+    addresses = []
+    cname = None
+    errors = []
+
+    # A records; gethostbyname_ex also reports the canonical name behind a CNAME chain
+    try:
+        canonical, _aliases, ipv4 = socket.gethostbyname_ex(name)
+        addresses.extend(ipv4)
+        if canonical and canonical.rstrip('.').lower() != name.rstrip('.').lower():
+            cname = canonical
+    except (socket.gaierror, socket.herror) as e:
+        errors.append(e)
+
+    # AAAA records
+    try:
+        for _family, _type, _proto, _canon, sockaddr in socket.getaddrinfo(name, None, socket.AF_INET6, socket.SOCK_STREAM):
+            if sockaddr[0] not in addresses:
+                addresses.append(sockaddr[0])
+    except socket.gaierror as e:
+        errors.append(e)
+
+    if addresses:
+        return DnsAnswer(host, RESOLVED, addresses=addresses, cname=cname)
+    # A host with only AAAA records can fail the A lookup with EAI_NONAME too,
+    # so it's only NXDOMAIN when both lookups say the name doesn't exist
+    if len(errors) == 2 and all(getattr(e, 'errno', None) in _NXDOMAIN_ERRORS for e in errors):
+        return DnsAnswer(host, NXDOMAIN, cname=cname, error=str(errors[0]))
+    if errors and all(getattr(e, 'errno', None) in _NXDOMAIN_ERRORS | _NO_ADDRESS_ERRORS for e in errors):
+        return DnsAnswer(host, NO_ADDRESS, cname=cname, error=str(errors[0]))
+    return DnsAnswer(host, ERROR, cname=cname, error=str(errors[0]) if errors else "No address records")
+
+
+class StaticResolver:
+    """Resolver backed by a fixed host -> addresses mapping, for tests and benchmarks
+
+    Hosts missing from the mapping resolve as NXDOMAIN.
+    """
+
+    def __init__(self, records):
+        self.records = {name.lower(): list(addresses) for name, addresses in records.items()}
+
+    def __call__(self, host):
+        addresses = self.records.get(_hostname(host).lower())
+        if not addresses:
+            return DnsAnswer(host, NXDOMAIN, error="Not in static records")
+        return DnsAnswer(host, RESOLVED, addresses=addresses)
+
+
+class DnsResolver:
+    """Resolves candidate hosts in bulk with bounded concurrency
+
+    The actual lookup is done by resolve_func(host) -> DnsAnswer, which
+    defaults to the system resolver and can be swapped for a stub.
+    """
+
+    def __init__(self, concurrency=None, resolve_func=None):
+        self.concurrency = concurrency or DEFAULT_DNS_CONCURRENCY
+        self.resolve_func = resolve_func or system_resolve
+
+    def resolve(self, host):
+        """Resolve a single host, never raising"""
+        started = time.monotonic()
+        try:
+            answer = self.resolve_func(host)
+        except Exception as e:
+            logger.debug(f"DNS lookup for {host} failed: {e}")
+            answer = DnsAnswer(host, ERROR, error=str(e))
+        answer.duration = time.monotonic() - started
+        return answer
+
+    def resolve_many(self, hosts, deadline=None):
+        """Yield a DnsAnswer for every host as lookups complete
+
+        Once deadline (a time.monotonic() value) has passed, the remaining
+        hosts aren't looked up; they get an ERROR answer saying so.
+        """
+        yield from bounded_imap(self.resolve, hosts, self.concurrency, deadline=deadline, on_skip=_skipped_answer)
+
+
+def _skipped_answer(host):
+    """Answer for a host that wasn't looked up before the scan deadline"""
+    return DnsAnswer(host, ERROR, error="Skipped: scan deadline reached")
@@ -1,4 +1,4 @@
 #!/bin/bash
 
 # Run the application on port 5003
-gunicorn --bind 0.0.0.0:5003 --reuse-port --reload main:app
\ No newline at end of file
+gunicorn --bind 0.0.0.0:5003 --workers 1 --threads 16 --reuse-port --reload main:app
\ No newline at end of file
@@ -0,0 +1,740 @@
+import re
+import csv
+import time
+import logging
+import tempfile
+import threading
+import subprocess
+from io import StringIO
+from itertools import chain
+from contextlib import nullcontext
+from datetime import datetime
+
+import metrics
+from liveness import (LivenessEngine, KeyedLimiter, DEFAULT_PER_IP_CONCURRENCY,
+                      DEFAULT_RETRIES, DEFAULT_RETRY_BACKOFF)
+from prober import HttpProber
+from resolver import DnsResolver, DnsAnswer, RESOLVED, ERROR
+from cache import get_default_cache
+from bruteforce import BruteForcer
+from fingerprint import DEFAULT_BODY_LIMIT, FIELDS as FINGERPRINT_FIELDS, certificate_hosts
+
+logger = logging.getLogger(__name__)
+
+# Rounds of checking hosts named in the certificates of hosts found in the previous round
+CERTIFICATE_ROUNDS = 3
+
+
+def _ip_key(answer):
+    """The address a host's probes are limited by, or None for hosts that aren't probed by address"""
+    return answer.addresses[0] if answer.probeable and answer.addresses else None
+
+
+def _until(items, deadline):
+    """Pass on items until deadline (a time.monotonic() value), then stop pulling and close them"""
+    if deadline is None:
+        yield from items
+        return
+    try:
+        for item in items:
+            yield item
+            if time.monotonic() >= deadline:
+                logger.info("Scan deadline reached, stopping subdomain enumeration")
+                break
+    finally:
+        items.close()
+
+
+class EnumerationError(Exception):
+    """Raised when the subdomain enumeration tool fails"""
+
+
+class SubdomainScanner:
+    """Enumerates the subdomains of a domain and checks which of them are live
+
+    Results are kept in memory and, when a session_factory is given, written
+    to the database while the scan runs. session_factory is called on the
+    scanning thread and must return the SQLAlchemy session to use there.
+    probe_budget is an optional semaphore shared by scanners running in
+    parallel, capping their HTTP probes in flight together. wordlist is a
+    file of subdomain labels to brute-force in addition to subfinder.
+    Hosts that time out are probed again at the end of the scan, up to
+    retries times with growing pauses and timeouts. Subdomains named in
+    the TLS certificates of probed hosts are checked as well.
+
+    With a work_queue (a workqueue.WorkQueue) and a session_factory, the
+    resolved hosts are handed to scan workers in other processes instead
+    of being probed here only, see _distribute().
+    """
+
+    def __init__(self, concurrency=None, timeout=None, deadline=None, db_batch_size=None, resolver=None,
+                 per_ip_concurrency=None, cache=None, session_factory=None, probe_budget=None, wordlist=None,
+                 connect_timeout=None, retries=None, retry_backoff=None, work_queue=None):
+        self.liveness = LivenessEngine(concurrency=concurrency, timeout=timeout, deadline=deadline,
+                                       connect_timeout=connect_timeout)
+        self.prober = HttpProber(timeout=self.liveness.timeout, connect_timeout=self.liveness.connect_timeout,
+                                 body_limit=DEFAULT_BODY_LIMIT)
+        self.retries = DEFAULT_RETRIES if retries is None else retries
+        self.retry_backoff = DEFAULT_RETRY_BACKOFF if retry_backoff is None else retry_backoff
+        # DNS pre-filter; pass a DnsResolver with a stub resolve_func for tests
+        self.resolver = resolver or DnsResolver()
+        # Wordlist and permutation candidates, checked against wildcard DNS
+        self.bruteforcer = BruteForcer(self.resolver, wordlist=wordlist)
+        # Hosts reported by subfinder or named in certificates; all other candidates are guesses
+        self._passive_hosts = set()
+        # Subdomains named in certificates, and the ones of them not checked yet
+        self._certificate_hosts = set()
+        self._pending_certificate_hosts = []
+        # Caps concurrent probes against one backend IP
+        self.per_ip_concurrency = per_ip_concurrency or DEFAULT_PER_IP_CONCURRENCY
+        # Recent liveness results shared by all scans in this process
+        self.cache = cache if cache is not None else get_default_cache()
+        self.session_factory = session_factory
+        self.probe_budget = probe_budget
+        self.work_queue = work_queue
+        self.force_refresh = False
+        # 'full' or 'diff'; a diff scan compares against the baseline scan
+        self.scan_mode = 'full'
+        self.baseline = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.db_batch_size = db_batch_size
+        self._writer = None
+        # Stage timings of the current scan, saved with it
+        self.profile = metrics.new_profile()
+        self.active_domains = []
+        self.inactive_domains = []
+        self.scan_results = []
+        # Domain -> its result dict in scan_results, for rechecks
+        self.results_by_domain = {}
+        self._results_lock = threading.Lock()
+        self._status_lists_stale = False
+        # Resolved IP -> subdomains behind it
+        self.ip_groups = {}
+        self.domain = None
+        self.scan_completed = False
+        self.scan_in_progress = False
+        self.error_message = None
+        # Called with every recorded result, e.g. to wake up live progress streams
+        self.on_result = None
+    
+    @staticmethod
+    def validate_domain(domain):
+        """Validate if the input is a proper domain name"""
+        # Simple domain validation regex
+        pattern = r'^([a-zA-Z0-9]([a-zA-Z0-9\-]{0,61}[a-zA-Z0-9])?\.)+[a-zA-Z]{2,}$'
+        return bool(re.match(pattern, domain))
+    
+    def scan_subdomains(self, domain, force_refresh=False, mode='full'):
+        """Scan subdomains using subfinder and dnsx tools or simulates it if not available
+
+        With force_refresh every host is probed again even if the liveness
+        cache holds a recent result for it. In 'diff' mode the scan is compared
+        against the previous state of the domain, its latest full scan updated
+        by the differential scans since (see persistence.load_baseline):
+        subdomains not known yet are probed first and only the changes are
+        stored. Without a previous full scan a diff scan runs as a full one.
+        """
+        self.domain = domain
+        self.force_refresh = force_refresh
+        self._reset_results()
+        self.error_message = None
+        self.scan_completed = False
+        self.scan_in_progress = True
+        self.scan_mode = mode
+        self.baseline = None
+        self._writer = None
+        self.profile = metrics.new_profile()
+        
+        try:
+            session = self.session_factory() if self.session_factory is not None else None
+            if session is not None:
+                # Imported here so scans without a database don't load the ORM
+                from persistence import ResultWriter, ChangeWriter, load_baseline
+                
+                if mode == 'diff' and self.work_queue is not None:
+                    logger.info(f"Differential scans are not distributed, running a full scan of {domain} instead")
+                    self.scan_mode = 'full'
+                elif mode == 'diff':
+                    self.baseline = load_baseline(session, domain)
+                    if self.baseline is None:
+                        logger.info(f"No previous full scan of {domain}, running a full scan instead")
+                        self.scan_mode = 'full'
+                
+                # Results (or, for diff scans, changes) are written to the database in
+                # batches while the scan runs
+                if self.baseline is not None:
+                    self._writer = ChangeWriter(session, domain, self.baseline, batch_size=self.db_batch_size,
+                                                profile=self.profile)
+                else:
+                    self._writer = ResultWriter(session, domain, batch_size=self.db_batch_size, profile=self.profile)
+            elif mode == 'diff':
+                logger.info(f"Differential scans need a database, running a full scan of {domain} instead")
+                self.scan_mode = 'full'
+            
+            # Enumeration streams through DNS resolution straight into the liveness
+            # checks, so hosts are probed while subfinder is still querying its
+            # passive sources. At the scan deadline enumeration stops and the
+            # hosts still on their way are skipped without being resolved.
+            deadline = time.monotonic() + self.liveness.deadline if self.liveness.deadline else None
+            subdomains = self.profile.timed('enumeration', _until(self._enumerate_subdomains(domain), deadline))
+            if self.baseline is not None:
+                subdomains = self._new_subdomains_first(subdomains, self.baseline)
+            answers = chain(self._drop_failed_guesses(self.resolver.resolve_many(subdomains, deadline)),
+                            self._permutation_answers(deadline))
+            self.liveness.timeouts.reset()
+            started = time.monotonic()
+            failed = {}
+            if self.work_queue is not None and self._writer is not None:
+                self._distribute(answers)
+            else:
+                self._run_checks(answers, failed)
+            if self.bruteforcer.kept_count or self.bruteforcer.dropped_count:
+                logger.info(f"Brute-force found {self.bruteforcer.kept_count} subdomains, "
+                            f"dropped {self.bruteforcer.dropped_count} non-resolving or wildcard candidates")
+            self._check_certificate_hosts(failed, started)
+            self._retry_failed(failed, started)
+            
+            self.scan_completed = True
+            logger.info(f"Scan completed. Found {len(self.active_domains)} active and {len(self.inactive_domains)} inactive domains")
+            
+            # Save the remaining results and the final counters to the database
+            self._save_to_database()
+            
+            return True
+            
+        except EnumerationError as e:
+            logger.error(f"Error executing the command: {e}")
+            self.error_message = f"Error executing the subdomain enumeration: {e}"
+            return False
+        except Exception as e:
+            logger.exception("Error during subdomain scanning")
+            self.error_message = f"Error during scan: {str(e)}"
+            return False
+        finally:
+            self.profile.finish(self.scan_completed)
+            # Keep whatever a scan that failed part way has already written
+            if not self.scan_completed and self._writer is not None and self._writer.scan_id is not None:
+                self._writer.finish(complete=False)
+            # Finished jobs keep their scanner around, so don't let it hold idle sockets
+            self.prober.close()
+            self.scan_in_progress = False
+    
+    def _reset_results(self):
+        """Forget the results and per-scan state of the previous scan"""
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.active_domains = []
+        self.inactive_domains = []
+        self.scan_results = []
+        self.results_by_domain = {}
+        self.ip_groups = {}
+        self._passive_hosts = set()
+        self._certificate_hosts = set()
+        self._pending_certificate_hosts = []
+    
+    def check_answers(self, domain, answers):
+        """Check hosts of domain resolved elsewhere and return their result dicts, without saving them
+
+        Used by scan workers (see workqueue.ScanWorker) for batches of a scan
+        coordinated by another process. Hosts that time out are retried as in
+        a scan; names in certificates are left to the coordinating scan.
+        """
+        self.domain = domain
+        self._reset_results()
+        self._writer = None
+        self.profile = metrics.new_profile()
+        started = time.monotonic()
+        failed = {}
+        try:
+            self._run_checks(answers, failed)
+            self._retry_failed(failed, started)
+        finally:
+            self.prober.close()
+        return self.scan_results
+    
+    def _distribute(self, answers):
+        """Queue the resolved hosts for scan workers and work on the queue until every task is done
+
+        Hosts without DNS records need no probe and are saved right here.
+        Workers on any machine claim the other hosts in batches and save
+        their results to this scan; meanwhile this process works through
+        the queue as one more worker. Once the queue is empty the saved
+        results are read back into the result lists.
+        """
+        # Imported here so scans without a database don't load the ORM
+        from workqueue import ScanWorker
+        
+        writer = self._writer
+        scan_id = writer.scan_id or writer.start()
+        if scan_id is None:
+            raise RuntimeError("Could not create the scan history record for the workers")
+        
+        def probeable(answers):
+            for answer in answers:
+                if answer.probeable:
+                    yield answer
+                else:
+                    writer.add(self._unresolved_result(answer))
+        
+        queued = self.work_queue.enqueue(scan_id, self.domain, probeable(answers))
+        logger.info(f"Queued {queued} hosts of scan {scan_id} for scan workers")
+        helper = ScanWorker(self.work_queue, scanner=SubdomainScanner(
+            concurrency=self.liveness.concurrency, timeout=self.liveness.timeout,
+            connect_timeout=self.liveness.connect_timeout, resolver=self.resolver, cache=self.cache,
+            per_ip_concurrency=self.per_ip_concurrency, probe_budget=self.probe_budget,
+            retries=self.retries, retry_backoff=self.retry_backoff))
+        helper.work_until_done(scan_id)
+        failed_hosts = self.work_queue.failed_hosts(scan_id)
+        if failed_hosts:
+            logger.warning(f"{failed_hosts} hosts of scan {scan_id} have no result, their workers kept failing")
+        
+        writer.flush()
+        # The results are already saved, read them back without the writer
+        self._writer = None
+        try:
+            for result in self.work_queue.results(scan_id):
+                self._record_result(result)
+        finally:
+            self._writer = writer
+        writer.active_count = len(self.active_domains)
+        writer.inactive_count = len(self.inactive_domains)
+        self.work_queue.clear(scan_id)
+    
+    def _enumerate_subdomains(self, domain):
+        """Yield unique subdomains of domain as subfinder reports them, then brute-forced candidates
+
+        Without subfinder the built-in brute-forcer stands in for it, using
+        the configured wordlist or a list of common prefixes. With subfinder,
+        brute-forcing only runs when a wordlist is configured. Raises
+        EnumerationError if subfinder fails without output.
+        """
+        self.bruteforcer.start(domain)
+        
+        # Check if subfinder is installed
+        has_subfinder = subprocess.run(["which", "subfinder"], stdout=subprocess.PIPE, stderr=subprocess.PIPE).returncode == 0
+        
+        if not has_subfinder:
+            logger.warning("subfinder not installed. Using built-in brute-force enumeration")
+            yield from self.bruteforcer.candidates()
+            return
+        
+        logger.debug(f"Starting subdomain scan for {domain}")
+        seen = self._passive_hosts
+        # stderr goes to a temporary file so a chatty subfinder can't block on a full pipe
+        with tempfile.TemporaryFile(mode='w+') as stderr:
+            process = subprocess.Popen(
+                ["subfinder", "-silent", "-d", domain],
+                stdout=subprocess.PIPE,
+                stderr=stderr,
+                text=True
+            )
+            try:
+                # Read subfinder's output line by line as it is produced
+                for line in process.stdout:
+                    subdomain = line.strip().lower()
+                    if subdomain and subdomain not in seen:
+                        seen.add(subdomain)
+                        yield subdomain
+                process.wait()
+            finally:
+                # Stop subfinder if the scan ends before enumeration does
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+                process.stdout.close()
+            
+            if process.returncode != 0 and not seen:
+                stderr.seek(0)
+                raise EnumerationError(stderr.read().strip())
+        
+        logger.debug(f"Found {len(seen)} subdomains")
+        
+        if self.bruteforcer.wordlist:
+            yield from self.bruteforcer.candidates(known=seen)
+    
+    def _drop_failed_guesses(self, answers):
+        """Pass on every answer for a subfinder host, but only real hits among brute-forced candidates
+
+        Guesses that don't resolve, or only match a wildcard DNS record, are
+        dropped rather than reported as inactive. Resolving hosts are handed
+        to the brute-forcer for permutations.
+        """
+        for answer in answers:
+            if answer.duration is not None:
+                self.profile.observe('dns', answer.duration)
+            if answer.host in self._passive_hosts:
+                if answer.probeable:
+                    self.bruteforcer.found(answer.host)
+                yield answer
+            elif self.bruteforcer.keep(answer):
+                yield answer
+    
+    def _permutation_answers(self, deadline=None):
+        """Yield the answers for permutations of the hosts found, in rounds, after enumeration is done
+
+        Only starts once every enumerated candidate has been resolved and
+        passed through _drop_failed_guesses, so hits at the very end of the
+        wordlist are permuted too. Each round permutes the hosts found in the
+        round before. No round starts after the deadline.
+        """
+        while deadline is None or time.monotonic() < deadline:
+            hosts = self.bruteforcer.permutation_round()
+            if not hosts:
+                break
+            yield from self._drop_failed_guesses(self.resolver.resolve_many(hosts, deadline))
+    
+    def _new_subdomains_first(self, subdomains, baseline):
+        """Pass on subdomains missing from the baseline right away and the known ones at the end
+
+        Known subdomains are re-probed at lower priority, and the liveness cache
+        answers those checked recently.
+        """
+        known = []
+        for subdomain in subdomains:
+            if subdomain in baseline:
+                known.append(subdomain)
+            else:
+                yield subdomain
+        logger.debug(f"Re-probing {len(known)} subdomains known from scan {baseline.scan_id}")
+        yield from known
+    
+    def _check_answers(self, answers, on_skip, **options):
+        """Run _check_resolved_domain for answers on the liveness engine and yield the results as they complete
+
+        Resolved hosts are grouped by their first address, and at most
+        per_ip_concurrency probes run against the same address at once. The
+        per-IP slots are handed out before a host is started rather than
+        waited for on a worker thread: hosts behind a busy address are held
+        back until one of its probes finishes, while hosts behind other
+        addresses keep the workers busy.
+        """
+        limiter = KeyedLimiter(self.per_ip_concurrency)
+        
+        def check(answer, timeout):
+            try:
+                return self._check_resolved_domain(answer, timeout)
+            finally:
+                if _ip_key(answer) is not None:
+                    limiter.release(_ip_key(answer))
+        
+        def skip(answer):
+            if _ip_key(answer) is not None:
+                limiter.release(_ip_key(answer))
+            return on_skip(answer)
+        
+        try:
+            yield from self.liveness.run(limiter.admit(answers, _ip_key), check, on_skip=skip, **options)
+        finally:
+            # Hosts still held back when the results stop being read are dropped
+            limiter.close()
+    
+    def _check_resolved_domain(self, answer, timeout=3):
+        """Check a host's liveness from its DnsAnswer, skipping the HTTP probe for hosts that don't resolve
+
+        The probe connects to the host's first address directly; see
+        _check_answers() for how probes per address are limited. A cached
+        result is used instead of probing when it is still fresh and the host
+        still resolves to the same addresses.
+        """
+        if not answer.probeable:
+            logger.debug(f"Domain {answer.host} does not resolve ({answer.status}), skipping HTTP probe")
+            result = self._unresolved_result(answer)
+        else:
+            result = None if self.force_refresh else self._cached_result(answer)
+            if result is None:
+                with self.probe_budget or nullcontext():
+                    result = self._check_domain_liveness(answer.host, timeout, address=_ip_key(answer))
+                result['ip_addresses'] = answer.addresses
+                # Hosts that timed out are retried before anything is cached
+                if 'error' not in result and not result.get('retryable'):
+                    self.cache.put(answer.host, result)
+                result['cached'] = False
+            if answer.addresses:
+                result['ip_group'] = answer.addresses[0]
+        result['ip_addresses'] = answer.addresses
+        return result
+    
+    def _run_checks(self, answers, failed, deadline=None):
+        """Check the hosts of answers, recording their results and holding back the ones to retry in failed"""
+        for result in self._check_answers(answers, self._deadline_answer_result, deadline=deadline):
+            if result.pop('retryable', False) and self.retries:
+                failed[result['domain']] = result
+            else:
+                self._record_result(result)
+    
+    def _check_certificate_hosts(self, failed, started):
+        """Check subdomains named in the TLS certificates of probed hosts that the scan hasn't seen
+
+        They are treated like subfinder results, so no extra enumeration is
+        needed. The certificates of the hosts checked may name further ones,
+        which are checked in the next round, up to CERTIFICATE_ROUNDS rounds.
+        Rounds stop at the scan deadline.
+        """
+        for _round in range(CERTIFICATE_ROUNDS):
+            hosts = [host for host in self._pending_certificate_hosts
+                     if host not in self.results_by_domain and host not in failed]
+            self._pending_certificate_hosts = []
+            if not hosts:
+                break
+            remaining = None
+            if self.liveness.deadline:
+                remaining = self.liveness.deadline - (time.monotonic() - started)
+                if remaining <= 0:
+                    break
+            logger.info(f"Checking {len(hosts)} subdomains named in TLS certificates")
+            self._passive_hosts.update(hosts)
+            answers = self.resolver.resolve_many(hosts, time.monotonic() + remaining if remaining else None)
+            self._run_checks(self._drop_failed_guesses(answers), failed, deadline=remaining)
+    
+    def _note_certificate_hosts(self, names):
+        """Queue the subdomains of the scanned domain among certificate names for checking"""
+        for host in certificate_hosts(names, self.domain):
+            if host not in self._certificate_hosts:
+                self._certificate_hosts.add(host)
+                self._pending_certificate_hosts.append(host)
+    
+    def _retry_failed(self, failed, started):
+        """Probe hosts that failed with a timeout or reset again, then record their results
+
+        Each round waits retry_backoff seconds, doubled every round, and probes
+        with the timeout ceilings, also doubled every round. Rounds stop at the
+        scan deadline; hosts still failing keep their last result.
+        """
+        metrics.RETRY_QUEUE.inc(amount=len(failed))
+        try:
+            self._retry_rounds(failed, started)
+        finally:
+            metrics.RETRY_QUEUE.dec(amount=len(failed))
+    
+    def _retry_rounds(self, failed, started):
+        failed = dict(failed)
+        for attempt in range(1, self.retries + 1):
+            if not failed:
+                break
+            remaining = None
+            if self.liveness.deadline:
+                remaining = self.liveness.deadline - (time.monotonic() - started)
+                if remaining <= 0:
+                    break
+            delay = self.retry_backoff * 2 ** (attempt - 1)
+            time.sleep(min(delay, remaining) if remaining is not None else delay)
+            if remaining is not None:
+                remaining = self.liveness.deadline - (time.monotonic() - started)
+                if remaining <= 0:
+                    break
+            timeout = tuple(ceiling * 2 ** (attempt - 1) for ceiling in self.liveness.timeouts.ceilings)
+            logger.info(f"Retrying {len(failed)} hosts (attempt {attempt}/{self.retries}, timeouts {timeout})")
+            answers = [DnsAnswer(result['domain'], RESOLVED if result.get('ip_addresses') else ERROR,
+                                 addresses=result.get('ip_addresses'))
+                       for result in failed.values()]
+            retry_failed = {}
+            for result in self._check_answers(answers, lambda answer: failed[answer.host],
+                                              timeout=timeout, deadline=remaining):
+                if result.pop('retryable', False) and attempt < self.retries:
+                    retry_failed[result['domain']] = result
+                else:
+                    self._record_result(result)
+            failed = retry_failed
+        for result in failed.values():
+            self._record_result(result)
+    
+    def _cached_result(self, answer):
+        """Result dict rebuilt from the liveness cache, or None on a miss"""
+        cached = self.cache.get(answer.host)
+        if cached is None:
+            return None
+        fields, checked_at = cached
+        # A host that moved to other addresses may have changed, probe it again
+        if set(fields.get('ip_addresses') or []) != set(answer.addresses):
+            return None
+        checked_at = datetime.fromtimestamp(checked_at)
+        result = {
+            'domain': answer.host,
+            'timestamp': checked_at.strftime("%Y-%m-%d %H:%M:%S"),
+            'checked_at': checked_at,
+            'cached': True,
+        }
+        result.update(fields)
+        return result
+    
+    def _check_domain_liveness(self, domain, timeout=3, address=None):
+        """Check if a domain is active with an HTTP probe and return the result dict
+
+        This runs on the liveness engine's worker threads, so it must not touch
+        the scanner's result lists; the scan loop records the returned result.
+        """
+        try:
+            logger.debug(f"Checking liveness for {domain}")
+            metrics.PROBES_IN_FLIGHT.inc()
+            try:
+                probe = self.prober.probe(domain, timeout=timeout, address=address)
+            finally:
+                metrics.PROBES_IN_FLIGHT.dec()
+            logger.debug(f"Domain {domain} is {'active' if probe.is_active else 'inactive'}")
+            self.profile.probe(probe)
+            if probe.is_active:
+                self.liveness.timeouts.observe(probe.connect_time, probe.response_time)
+            result = self.result_from_probe(domain, probe)
+            if probe.retryable:
+                result['retryable'] = True
+            return result
+            
+        except Exception as e:
+            logger.exception(f"Error checking liveness for {domain}")
+            # Consider the domain inactive if there's an error
+            now = datetime.now()
+            return {
+                'domain': domain,
+                'is_active': False,
+                'response_info': f"Error: {str(e)[:50]}...",
+                'timestamp': now.strftime("%Y-%m-%d %H:%M:%S"),
+                'checked_at': now,
+                'error': str(e)
+            }
+    
+    def result_from_probe(self, domain, probe):
+        """Build the result dict for a domain from a ProbeResult, with its fingerprint fields
+
+        Also used for the results of manual rechecks, see app.py.
+        """
+        now = datetime.now()
+        result = {
+            'domain': domain,
+            'is_active': probe.is_active,
+            'response_info': probe.status_line,
+            'timestamp': now.strftime("%Y-%m-%d %H:%M:%S"),
+            'checked_at': now,
+            'response_headers': probe.header_block()
+        }
+        if probe.fingerprint is not None:
+            result.update(probe.fingerprint.to_dict())
+        return result
+    
+    def _unresolved_result(self, answer):
+        """Result for a domain without DNS address records"""
+        now = datetime.now()
+        return {
+            'domain': answer.host,
+            'is_active': False,
+            'response_info': "No DNS record (NXDOMAIN)" if answer.status == 'nxdomain' else "No DNS address records",
+            'timestamp': now.strftime("%Y-%m-%d %H:%M:%S"),
+            'checked_at': now,
+            'response_headers': None
+        }
+    
+    def _deadline_answer_result(self, answer):
+        """Result for a resolved domain that was not checked before the scan deadline"""
+        result = self._deadline_result(answer.host)
+        result['ip_addresses'] = answer.addresses
+        return result
+    
+    def _deadline_result(self, domain):
+        """Result for a domain that was not checked before the scan deadline"""
+        now = datetime.now()
+        return {
+            'domain': domain,
+            'is_active': False,
+            'response_info': "Skipped: scan deadline reached",
+            'timestamp': now.strftime("%Y-%m-%d %H:%M:%S"),
+            'checked_at': now,
+            'response_headers': None
+        }
+    
+    def _record_result(self, result):
+        """Store a liveness result in the scan result lists and queue it for the database"""
+        with self._results_lock:
+            self.scan_results.append(result)
+            self.results_by_domain[result['domain']] = result
+            if result['is_active']:
+                self.active_domains.append(result)
+            else:
+                self.inactive_domains.append(result)
+        if 'cached' in result:
+            if result['cached']:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+        if result.get('ip_group'):
+            self.ip_groups.setdefault(result['ip_group'], []).append(result['domain'])
+        if result.get('tls_sans'):
+            self._note_certificate_hosts(result['tls_sans'])
+        if self._writer is not None:
+            self._writer.add(result)
+        if self.on_result is not None:
+            self.on_result(result)
+    
+    def apply_recheck(self, fresh):
+        """Update the result of a rechecked domain, found through the domain index
+
+        Returns the updated result dict, or None if the domain is not part of
+        this scan. Call refresh_status_lists() after a batch of rechecks.
+        """
+        with self._results_lock:
+            result = self.results_by_domain.get(fresh['domain'])
+            if result is None:
+                return None
+            if result['is_active'] != fresh['is_active']:
+                self._status_lists_stale = True
+            for field in ('is_active', 'response_info', 'response_headers', 'timestamp', 'checked_at'):
+                result[field] = fresh[field]
+            for field in FINGERPRINT_FIELDS:
+                result[field] = fresh.get(field)
+            return result
+    
+    def refresh_status_lists(self):
+        """Rebuild the active and inactive lists once after rechecks changed statuses"""
+        with self._results_lock:
+            if not self._status_lists_stale:
+                return
+            self.active_domains = [r for r in self.scan_results if r['is_active']]
+            self.inactive_domains = [r for r in self.scan_results if not r['is_active']]
+            self._status_lists_stale = False
+    
+    def _save_to_database(self):
+        """Flush the buffered results and update the scan history counters"""
+        if self._writer is not None:
+            self._writer.finish()
+    
+    @property
+    def scan_id(self):
+        """ID of the ScanHistory record of the current scan, once it has been created"""
+        return self._writer.scan_id if self._writer is not None else None
+    
+    @property
+    def results_saved(self):
+        """Whether every result of the current scan made it to the database"""
+        return self._writer is not None and self._writer.scan_id is not None and not self._writer.failed
+    
+    @property
+    def cache_hit_rate(self):
+        """Share of probe-eligible hosts answered from the liveness cache"""
+        lookups = self.cache_hits + self.cache_misses
+        return self.cache_hits / lookups if lookups else 0.0
+    
+    def shared_backends(self):
+        """IP groups with more than one subdomain behind them, largest first"""
+        groups = [(ip, hosts) for ip, hosts in self.ip_groups.items() if len(hosts) > 1]
+        return sorted(groups, key=lambda group: len(group[1]), reverse=True)
+    
+    def get_csv_data(self):
+        """Generate CSV data from scan results"""
+        if not self.scan_results:
+            return None
+        
+        output = StringIO()
+        csv_writer = csv.writer(output)
+        
+        # Write header
+        csv_writer.writerow(['Domain', 'Status', 'Response Info', 'Timestamp'])
+        
+        # Write data
+        for result in self.scan_results:
+            csv_writer.writerow([
+                result['domain'],
+                'Active' if result['is_active'] else 'Inactive',
+                result['response_info'] if result.get('response_info') else 'N/A',
+                result['timestamp']
+            ])
+        
+        return output.getvalue()
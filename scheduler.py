@@ -0,0 +1,192 @@
+import os
+import random
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, func, select, update
+
+from models import ScanSchedule, ScheduledRun
+from workqueue import worker_name
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCHEDULER_ENABLED = os.environ.get("SCANNER_SCHEDULER", "1").lower() not in ("0", "false", "no")
+DEFAULT_MAX_SCHEDULED_JOBS = int(os.environ.get("SCANNER_SCHEDULE_MAX_JOBS", 2))
+DEFAULT_POLL_INTERVAL = float(os.environ.get("SCANNER_SCHEDULE_POLL_INTERVAL", 30))
+DEFAULT_RUN_TIMEOUT = float(os.environ.get("SCANNER_SCHEDULE_RUN_TIMEOUT", 300))
+
+# Shortest interval a schedule may have
+MIN_INTERVAL_MINUTES = 5
+
+# PostgreSQL advisory lock taken while a scheduler claims a run
+CLAIM_LOCK_KEY = 0x5ca45c4ed
+
+
+def first_run_at(interval_minutes, now=None):
+    """When a new schedule first runs: a random point in its first interval
+
+    Domains added together are spread over the interval instead of all
+    being scanned on the next tick.
+    """
+    now = now or datetime.now()
+    return now + timedelta(minutes=random.uniform(0, interval_minutes))
+
+
+def next_run_at(schedule, now=None):
+    """When a schedule runs after starting at now: one interval later, moved by up to its jitter either way"""
+    now = now or datetime.now()
+    jitter = random.uniform(-schedule.jitter_minutes, schedule.jitter_minutes) if schedule.jitter_minutes else 0
+    # Never schedule the next run sooner than half an interval away
+    minutes = max(schedule.interval_minutes / 2, schedule.interval_minutes + jitter)
+    return now + timedelta(minutes=minutes)
+
+
+class Scheduler:
+    """Starts scans of scheduled domains when they are due
+
+    A background thread checks the scan_schedules table every poll_interval
+    seconds and submits due domains to the job manager like scans from the
+    form, so they run through the same pipeline and are saved to the scan
+    history. Every run is recorded in scheduled_runs with the ID of the
+    scan it saved.
+
+    Any number of application processes can run a scheduler on the same
+    database. A run records the process that owns it, which refreshes its
+    heartbeat_at on every tick while the scan runs; runs whose owner has
+    been silent for run_timeout seconds are marked lost by any scheduler.
+    At most max_jobs scheduled scans run at the same time across all
+    processes, counted from the runs in the table; due schedules beyond
+    that wait, oldest first, for the next free slot. Claims are serialised
+    so two processes can't both take the last slot: on PostgreSQL through
+    an advisory lock held until the claim is committed, on SQLite by its
+    single writer.
+    """
+
+    def __init__(self, app, job_manager, session_factory, max_jobs=None, poll_interval=None, run_timeout=None):
+        self.app = app
+        self.job_manager = job_manager
+        self.session_factory = session_factory
+        self.max_jobs = max_jobs or DEFAULT_MAX_SCHEDULED_JOBS
+        self.poll_interval = poll_interval or DEFAULT_POLL_INTERVAL
+        # Heartbeats are sent once per tick, so allow for a few missed ones
+        self.run_timeout = max(run_timeout or DEFAULT_RUN_TIMEOUT, 3 * self.poll_interval)
+        self.owner = worker_name()
+        # ScheduledRun ID -> ScanJob of the scheduled scans started by this process
+        self._running = {}
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the scheduler thread"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name='scan-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+    def wake(self):
+        """Check for due schedules now, e.g. after one was added or run manually"""
+        self._wakeup.set()
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            try:
+                with self.app.app_context():
+                    self.tick()
+            except Exception:
+                logger.exception("Error in scan scheduler")
+                with self.app.app_context():
+                    self.session_factory().rollback()
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def tick(self, now=None):
+        """Record finished runs, then start due schedules while there are free slots"""
+        now = now or datetime.now()
+        session = self.session_factory()
+        self._reap(session, now)
+        self._mark_lost(session, now)
+        slots = self.max_jobs - session.execute(select(func.count()).select_from(ScheduledRun).where(self._live_runs(now))).scalar()
+        if slots <= 0:
+            return
+        due = session.execute(
+            select(ScanSchedule)
+            .where(ScanSchedule.enabled.is_(True), ScanSchedule.next_run_at <= now)
+            .order_by(ScanSchedule.next_run_at)
+            .limit(slots)
+        ).scalars().all()
+        for schedule in due:
+            self._start(session, schedule, now)
+
+    def _live_runs(self, now):
+        """Condition for runs in progress whose owner is still sending heartbeats"""
+        stale = now - timedelta(seconds=self.run_timeout)
+        return and_(ScheduledRun.status == ScheduledRun.QUEUED,
+                    func.coalesce(ScheduledRun.heartbeat_at, ScheduledRun.started_at) >= stale)
+
+    def _start(self, session, schedule, now):
+        # Claim the run by moving next_run_at on, unless another scheduler already did or all slots are taken.
+        # Under READ COMMITTED two claims could both count the same free slot, so they take turns.
+        if session.get_bind().dialect.name == 'postgresql':
+            session.execute(select(func.pg_advisory_xact_lock(CLAIM_LOCK_KEY)))
+        running = select(func.count()).select_from(ScheduledRun).where(self._live_runs(now)).scalar_subquery()
+        claimed = session.execute(
+            update(ScanSchedule)
+            .where(ScanSchedule.id == schedule.id, ScanSchedule.next_run_at == schedule.next_run_at,
+                   running < self.max_jobs)
+            .values(next_run_at=next_run_at(schedule, now), last_run_at=now)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not claimed:
+            session.commit()
+            return
+        run = ScheduledRun(schedule_id=schedule.id, started_at=now, owner=self.owner, heartbeat_at=now)
+        session.add(run)
+        session.commit()
+        try:
+            job = self.job_manager.submit(schedule.domain, mode=schedule.scan_mode)
+        except Exception:
+            run.status = ScheduledRun.FAILED
+            run.finished_at = datetime.now()
+            session.commit()
+            raise
+        run.job_id = job.id
+        session.commit()
+        self._running[run.id] = job
+        logger.info(f"Started scheduled scan of {schedule.domain} (job {job.id})")
+
+    def _reap(self, session, now):
+        """Record the outcome of this process's finished runs and keep the others alive"""
+        finished = [(run_id, job) for run_id, job in self._running.items() if job.finished]
+        for run_id, job in finished:
+            session.execute(
+                update(ScheduledRun)
+                .where(ScheduledRun.id == run_id)
+                .values(status=job.state, scan_id=job.scanner.scan_id, finished_at=job.finished_at)
+            )
+            del self._running[run_id]
+        if self._running:
+            session.execute(
+                update(ScheduledRun)
+                .where(ScheduledRun.id.in_(list(self._running)), ScheduledRun.status == ScheduledRun.QUEUED)
+                .values(heartbeat_at=now)
+            )
+        session.commit()
+
+    def _mark_lost(self, session, now):
+        """Mark runs whose owner stopped sending heartbeats as lost"""
+        stale = now - timedelta(seconds=self.run_timeout)
+        lost = session.execute(
+            update(ScheduledRun)
+            .where(ScheduledRun.status == ScheduledRun.QUEUED,
+                   func.coalesce(ScheduledRun.heartbeat_at, ScheduledRun.started_at) < stale)
+            .values(status=ScheduledRun.LOST, finished_at=now)
+        ).rowcount
+        session.commit()
+        if lost:
+            logger.warning(f"Marked {lost} scheduled runs as lost, their process stopped sending heartbeats")
@@ -35,7 +35,7 @@ echo ".env file created with SQLite configuration."
 cat > run.sh << EOF
 #!/bin/bash
 source venv/bin/activate
-gunicorn --bind 0.0.0.0:5003 main:app
+gunicorn --bind 0.0.0.0:5003 --workers 1 --threads 16 main:app
 EOF
 chmod +x run.sh
 
@@ -1,13 +1,41 @@
+// Read a fetch() response of NDJSON lines, calling onRecord with each parsed
+// line as it arrives. Returns a promise that resolves once the stream ends and
+// rejects with the server's error message for error responses. Shared with the
+// page scripts, e.g. the history detail page.
+function readNdjson(response, onRecord) {
+    if (!response.ok) {
+        return response.json().then(data => { throw new Error(data.error || 'Unknown error'); });
+    }
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = '';
+    function read() {
+        return reader.read().then(({done, value}) => {
+            buffered += decoder.decode(value || new Uint8Array(), {stream: !done});
+            const lines = buffered.split('\n');
+            // The last piece is a partial line, unless the stream ended without a newline
+            buffered = done ? '' : lines.pop();
+            lines.filter(line => line.trim()).forEach(line => onRecord(JSON.parse(line)));
+            if (!done) return read();
+        });
+    }
+    return read();
+}
+
 // Handle form submission and progress updates
 document.addEventListener('DOMContentLoaded', function() {
     const scanForm = document.getElementById('scan-form');
     const scanButton = document.getElementById('scan-button');
     const scanProgress = document.getElementById('scan-progress');
     const scanStatusMessage = document.getElementById('scan-status-message');
+    // ID of the scan job shown on this page, if any
+    const jobId = scanProgress ? scanProgress.dataset.jobId : '';
     
-    // If we have an ongoing scan, check status immediately
-    if (scanProgress.style.display !== 'none') {
-        pollScanStatus();
+    const resultsSection = document.getElementById('results-section');
+    
+    // If we have an ongoing scan, follow its progress stream
+    if (jobId && scanProgress.style.display !== 'none') {
+        followScan();
     }
     
     // Handle form submission
@@ -18,130 +46,291 @@ document.addEventListener('DOMContentLoaded', function() {
             scanButton.innerHTML = '<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> Scanning...';
             scanProgress.style.display = 'block';
             
-            // Start polling for status updates
-            setTimeout(pollScanStatus, 1000);
+            // The form submits the scan as a background job and the page
+            // reloads with the new job ID. followScan() then follows the job's
+            // server-sent events; the server ends each stream after
+            // SSE_MAX_DURATION (25s) and the EventSource reconnects, resuming
+            // after the last result it received
         });
     }
     
-    // Function to poll the server for scan status
-    function pollScanStatus() {
-        fetch('/status')
-            .then(response => response.json())
-            .then(data => {
-                // Update UI based on scan status
-                if (data.scan_in_progress) {
-                    // If scanning is still in progress, continue polling
-                    setTimeout(pollScanStatus, 2000);
-                    scanStatusMessage.textContent = `Scanning subdomains. Found ${data.total_count} so far (${data.active_count} active, ${data.inactive_count} inactive)...`;
-                } else {
-                    // Scan completed or encountered an error
-                    if (data.error_message) {
-                        scanStatusMessage.textContent = 'Error: ' + data.error_message;
-                        scanStatusMessage.classList.add('text-danger');
-                    } else if (data.scan_completed) {
-                        // Reload the page to show results
-                        window.location.reload();
-                    }
-                    
-                    // Re-enable the scan button
-                    scanButton.disabled = false;
-                    scanButton.innerHTML = '<i class="fas fa-search me-1"></i> Scan Subdomains';
-                }
-            })
-            .catch(error => {
-                console.error('Error checking scan status:', error);
-                scanStatusMessage.textContent = 'Error checking scan status. Please try again.';
-                scanStatusMessage.classList.add('text-danger');
-                
-                // Re-enable the scan button
-                scanButton.disabled = false;
-                scanButton.innerHTML = '<i class="fas fa-search me-1"></i> Scan Subdomains';
-                
-                // Hide progress after error
-                setTimeout(() => {
-                    scanProgress.style.display = 'none';
-                }, 3000);
-            });
+    // Follow the scan job's server-sent events, appending each result as it arrives
+    function followScan() {
+        const rendered = resultsSection ? resultsSection.dataset.rendered : 0;
+        const events = new EventSource(`/events/${jobId}?after=${rendered}`);
+        // Rows are added to the tables in batches, redrawing once per batch
+        let pendingRows = [];
+        let flushTimer = null;
+        
+        events.addEventListener('result', function(e) {
+            pendingRows.push(JSON.parse(e.data));
+            if (!flushTimer) {
+                flushTimer = setTimeout(flushRows, 250);
+            }
+        });
+        
+        events.addEventListener('status', function(e) {
+            updateStatus(JSON.parse(e.data));
+        });
+        
+        events.addEventListener('done', function(e) {
+            events.close();
+            flushRows();
+            finishScan(JSON.parse(e.data));
+        });
+        
+        // The server ends each stream after a while; the browser reconnects on
+        // its own and resumes after the last result
+        let reconnecting = false;
+        events.addEventListener('reconnect', function() {
+            reconnecting = true;
+        });
+        events.addEventListener('open', function() {
+            reconnecting = false;
+        });
+        
+        events.onerror = function() {
+            if (!reconnecting) {
+                scanStatusMessage.textContent = 'Connection to the scan lost, reconnecting...';
+            }
+        };
+        
+        function flushRows() {
+            clearTimeout(flushTimer);
+            flushTimer = null;
+            if (pendingRows.length) {
+                appendResults(pendingRows);
+                pendingRows = [];
+            }
+        }
+    }
+    
+    function updateStatus(data) {
+        if (data.state === 'queued') {
+            // Waiting for a free worker in the scan job pool
+            scanStatusMessage.textContent = 'Waiting for a free scan worker...';
+        } else if (data.scan_in_progress) {
+            scanStatusMessage.textContent = `Scanning subdomains. Found ${data.total_count} so far (${data.active_count} active, ${data.inactive_count} inactive)...`;
+        }
+    }
+    
+    function finishScan(data) {
+        if (data.error_message) {
+            scanStatusMessage.textContent = 'Error: ' + data.error_message;
+            scanStatusMessage.classList.add('text-danger');
+        } else {
+            scanProgress.style.display = 'none';
+        }
+        if (data.scan_completed) {
+            const exportButton = document.getElementById('export-button');
+            if (exportButton) exportButton.classList.remove('disabled');
+            if (data.scan_mode === 'diff' && data.scan_id) {
+                document.getElementById('diff-base').textContent = data.base_scan_id;
+                document.getElementById('diff-link').href = `/history/${data.scan_id}`;
+                document.getElementById('diff-alert').style.display = 'block';
+            }
+            if (data.cache_hits) {
+                const checked = data.cache_hits + data.cache_misses;
+                document.getElementById('cache-summary-text').textContent =
+                    `${data.cache_hits} of ${checked} subdomains (${Math.round(data.cache_hit_rate * 100)}%) were answered from recently cached results.`;
+                document.getElementById('cache-summary').style.display = 'block';
+            }
+        }
+        
+        // Re-enable the scan button
+        scanButton.disabled = false;
+        scanButton.innerHTML = '<i class="fas fa-search me-1"></i> Scan Subdomains';
+    }
+    
+    // Add result rows to the All, Active and Inactive tables
+    function appendResults(results) {
+        const allRows = results.map(result => resultRow(result, true));
+        const activeRows = results.filter(result => result.is_active).map(result => resultRow(result, false));
+        const inactiveRows = results.filter(result => !result.is_active).map(result => resultRow(result, false));
+        addRows('#all-table', allRows);
+        addRows('#active-table', activeRows);
+        addRows('#inactive-table', inactiveRows);
+        incrementCount('all-count', allRows.length);
+        incrementCount('active-count', activeRows.length);
+        incrementCount('inactive-count', inactiveRows.length);
     }
     
-    // Set up recheck buttons
-    setupRecheckButtons();
+    function addRows(selector, rows) {
+        if (!rows.length) return;
+        if ($.fn.dataTable.isDataTable(selector)) {
+            $(selector).DataTable().rows.add($(rows)).draw(false);
+        } else {
+            const body = document.querySelector(`${selector} tbody`);
+            rows.forEach(row => body.appendChild(row));
+        }
+    }
+    
+    function incrementCount(id, count) {
+        const element = document.getElementById(id);
+        if (element) element.textContent = parseInt(element.textContent, 10) + count;
+    }
+    
+    // Build a table row like the ones rendered by index.html; withStatus adds the Status column
+    function resultRow(result, withStatus) {
+        const row = document.createElement('tr');
+        
+        const domainCell = document.createElement('td');
+        if (result.is_active || withStatus) {
+            const link = document.createElement('a');
+            link.href = result.is_active ? `https://${result.domain}` : result.domain;
+            link.target = '_blank';
+            link.textContent = result.domain;
+            if (!result.is_active) link.className = 'text-danger';
+            domainCell.appendChild(link);
+        } else {
+            domainCell.className = 'text-danger';
+            domainCell.textContent = result.domain;
+        }
+        row.appendChild(domainCell);
+        
+        if (withStatus) {
+            const statusCell = document.createElement('td');
+            const badge = document.createElement('span');
+            badge.className = result.is_active ? 'badge bg-success' : 'badge bg-danger';
+            badge.textContent = result.is_active ? 'Active' : 'Inactive';
+            statusCell.appendChild(badge);
+            row.appendChild(statusCell);
+        }
+        
+        const responseCell = document.createElement('td');
+        responseCell.id = `response-${result.domain}`;
+        responseCell.appendChild(document.createTextNode(result.response_info || 'N/A'));
+        if (result.response_info === 'No response') {
+            const button = document.createElement('button');
+            button.className = 'btn btn-sm btn-outline-secondary ms-2 recheck-button';
+            button.dataset.domain = result.domain;
+            button.title = 'Recheck this domain';
+            button.innerHTML = '<span class="spinner-border spinner-border-sm" role="status" style="display: none;"></span><i class="fas fa-sync-alt"></i>';
+            responseCell.appendChild(button);
+        }
+        row.appendChild(responseCell);
+        
+        const timestampCell = document.createElement('td');
+        timestampCell.textContent = result.timestamp || '';
+        row.appendChild(timestampCell);
+        return row;
+    }
+    
+    // Recheck buttons, including the ones on rows added while a scan runs
+    document.addEventListener('click', function(e) {
+        const button = e.target.closest('.recheck-button');
+        if (button) {
+            e.preventDefault();
+            recheckDomain.call(button);
+        }
+    });
+    
+    // Recheck the domain of the clicked button and update its response cells
+    function recheckDomain() {
+        console.log("Recheck button clicked");
+        
+        const domain = this.getAttribute('data-domain');
+        console.log("Rechecking domain:", domain);
+        
+        // Find the parent cell that contains this button
+        const responseCell = this.parentElement;
+        console.log("Response cell:", responseCell);
+        
+        const buttonSpinner = this.querySelector('.spinner-border');
+        const buttonIcon = this.querySelector('.fa-sync-alt');
+        
+        // Disable button and show spinner
+        this.disabled = true;
+        if (buttonIcon) buttonIcon.style.display = 'none';
+        if (buttonSpinner) buttonSpinner.style.display = 'inline-block';
+        
+        // Make the API call to recheck the domain
+        console.log("Sending request to:", `/recheck/${domain}?job=${jobId}`);
+        fetch(`/recheck/${domain}?job=${jobId}`, {
+            method: 'POST'
+        })
+        .then(response => {
+            console.log("Got response:", response);
+            return response.json();
+        })
+        .then(data => {
+            console.log("Response data:", data);
+            if (data.success) {
+                updateResponseCells(domain, data.response_info);
+            } else {
+                console.error("Error from server:", data.error);
+                alert('Error: ' + (data.error || 'Unknown error'));
+            }
+        })
+        .catch(error => {
+            console.error('Error rechecking domain:', error);
+            alert('Error rechecking domain. Please try again.');
+        })
+        .finally(() => {
+            // Re-enable button and hide spinner
+            this.disabled = false;
+            if (buttonIcon) buttonIcon.style.display = 'inline-block';
+            if (buttonSpinner) buttonSpinner.style.display = 'none';
+        });
+    }
     
-    // Function to set up recheck buttons
-    function setupRecheckButtons() {
-        console.log("Setting up recheck buttons");
-        document.querySelectorAll('.recheck-button').forEach(button => {
-            console.log("Found recheck button for:", button.getAttribute('data-domain'));
+    // Update all instances of a domain's response cells after a recheck
+    function updateResponseCells(domain, responseInfo) {
+        document.querySelectorAll(`[id="response-${domain}"]`).forEach(cell => {
+            // Keep only the text content from the first text node (remove any existing buttons or other elements)
+            const originalTextNode = Array.from(cell.childNodes).find(node => node.nodeType === Node.TEXT_NODE);
+            if (originalTextNode) {
+                originalTextNode.textContent = responseInfo;
+            } else {
+                const textNode = document.createTextNode(responseInfo);
+                cell.insertBefore(textNode, cell.firstChild);
+            }
+            
+            // Briefly highlight the updated cell
+            cell.classList.add('bg-light');
+            setTimeout(() => {
+                cell.classList.remove('bg-light');
+            }, 2000);
             
-            button.addEventListener('click', function(e) {
-                e.preventDefault();
-                console.log("Recheck button clicked");
-                
-                const domain = this.getAttribute('data-domain');
-                console.log("Rechecking domain:", domain);
-                
-                // Find the parent cell that contains this button
-                const responseCell = this.parentElement;
-                console.log("Response cell:", responseCell);
-                
-                const buttonSpinner = this.querySelector('.spinner-border');
-                const buttonIcon = this.querySelector('.fa-sync-alt');
-                
-                // Disable button and show spinner
-                this.disabled = true;
-                if (buttonIcon) buttonIcon.style.display = 'none';
-                if (buttonSpinner) buttonSpinner.style.display = 'inline-block';
-                
-                // Make the API call to recheck the domain
-                console.log("Sending request to:", `/recheck/${domain}`);
-                fetch(`/recheck/${domain}`, {
-                    method: 'POST'
-                })
-                .then(response => {
-                    console.log("Got response:", response);
-                    return response.json();
-                })
-                .then(data => {
-                    console.log("Response data:", data);
-                    if (data.success) {
-                        // Update all instances of this domain's response cells
-                        document.querySelectorAll(`[id="response-${domain}"]`).forEach(cell => {
-                            // Keep only the text content from the first text node (remove any existing buttons or other elements)
-                            const originalTextNode = Array.from(cell.childNodes).find(node => node.nodeType === Node.TEXT_NODE);
-                            if (originalTextNode) {
-                                originalTextNode.textContent = data.response_info;
-                            } else {
-                                const textNode = document.createTextNode(data.response_info);
-                                cell.insertBefore(textNode, cell.firstChild);
-                            }
-                            
-                            // Briefly highlight the updated cell
-                            cell.classList.add('bg-light');
-                            setTimeout(() => {
-                                cell.classList.remove('bg-light');
-                            }, 2000);
-                            
-                            // If the response is no longer "No response", hide all recheck buttons for this domain
-                            if (data.response_info !== "No response") {
-                                const buttons = cell.querySelectorAll('.recheck-button');
-                                buttons.forEach(btn => btn.style.display = 'none');
-                            }
-                        });
-                    } else {
-                        console.error("Error from server:", data.error);
-                        alert('Error: ' + (data.error || 'Unknown error'));
-                    }
-                })
-                .catch(error => {
-                    console.error('Error rechecking domain:', error);
-                    alert('Error rechecking domain. Please try again.');
-                })
-                .finally(() => {
-                    // Re-enable button and hide spinner
-                    this.disabled = false;
-                    if (buttonIcon) buttonIcon.style.display = 'inline-block';
-                    if (buttonSpinner) buttonSpinner.style.display = 'none';
-                });
+            // If the response is no longer "No response", hide all recheck buttons for this domain
+            if (responseInfo !== "No response") {
+                const buttons = cell.querySelectorAll('.recheck-button');
+                buttons.forEach(btn => btn.style.display = 'none');
+            }
+        });
+    }
+    
+    // Recheck every inactive domain of the scan in one request, updating cells as results stream in
+    const recheckAllButton = document.getElementById('recheck-all-inactive');
+    if (recheckAllButton) {
+        recheckAllButton.addEventListener('click', function() {
+            const button = this;
+            const label = button.innerHTML;
+            let checked = 0;
+            let revived = 0;
+            button.disabled = true;
+            button.innerHTML = '<span class="spinner-border spinner-border-sm" role="status"></span> Rechecking...';
+            fetch('/recheck?stream=1', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({job: jobId, all_inactive: true})
+            })
+            .then(response => readNdjson(response, result => {
+                checked += 1;
+                if (result.is_active) revived += 1;
+                updateResponseCells(result.domain, result.response_info);
+                button.innerHTML = `<span class="spinner-border spinner-border-sm" role="status"></span> Rechecked ${checked}...`;
+            }))
+            .then(() => {
+                alert(`Rechecked ${checked} inactive domains, ${revived} of them responded.`);
+            })
+            .catch(error => {
+                console.error('Error rechecking inactive domains:', error);
+                alert('Error rechecking inactive domains: ' + error.message);
+            })
+            .finally(() => {
+                button.disabled = false;
+                button.innerHTML = label;
             });
         });
     }
@@ -0,0 +1,117 @@
+import sqlite3
+from sqlalchemy import BigInteger, Integer, create_engine, event, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import DeclarativeBase, scoped_session, sessionmaker
+
+# Database setup shared by the web application and the command line scanner.
+# Nothing here imports Flask; database.py binds it to Flask-SQLAlchemy.
+
+# Define database model base class
+class Base(DeclarativeBase):
+    pass
+
+# Scan results are committed in batches while a scan runs. In SQLite's default
+# rollback-journal mode every commit is a full fsync, and readers block the
+# writer, so switch SQLite databases to WAL with normal synchronisation.
+@event.listens_for(Engine, "connect")
+def _configure_sqlite(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+def upgrade_schema(engine):
+    """Bring existing tables up to date with the models
+
+    create_all() only creates missing tables, so columns added to existing
+    models are added here with ALTER TABLE, and missing indexes are created.
+    Only nullable columns are added, which is all the models need for now.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            if engine.dialect.name == 'postgresql':
+                _widen_integer_columns(connection, inspector, table)
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+        if 'scan_results' in existing_tables:
+            scan_result_columns = {column['name'] for column in inspector.get_columns('scan_results')}
+            if 'response_info' in scan_result_columns:
+                _normalise_response_info(connection)
+
+
+def _widen_integer_columns(connection, inspector, table):
+    """Turn INTEGER columns of a PostgreSQL table that the models now declare as BIGINT into BIGINT
+
+    SQLite stores integers of any size in an INTEGER column, so only
+    PostgreSQL needs this.
+    """
+    existing_types = {column['name']: column['type'] for column in inspector.get_columns(table.name)}
+    for column in table.columns:
+        existing_type = existing_types.get(column.name)
+        if (isinstance(column.type, BigInteger) and isinstance(existing_type, Integer)
+                and not isinstance(existing_type, BigInteger)):
+            connection.execute(text(f'ALTER TABLE {table.name} ALTER COLUMN {column.name} TYPE BIGINT'))
+
+
+def _normalise_response_info(connection):
+    """Move response texts stored inline in scan_results into the response_infos lookup table
+
+    Databases created before the lookup table still have the old
+    response_info column. It is dropped once its rows are migrated, so later
+    startups don't scan scan_results for it again. SQLite before 3.35 can't
+    drop columns; there the column is only emptied and checked for
+    leftover rows on startup.
+    """
+    from models import ResponseInfo
+
+    can_drop = connection.dialect.name != 'sqlite' or sqlite3.sqlite_version_info >= (3, 35, 0)
+    if not can_drop and connection.execute(text(
+        'SELECT 1 FROM scan_results WHERE response_info IS NOT NULL LIMIT 1'
+    )).first() is None:
+        return
+    connection.execute(text(
+        'INSERT INTO response_infos (text) '
+        'SELECT DISTINCT response_info FROM scan_results '
+        'WHERE response_info IS NOT NULL '
+        'AND response_info NOT IN (SELECT text FROM response_infos)'
+    ))
+    connection.execute(text(
+        'UPDATE scan_results SET response_info_id = '
+        '(SELECT id FROM response_infos WHERE response_infos.text = scan_results.response_info), '
+        'response_info = NULL '
+        'WHERE response_info IS NOT NULL'
+    ))
+    unparsed = connection.execute(text('SELECT id, text FROM response_infos WHERE status_code IS NULL')).all()
+    for row_id, response_text in unparsed:
+        status_code = ResponseInfo.parse_status_code(response_text)
+        if status_code is not None:
+            connection.execute(text('UPDATE response_infos SET status_code = :code WHERE id = :id'),
+                               {'code': status_code, 'id': row_id})
+    if can_drop:
+        connection.execute(text('ALTER TABLE scan_results DROP COLUMN response_info'))
+
+
+def create_session_factory(database_url):
+    """Create the tables for database_url and return a thread-local session factory
+
+    Used outside the web application, where there is no Flask-SQLAlchemy.
+    """
+    # Make sure every model is mapped before the tables are created
+    import models  # noqa: F401
+
+    engine = create_engine(database_url, pool_pre_ping=True)
+    Base.metadata.create_all(engine)
+    upgrade_schema(engine)
+    return scoped_session(sessionmaker(bind=engine))
@@ -0,0 +1,95 @@
+"""Two schedulers sharing one database must never run more than max_jobs scans together
+
+Runs against SQLite in a temporary directory, or against the database in
+SCANNER_TEST_DATABASE_URL (e.g. a scratch PostgreSQL database) when set.
+"""
+import os
+import sys
+import uuid
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import delete, func, select
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import ScanSchedule, ScheduledRun  # noqa: E402
+from scheduler import Scheduler  # noqa: E402
+from storage import create_session_factory  # noqa: E402
+
+MAX_JOBS = 2
+
+
+class FakeJob:
+    """A scan that never finishes, so every claimed run keeps its slot"""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.finished = False
+
+
+class FakeJobManager:
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, domain, **options):
+        job = FakeJob()
+        self.jobs.append(job)
+        return job
+
+
+@pytest.fixture
+def database_url(tmp_path):
+    return os.environ.get("SCANNER_TEST_DATABASE_URL") or f"sqlite:///{tmp_path / 'scheduler.db'}"
+
+
+def _seed(session_factory, count):
+    session = session_factory()
+    session.execute(delete(ScheduledRun))
+    session.execute(delete(ScanSchedule))
+    due = datetime.now() - timedelta(minutes=1)
+    for n in range(count):
+        session.add(ScanSchedule(domain=f"domain{n}.example.com", interval_minutes=60, jitter_minutes=0,
+                                 scan_mode='full', enabled=True, next_run_at=due))
+    session.commit()
+    session_factory.remove()
+
+
+def test_schedulers_share_the_job_cap(database_url):
+    # Separate engines stand in for separate application processes
+    factories = [create_session_factory(database_url) for _ in range(2)]
+    _seed(factories[0], 8)
+    managers = [FakeJobManager() for _ in factories]
+    schedulers = [Scheduler(None, manager, factory, max_jobs=MAX_JOBS, poll_interval=60)
+                  for manager, factory in zip(managers, factories)]
+    for number, scheduler in enumerate(schedulers):
+        scheduler.owner = f"process-{number}"
+
+    barrier = threading.Barrier(len(schedulers))
+
+    def run(scheduler, factory):
+        try:
+            for _ in range(10):
+                barrier.wait()
+                try:
+                    scheduler.tick()
+                except Exception:
+                    # As in Scheduler._loop: a failed tick is retried on the next one
+                    factory().rollback()
+        finally:
+            factory.remove()
+
+    threads = [threading.Thread(target=run, args=pair) for pair in zip(schedulers, factories)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    session = factories[0]()
+    running = session.execute(
+        select(func.count()).select_from(ScheduledRun).where(ScheduledRun.status == ScheduledRun.QUEUED)
+    ).scalar()
+    assert running == MAX_JOBS
+    assert sum(len(manager.jobs) for manager in managers) == MAX_JOBS
+    factories[0].remove()
@@ -0,0 +1,75 @@
+"""Run scan workers that probe hosts from the database work queue
+
+Usage: python worker.py [--db URL] [--processes N] [--concurrency 32] [--timeout 3] [--idle-exit SECONDS]
+
+Workers claim batches of hosts queued by scans started with
+`cli.py --distributed`, probe them and save the results to the scan. Start
+them on as many machines as needed, all pointing at the same database
+(DATABASE_URL unless --db is given). Each process runs one worker; by
+default one process per CPU core is started.
+"""
+import os
+import sys
+import logging
+import argparse
+import multiprocessing
+
+logger = logging.getLogger(__name__)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", metavar="URL", help="database holding the work queue (default: DATABASE_URL)")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="worker processes to start")
+    parser.add_argument("--concurrency", type=int, help="probes in flight per worker process")
+    parser.add_argument("--timeout", type=float, help="per-probe timeout in seconds")
+    parser.add_argument("--idle-exit", type=float, metavar="SECONDS",
+                        help="stop once the queue has been empty this long (default: run until interrupted)")
+    parser.add_argument("-v", "--verbose", action="count", default=0)
+    return parser
+
+
+def run_worker(url, verbose=0, idle_timeout=None, **scanner_options):
+    """Run one worker against the database at url until stopped or idle"""
+    logging.basicConfig(level=(logging.WARNING, logging.INFO, logging.DEBUG)[min(verbose, 2)],
+                        format="%(asctime)s %(levelname)s %(processName)s %(name)s: %(message)s",
+                        stream=sys.stderr)
+    from storage import create_session_factory
+    from workqueue import WorkQueue, ScanWorker
+
+    session_factory = create_session_factory(url)
+    worker = ScanWorker(WorkQueue(session_factory), **scanner_options)
+    try:
+        worker.run(idle_timeout=idle_timeout)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        session_factory.remove()
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    url = args.db or os.environ.get("DATABASE_URL")
+    if not url:
+        raise SystemExit("--db needs a URL or DATABASE_URL")
+    options = {'verbose': args.verbose, 'idle_timeout': args.idle_exit,
+               'concurrency': args.concurrency, 'timeout': args.timeout}
+
+    if args.processes <= 1:
+        run_worker(url, **options)
+        return 0
+    processes = [multiprocessing.Process(target=run_worker, args=(url,), kwargs=options, name=f"worker-{number}")
+                 for number in range(args.processes)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
+    return 0 if all(process.exitcode == 0 for process in processes) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,354 @@
+import os
+import json
+import time
+import socket
+import logging
+import secrets
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, func, insert, or_, select, update
+
+from models import ScanTask, ScanResult
+from persistence import result_row, with_response_ids
+from resolver import DnsAnswer
+from scanner import SubdomainScanner
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TASK_SIZE = int(os.environ.get("SCANNER_TASK_SIZE", 100))
+DEFAULT_HEARTBEAT_INTERVAL = float(os.environ.get("SCANNER_HEARTBEAT_INTERVAL", 10))
+DEFAULT_CLAIM_TIMEOUT = float(os.environ.get("SCANNER_CLAIM_TIMEOUT", 60))
+DEFAULT_TASK_ATTEMPTS = int(os.environ.get("SCANNER_TASK_ATTEMPTS", 3))
+
+# Seconds an idle worker waits before looking for tasks again
+IDLE_POLL_INTERVAL = 1.0
+# Longest pause between attempts while the database or the scanner keeps failing
+MAX_ERROR_BACKOFF = 30.0
+# Errors in a row after which a scan's coordinating process gives up on the queue
+MAX_CONSECUTIVE_ERRORS = 10
+
+
+def worker_name():
+    """Name identifying this worker in its claims: host, process and a random suffix"""
+    return f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(3)}"
+
+
+class WorkQueue:
+    """Batches of resolved hosts in the scan_tasks table, shared by scan processes on any number of machines
+
+    A coordinating scanner enqueues the hosts of its scan in tasks of
+    task_size hosts; workers claim tasks, probe their hosts and complete
+    them together with their results. A claim is kept alive by heartbeats;
+    one without a heartbeat for claim_timeout seconds is handed to the next
+    worker that asks, until it has been claimed max_attempts times.
+
+    On PostgreSQL a claim locks the task row with SELECT ... FOR UPDATE SKIP
+    LOCKED, so concurrent workers pick different tasks without waiting. Other
+    databases such as SQLite claim with a conditional UPDATE instead, and a
+    worker that loses the race tries the next task. Claim times come from
+    the workers' clocks, which should be within a fraction of claim_timeout.
+
+    session_factory is a scoped_session (see storage.create_session_factory),
+    as the queue is used from several threads.
+    """
+
+    def __init__(self, session_factory, task_size=None, claim_timeout=None, max_attempts=None):
+        self.session_factory = session_factory
+        self.task_size = task_size or DEFAULT_TASK_SIZE
+        self.claim_timeout = claim_timeout or DEFAULT_CLAIM_TIMEOUT
+        self.max_attempts = max_attempts or DEFAULT_TASK_ATTEMPTS
+
+    def enqueue(self, scan_id, domain, answers):
+        """Add the DnsAnswers of a scan as tasks while they arrive, returning the number of hosts queued
+
+        Each task is committed as soon as it is full, so workers start on
+        the first hosts while later ones are still being resolved.
+        """
+        session = self.session_factory()
+        batch = []
+        count = 0
+        for answer in answers:
+            batch.append([answer.host, answer.status, answer.addresses])
+            if len(batch) >= self.task_size:
+                self._add_task(session, scan_id, domain, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            self._add_task(session, scan_id, domain, batch)
+            count += len(batch)
+        return count
+
+    def _add_task(self, session, scan_id, domain, batch):
+        session.execute(insert(ScanTask), [{
+            'scan_id': scan_id,
+            'domain': domain,
+            'payload': json.dumps(batch, separators=(',', ':')),
+            'size': len(batch),
+            'status': ScanTask.PENDING,
+            'attempts': 0,
+        }])
+        session.commit()
+
+    def _claimable(self, now):
+        stale = now - timedelta(seconds=self.claim_timeout)
+        return or_(ScanTask.status == ScanTask.PENDING,
+                   and_(ScanTask.status == ScanTask.CLAIMED, ScanTask.heartbeat_at < stale,
+                        ScanTask.attempts < self.max_attempts))
+
+    def claim(self, worker_id):
+        """Claim the oldest available task for worker_id and return it, or None when there is none"""
+        session = self.session_factory()
+        locking = session.get_bind().dialect.name == 'postgresql'
+        for _attempt in range(5):
+            now = datetime.now()
+            candidate = select(ScanTask.id).where(self._claimable(now)).order_by(ScanTask.id).limit(1)
+            if locking:
+                candidate = candidate.with_for_update(skip_locked=True)
+            task_id = session.execute(candidate).scalar()
+            if task_id is None:
+                session.commit()
+                return None
+            # The condition is checked again, as without row locks another worker may have won
+            claimed = session.execute(
+                update(ScanTask)
+                .where(ScanTask.id == task_id, self._claimable(now))
+                .values(status=ScanTask.CLAIMED, worker_id=worker_id, claimed_at=now, heartbeat_at=now,
+                        attempts=ScanTask.attempts + 1)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            session.commit()
+            if claimed:
+                task = session.get(ScanTask, task_id)
+                if task.attempts > 1:
+                    logger.info(f"Took over task {task_id} of scan {task.scan_id} (attempt {task.attempts})")
+                return task
+        return None
+
+    def heartbeat(self, task_id, worker_id):
+        """Keep a claim alive, returning False if the task was taken over in the meantime"""
+        session = self.session_factory()
+        try:
+            kept = session.execute(
+                update(ScanTask)
+                .where(ScanTask.id == task_id, ScanTask.worker_id == worker_id, ScanTask.status == ScanTask.CLAIMED)
+                .values(heartbeat_at=datetime.now())
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            session.commit()
+            return bool(kept)
+        except Exception:
+            logger.exception(f"Error sending heartbeat for task {task_id}")
+            session.rollback()
+            return True
+
+    def complete(self, task, worker_id, results):
+        """Save the result dicts of a claimed task and mark it done, in one transaction
+
+        Returns False, saving nothing, when the task was taken over by
+        another worker, so every host's result is stored exactly once.
+        """
+        session = self.session_factory()
+        rows = with_response_ids(session, [result_row(task.scan_id, result) for result in results])
+        owned = session.execute(
+            update(ScanTask)
+            .where(ScanTask.id == task.id, ScanTask.worker_id == worker_id, ScanTask.status == ScanTask.CLAIMED)
+            .values(status=ScanTask.DONE, finished_at=datetime.now())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not owned:
+            session.rollback()
+            return False
+        if rows:
+            session.execute(insert(ScanResult), rows)
+        session.commit()
+        return True
+
+    def remaining(self, scan_id):
+        """Number of tasks of a scan that are still pending or being worked on
+
+        Claims abandoned max_attempts times are marked failed here.
+        """
+        session = self.session_factory()
+        stale = datetime.now() - timedelta(seconds=self.claim_timeout)
+        failed = session.execute(
+            update(ScanTask)
+            .where(ScanTask.scan_id == scan_id, ScanTask.status == ScanTask.CLAIMED,
+                   ScanTask.heartbeat_at < stale, ScanTask.attempts >= self.max_attempts)
+            .values(status=ScanTask.FAILED, finished_at=datetime.now())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if failed:
+            logger.warning(f"Gave up on {failed} tasks of scan {scan_id} after {self.max_attempts} attempts")
+        count = session.execute(
+            select(func.count())
+            .select_from(ScanTask)
+            .where(ScanTask.scan_id == scan_id, ScanTask.status.in_((ScanTask.PENDING, ScanTask.CLAIMED)))
+        ).scalar()
+        session.commit()
+        return count
+
+    def failed_hosts(self, scan_id):
+        """Number of hosts in tasks of a scan that were given up on"""
+        session = self.session_factory()
+        return session.execute(
+            select(func.coalesce(func.sum(ScanTask.size), 0))
+            .where(ScanTask.scan_id == scan_id, ScanTask.status == ScanTask.FAILED)
+        ).scalar()
+
+    def results(self, scan_id, batch_size=1000):
+        """Yield the stored results of a scan as result dicts"""
+        session = self.session_factory()
+        rows = session.execute(
+            select(ScanResult)
+            .where(ScanResult.scan_id == scan_id)
+            .order_by(ScanResult.id)
+            .execution_options(yield_per=batch_size)
+        ).scalars()
+        for row in rows:
+            result = row.to_dict()
+            result['domain'] = result.pop('subdomain')
+            result['checked_at'] = row.timestamp
+            yield result
+
+    def clear(self, scan_id):
+        """Delete the tasks of a finished scan"""
+        session = self.session_factory()
+        session.execute(delete(ScanTask).where(ScanTask.scan_id == scan_id))
+        session.commit()
+
+
+def _backoff(errors):
+    """Seconds to wait after errors failures in a row"""
+    return min(MAX_ERROR_BACKOFF, IDLE_POLL_INTERVAL * 2 ** errors)
+
+
+def task_answers(task):
+    """The DnsAnswers of the hosts in a task"""
+    return [DnsAnswer(host, status, addresses=addresses) for host, status, addresses in json.loads(task.payload)]
+
+
+class ScanWorker:
+    """Claims tasks from a WorkQueue, probes their hosts with a SubdomainScanner and saves the results
+
+    Any number of workers, in any number of processes and machines, can
+    share one queue. While a task is being probed a background thread sends
+    heartbeats every heartbeat_interval seconds; a worker that dies stops
+    sending them, and its task is taken over by another worker. Extra
+    keyword arguments are passed to SubdomainScanner.
+    """
+
+    def __init__(self, queue, worker_id=None, heartbeat_interval=None, scanner=None, **scanner_options):
+        self.queue = queue
+        self.worker_id = worker_id or worker_name()
+        self.heartbeat_interval = heartbeat_interval or DEFAULT_HEARTBEAT_INTERVAL
+        self.scanner = scanner if scanner is not None else SubdomainScanner(**scanner_options)
+        self.tasks_done = 0
+        self.hosts_done = 0
+
+    def work_once(self):
+        """Claim and process one task, returning False when there was nothing to do"""
+        task = self.queue.claim(self.worker_id)
+        if task is None:
+            return False
+        logger.debug(f"Worker {self.worker_id} claimed task {task.id} ({task.size} hosts of {task.domain})")
+        stop = threading.Event()
+        beat = threading.Thread(target=self._heartbeat, args=(task.id, stop), name='scan-heartbeat', daemon=True)
+        beat.start()
+        try:
+            results = self.scanner.check_answers(task.domain, task_answers(task))
+        finally:
+            stop.set()
+            beat.join()
+        if self.queue.complete(task, self.worker_id, results):
+            self.tasks_done += 1
+            self.hosts_done += len(results)
+        else:
+            logger.warning(f"Task {task.id} was taken over by another worker, dropped its results")
+        return True
+
+    def try_work_once(self):
+        """work_once(), but logging errors instead of raising them and returning None after one
+
+        The session is rolled back. A task claimed before the error is left
+        for its claim to expire, so another worker (or this one) takes it over.
+        """
+        try:
+            return self.work_once()
+        except Exception:
+            logger.exception(f"Worker {self.worker_id} failed, backing off")
+            self._rollback()
+            return None
+
+    def run(self, stop=None, idle_timeout=None):
+        """Process tasks until stop is set, or until the queue has been empty for idle_timeout seconds
+
+        Errors don't end the loop: after each one the session is discarded
+        and the worker waits, longer after every further error in a row,
+        before polling again.
+        """
+        logger.info(f"Worker {self.worker_id} started")
+        idle_since = None
+        errors = 0
+        while stop is None or not stop.is_set():
+            worked = self.try_work_once()
+            if worked is None:
+                errors += 1
+                self.queue.session_factory.remove()
+                self._sleep(stop, _backoff(errors))
+                continue
+            errors = 0
+            if worked:
+                idle_since = None
+                continue
+            idle_since = idle_since or time.monotonic()
+            if idle_timeout is not None and time.monotonic() - idle_since >= idle_timeout:
+                break
+            self._sleep(stop, IDLE_POLL_INTERVAL)
+        logger.info(f"Worker {self.worker_id} stopped after {self.tasks_done} tasks, {self.hosts_done} hosts")
+
+    def work_until_done(self, scan_id, max_errors=MAX_CONSECUTIVE_ERRORS):
+        """Work on the queue until no task of scan_id is left, as the scan's coordinating process does
+
+        Errors are logged and retried after growing pauses; only after
+        max_errors of them in a row is the last one raised.
+        """
+        errors = 0
+        while True:
+            try:
+                if not self.queue.remaining(scan_id):
+                    return
+                worked = self.work_once()
+            except Exception:
+                errors += 1
+                if errors >= max_errors:
+                    raise
+                logger.exception(f"Error working on the tasks of scan {scan_id}, backing off")
+                self._rollback()
+                time.sleep(_backoff(errors))
+                continue
+            errors = 0
+            if not worked:
+                time.sleep(IDLE_POLL_INTERVAL)
+
+    def _rollback(self):
+        try:
+            self.queue.session_factory().rollback()
+        except Exception as e:
+            logger.debug(f"Rollback after the error failed too: {e}")
+
+    @staticmethod
+    def _sleep(stop, seconds):
+        if stop is not None:
+            stop.wait(seconds)
+        else:
+            time.sleep(seconds)
+
+    def _heartbeat(self, task_id, stop):
+        try:
+            while not stop.wait(self.heartbeat_interval):
+                if not self.queue.heartbeat(task_id, self.worker_id):
+                    logger.warning(f"Lost the claim on task {task_id}")
+                    return
+        finally:
+            self.queue.session_factory.remove()